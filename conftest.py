@@ -0,0 +1,27 @@
+import pytest
+
+from rutx11_manager import RUTX11Manager
+from rutx11_mock_server import start_server
+
+
+@pytest.fixture
+def server():
+    server, _ = start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def manager(server):
+    port = server.server_address[1]
+    manager = RUTX11Manager(
+        "admin",
+        "admin",
+        device_ip=f"127.0.0.1:{port}",
+        token_cache=False,
+        journal_dir=False,
+        internet_check_target=("127.0.0.1", port),
+    )
+    yield manager
+    manager.close()
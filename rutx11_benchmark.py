@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import argparse
+import click
+import contextlib
+import io
+import json
+import requests
+import time
+
+from rutx11_manager import RUTX11Manager
+from rutx11_mock_server import start_server
+
+
+def _operations(manager: RUTX11Manager) -> list:
+    return [
+        ("factory_reset", lambda: manager.factory_reset("PTH", "0001")),
+        ("factory_reset (no-op)", lambda: manager.factory_reset("PTH", "0001")),
+        ("add_wifi_network", lambda: manager.add_wifi_network("Warehouse", "password")),
+        ("remove_wifi_network", lambda: manager.remove_wifi_network("Warehouse")),
+        (
+            "add_static_lease",
+            lambda: manager.add_static_lease("10.15.20.10", "AA:BB:CC:DD:EE:FF", "lidar"),
+        ),
+    ]
+
+
+def run_benchmark(latency: float = 0.0, failure_rate: float = 0.0, verbose: bool = False) -> dict:
+    server, _ = start_server(latency=latency, failure_rate=failure_rate)
+    device_ip = f"127.0.0.1:{server.server_address[1]}"
+    stats_url = f"https://{device_ip}/mock"
+    # Connection used for statistics is opened once, before the first reset
+    stats_session = requests.Session()
+
+    # Output of the manager would distort timing and the results table
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    results = {}
+    try:
+        # Injected failures make operations fail, the requests they made are still counted.
+        # Without a login none of them runs.
+        manager = None
+        login_error = None
+        try:
+            with output:
+                manager = RUTX11Manager(
+                    "admin", "admin", device_ip=device_ip, token_cache=False, journal_dir=False
+                )
+        except Exception as e:
+            login_error = f"Login failed: {e}"
+
+        for name, operation in _operations(manager):
+            stats_session.post(stats_url + "/reset", verify=False)
+            start_time = time.perf_counter()
+            error = login_error
+            if error is None:
+                try:
+                    with output:
+                        operation()
+                except Exception as e:
+                    error = str(e)
+            wall_time = time.perf_counter() - start_time
+
+            results[name] = stats_session.get(stats_url + "/stats", verify=False).json()
+            results[name]["wall_time"] = round(wall_time, 4)
+            results[name]["error"] = error
+
+        if manager is not None:
+            manager.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return results
+
+
+def print_results(results: dict) -> None:
+    print(
+        f"{'Operation':<24} {'Requests':>8} {'Writes':>6} {'Handshakes':>10} "
+        f"{'Bytes out':>10} {'Bytes in':>10} {'Time [s]':>9}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<24} {result['requests']:>8} {result['writes']:>6} "
+            f"{result['handshakes']:>10} {result['bytes_received']:>10} "
+            f"{result['bytes_sent']:>10} {result['wall_time']:>9.3f}"
+        )
+
+    for name, result in results.items():
+        if result["error"] is not None:
+            click.secho(f"{name} failed: {result['error']}", fg="red")
+
+
+def compare_with_baseline(results: dict, baseline: dict) -> list[str]:
+    # Timing is too noisy to gate on in CI, counters are deterministic
+    regressions = []
+    for name, result in results.items():
+        # Counters of a failed operation are not comparable, the failure itself is a regression
+        if result.get("error") is not None:
+            regressions.append(f"{name}: failed: {result['error']}")
+            continue
+
+        for counter in ["requests", "writes", "handshakes"]:
+            expected = baseline.get(name, {}).get(counter)
+            if expected is not None and result[counter] > expected:
+                regressions.append(f"{name}: {counter} {expected} -> {result[counter]}")
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="RUTX11 Manager benchmark against a mock router")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Delay added to each request in seconds"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="Fraction of requests failing with 503"
+    )
+    parser.add_argument("--json", type=str, help="Save results as JSON to the given file")
+    parser.add_argument(
+        "--baseline", type=str, help="Fail if request counts exceed the ones in this JSON file"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show manager output")
+    parsed_args = parser.parse_args(args)
+
+    results = run_benchmark(parsed_args.latency, parsed_args.failure_rate, parsed_args.verbose)
+    print_results(results)
+
+    if parsed_args.json:
+        with open(parsed_args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if parsed_args.baseline:
+        with open(parsed_args.baseline) as file:
+            regressions = compare_with_baseline(results, json.load(file))
+
+        if regressions:
+            click.secho("Performance regressions:\n" + "\n".join(regressions), fg="red")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import click
+import getpass
+import json
+import math
+import os
+import time
+
+from collections import Counter
+
+from rutx11_fleet import AsyncRUTX11Manager, load_inventory
+from rutx11_manager import DEFAULT_CACHE_DIR, RUTX11HTTPCommands
+
+CHANNELS_2G = [1, 6, 11]
+# 5 GHz channels allowed in Poland, the ones after 48 require radar detection (DFS) and the
+# router may have to leave them at any time
+CHANNELS_5G = [36, 40, 44, 48]
+CHANNELS_5G_DFS = [52, 56, 60, 64, 100, 104, 108, 112, 116, 120, 124, 128, 132, 136, 140]
+WIDTHS_5G = [80, 40, 20]
+
+
+def _band(channel: int) -> str:
+    return "2g" if channel <= 14 else "5g"
+
+
+def _milliwatts(dbm: float) -> float:
+    return 10 ** (dbm / 10)
+
+
+def _covered(channel: int, width: int = 20) -> set[int]:
+    # 20 MHz channels occupied by a transmission. On 2.4 GHz channels are 5 MHz apart, so a
+    # 20 MHz transmission spreads over two neighbouring channels on each side.
+    if _band(channel) == "2g":
+        return set(range(channel - 2, channel + 3))
+    span = width // 5
+    start = channel - (channel - 36) % span
+    return set(range(start, start + span, 4))
+
+
+def _blocks(channels: list[int], width: int) -> list[list[int]]:
+    # Bonded channels are aligned, e.g. 80 MHz blocks start at 36, 52, 100 and 116
+    span = width // 5
+    blocks = []
+    for channel in channels:
+        block = list(range(channel, channel + span, 4))
+        if (channel - 36) % span == 0 and all(member in channels for member in block):
+            blocks.append(block)
+    return blocks
+
+
+def _width(htmode: str | None) -> int:
+    digits = "".join(char for char in str(htmode or "") if char.isdigit())
+    return int(digits) if digits else 20
+
+
+def build_interference_map(surveys: dict[str, dict], threshold: float = -85.0) -> dict:
+    # For every router and band: routers of the fleet heard at least at threshold with the
+    # strongest signal in either direction, and foreign networks as (channel, signal)
+    owners = {ssid: host for host, survey in surveys.items() for ssid in survey["ssids"]}
+    interference = {
+        host: {band: {"fleet": {}, "foreign": []} for band in ["2g", "5g"]} for host in surveys
+    }
+
+    for host, survey in surveys.items():
+        for network in survey["scan"]:
+            channel = int(network["channel"])
+            signal = float(network["signal"])
+            band = _band(channel)
+            owner = owners.get(network.get("ssid"))
+            if owner == host:
+                continue
+
+            if owner is None:
+                interference[host][band]["foreign"].append((channel, signal))
+            elif signal >= threshold:
+                for first, second in [(host, owner), (owner, host)]:
+                    fleet = interference[first][band]["fleet"]
+                    fleet[second] = max(fleet.get(second, -math.inf), signal)
+
+    return interference
+
+
+def channel_metrics(surveys: dict[str, dict]) -> dict:
+    # Networks heard by each radio on channels overlapping the one it operates on
+    owners = {ssid: host for host, survey in surveys.items() for ssid in survey["ssids"]}
+    metrics = {}
+    for host, survey in surveys.items():
+        metrics[host] = {}
+        for radio, channel in survey["channels"].items():
+            covered = _covered(channel, survey["widths"].get(radio, 20))
+            fleet = 0
+            foreign = 0
+            power = 0.0
+            for network in survey["scan"]:
+                owner = owners.get(network.get("ssid"))
+                if owner == host or not covered & _covered(int(network["channel"])):
+                    continue
+                if owner is None:
+                    foreign += 1
+                else:
+                    fleet += 1
+                power += _milliwatts(float(network["signal"]))
+
+            metrics[host][radio] = {
+                "channel": channel,
+                "width": survey["widths"].get(radio, 20),
+                "co_channel_fleet": fleet,
+                "co_channel_foreign": foreign,
+                "interference_dbm": round(10 * math.log10(power), 1) if power else None,
+            }
+
+    return metrics
+
+
+def _assign(
+    hosts: list[str], band_map: dict[str, dict], candidates: list[list[int]], width: int
+) -> tuple[dict[str, int], int]:
+    # Greedy colouring: routers with the most neighbours choose first, each takes the block
+    # with the least interference from already assigned neighbours and foreign networks, and
+    # among equal ones the block used by the fewest routers so far. Returns the primary
+    # channel of every router and the number of neighbouring pairs left overlapping.
+    covered = {block[0]: _covered(block[0], width) for block in candidates}
+    assignment = {}
+    usage = Counter()
+
+    def cost(host: str, channel: int) -> float:
+        total = 0.0
+        for neighbour, signal in band_map[host]["fleet"].items():
+            if neighbour in assignment and covered[channel] & covered[assignment[neighbour]]:
+                total += _milliwatts(signal)
+        for foreign_channel, signal in band_map[host]["foreign"]:
+            if covered[channel] & _covered(foreign_channel):
+                total += _milliwatts(signal)
+        return total
+
+    for host in sorted(hosts, key=lambda host: (-len(band_map[host]["fleet"]), host)):
+        best = min(covered, key=lambda channel: (cost(host, channel), usage[channel]))
+        assignment[host] = best
+        usage[best] += 1
+
+    conflicts = sum(
+        1
+        for host in hosts
+        for neighbour in band_map[host]["fleet"]
+        if host < neighbour and covered[assignment[host]] & covered[assignment[neighbour]]
+    )
+    return assignment, conflicts
+
+
+def plan_channels(
+    surveys: dict[str, dict], allow_dfs: bool = False, threshold: float = -85.0
+) -> dict[str, dict[str, dict]]:
+    # Returns channel and htmode of every radio. 2.4 GHz radios use the non-overlapping
+    # channels 1, 6 and 11 at 20 MHz. 5 GHz radios use the widest channels with which no two
+    # routers hearing each other overlap, down to 20 MHz.
+    interference = build_interference_map(surveys, threshold)
+    hosts = sorted(surveys)
+    plan = {host: {} for host in hosts}
+
+    band_map = {host: interference[host]["2g"] for host in hosts}
+    assignment, _ = _assign(hosts, band_map, [[channel] for channel in CHANNELS_2G], 20)
+    for host in hosts:
+        for radio in _radios(surveys[host], "2g"):
+            plan[host][radio] = {"channel": str(assignment[host]), "htmode": "HT20"}
+
+    channels = CHANNELS_5G + (CHANNELS_5G_DFS if allow_dfs else [])
+    band_map = {host: interference[host]["5g"] for host in hosts}
+    for width in WIDTHS_5G:
+        assignment, conflicts = _assign(hosts, band_map, _blocks(channels, width), width)
+        if not conflicts:
+            break
+    for host in hosts:
+        for radio in _radios(surveys[host], "5g"):
+            plan[host][radio] = {"channel": str(assignment[host]), "htmode": f"VHT{width}"}
+
+    return plan
+
+
+def _radios(survey: dict, band: str) -> list[str]:
+    return [radio for radio, radio_band in survey["radios"].items() if radio_band == band]
+
+
+async def survey_router(manager: AsyncRUTX11Manager) -> dict:
+    devices = await manager.get_config(RUTX11HTTPCommands.WIRELESS_DEVICES)
+    interfaces = await manager.get_config(RUTX11HTTPCommands.WIRELESS_INTERFACES)
+    scan, status = await manager.scan_wireless()
+
+    # A radio connected to a WiFi uplink has to stay on the channel of the uplink
+    client_radios = {
+        iface.get("device")
+        for iface in status
+        if iface.get("mode") in ["multi_ap", "sta"] and iface.get("up")
+    }
+
+    return {
+        # Radios without a band field are assumed to follow the RUTX11 layout
+        "radios": {
+            device["id"]: device.get("band") or ("2g" if device["id"] == "radio0" else "5g")
+            for device in devices
+            if device["id"] not in client_radios
+        },
+        "widths": {device["id"]: _width(device.get("htmode")) for device in devices},
+        "ssids": [
+            iface["ssid"] for iface in interfaces if iface.get("mode") == "ap" and iface.get("ssid")
+        ],
+        "channels": {
+            iface["device"]: int(iface["channel"])
+            for iface in status
+            if iface.get("mode") == "ap" and str(iface.get("channel", "")).isdigit()
+        },
+        "scan": scan,
+    }
+
+
+async def run_survey(
+    hosts: list[dict],
+    params: dict,
+    max_hosts: int,
+    timeout: float,
+    allow_dfs: bool = False,
+    threshold: float = -85.0,
+    settle_time: float = 20.0,
+    dry_run: bool = False,
+) -> dict:
+    host_limit = asyncio.Semaphore(max_hosts)
+    managers = {}
+    errors = {}
+
+    async def limited(host: dict, coroutine) -> None:
+        async with host_limit:
+            try:
+                return await coroutine
+            except Exception as err:
+                errors[host["device_ip"]] = str(err)
+
+    async def connect(host: dict) -> None:
+        managers[host["device_ip"]] = await AsyncRUTX11Manager.create(
+            username=host.get("username") or params["username"],
+            password=host.get("password") or params["password"],
+            device_ip=host["device_ip"],
+            timeout=timeout,
+        )
+
+    async def survey_all() -> dict[str, dict]:
+        device_ips = [ip for ip in managers if ip not in errors]
+        surveys = await asyncio.gather(
+            *[limited({"device_ip": ip}, survey_router(managers[ip])) for ip in device_ips]
+        )
+        return {ip: survey for ip, survey in zip(device_ips, surveys) if survey is not None}
+
+    report = {"time": time.time(), "errors": errors}
+    try:
+        await asyncio.gather(*[limited(host, connect(host)) for host in hosts])
+
+        surveys = await survey_all()
+        report["before"] = channel_metrics(surveys)
+        report["interference"] = {
+            host: {
+                band: {"fleet": data["fleet"], "foreign": len(data["foreign"])}
+                for band, data in bands.items()
+            }
+            for host, bands in build_interference_map(surveys, threshold).items()
+        }
+        report["plan"] = plan_channels(surveys, allow_dfs, threshold)
+
+        if dry_run:
+            return report
+
+        await asyncio.gather(
+            *[
+                limited({"device_ip": ip}, managers[ip].set_wireless_channels(channels))
+                for ip, channels in report["plan"].items()
+            ]
+        )
+
+        # Radios restart on the new channels and neighbours show up in scans again
+        print(f"Waiting {settle_time:.0f} s for the radios to settle")
+        await asyncio.sleep(settle_time)
+        report["after"] = channel_metrics(await survey_all())
+    finally:
+        await asyncio.gather(*[manager.close() for manager in managers.values()])
+
+    return report
+
+
+def print_report(report: dict) -> None:
+    after = report.get("after", {})
+    print(
+        f"\n{'Device IP':<22} {'Radio':<7} {'Channel':>13} {'Fleet co-ch.':>13} "
+        f"{'Foreign co-ch.':>15} {'Interf. [dBm]':>15}"
+    )
+    for host, radios in report["before"].items():
+        for radio, before in radios.items():
+            new = after.get(host, {}).get(radio, {})
+            planned = report["plan"].get(host, {}).get(radio, {})
+
+            def change(key: str, value=None) -> str:
+                value = new.get(key) if value is None else value
+                return f"{before[key]} -> {value if value is not None else '-'}"
+
+            print(
+                f"{host:<22} {radio:<7} {change('channel', planned.get('channel')):>13} "
+                f"{change('co_channel_fleet'):>13} {change('co_channel_foreign'):>15} "
+                f"{change('interference_dbm'):>15}"
+            )
+
+    for host, error in report["errors"].items():
+        click.secho(f"{host}: {error}", fg="red")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="RUTX11 fleet WiFi channel planner")
+    parser.add_argument("inventory", type=str, help="Inventory file (CSV, JSON or YAML)")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Print the channel plan without applying it"
+    )
+    parser.add_argument(
+        "--allow-dfs",
+        action="store_true",
+        help="Use 5 GHz channels requiring radar detection (52-140)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=-85.0,
+        help="Signal in dBm above which two routers are considered to interfere",
+    )
+    parser.add_argument(
+        "--settle-time",
+        type=float,
+        default=20.0,
+        help="Time in seconds between applying the plan and scanning again",
+    )
+    parser.add_argument(
+        "--max-hosts", type=int, default=16, help="Maximum number of routers handled at once"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=10.0, help="Timeout of a single request in seconds"
+    )
+    parser.add_argument("--report", type=str, help="Save the report as JSON to the given file")
+    parsed_args = parser.parse_args(args)
+
+    try:
+        hosts = load_inventory(parsed_args.inventory)
+    except Exception as err:
+        click.secho(f"Failed to load inventory: {err}", fg="red")
+        return 1
+
+    params = {"username": "", "password": ""}
+    if any(not host.get("username") or not host.get("password") for host in hosts):
+        params["username"] = input("Enter the username: ")
+        params["password"] = getpass.getpass("Enter the password: ")
+
+    report = asyncio.run(
+        run_survey(
+            hosts,
+            params,
+            parsed_args.max_hosts,
+            parsed_args.timeout,
+            allow_dfs=parsed_args.allow_dfs,
+            threshold=parsed_args.threshold,
+            settle_time=parsed_args.settle_time,
+            dry_run=parsed_args.dry_run,
+        )
+    )
+    print_report(report)
+
+    # Every survey is kept, so interference of a site can be compared over time
+    surveys_dir = os.path.join(DEFAULT_CACHE_DIR, "surveys")
+    os.makedirs(surveys_dir, mode=0o700, exist_ok=True)
+    paths = [os.path.join(surveys_dir, f"{int(report['time'])}.json")]
+    if parsed_args.report:
+        paths.append(parsed_args.report)
+    for path in paths:
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+
+    return 0 if not report["errors"] else 1
+
+
+if __name__ == "__main__":
+    exit(main())
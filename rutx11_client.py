@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+# Only the standard library is imported, so that a call costs milliseconds
+DEFAULT_SOCKET_PATH = os.path.join(
+    # Without a runtime directory the socket is kept in a directory of the user, created by
+    # the daemon with access only for the owner
+    os.environ.get("XDG_RUNTIME_DIR") or f"/tmp/rutx11_manager-{os.getuid()}",
+    "rutx11_manager.sock",
+)
+
+
+class RUTX11RPCError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+class RUTX11Client:
+    # Client of the JSON-RPC 2.0 API served by rutx11_daemon.py. Requests and responses are
+    # single lines of JSON and the connection is kept open between calls.
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, timeout: float = 60.0) -> None:
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._file = self._socket.makefile("rb")
+        self._next_id = 1
+
+    def __enter__(self) -> "RUTX11Client":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def call(self, method: str, **params):
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+        self._next_id += 1
+        self._socket.sendall(json.dumps(request).encode() + b"\n")
+
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Daemon closed the connection")
+
+        response = json.loads(line)
+        if "error" in response:
+            raise RUTX11RPCError(response["error"]["code"], response["error"]["message"])
+
+        return response["result"]
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+
+def _parse_param(param: str) -> tuple[str, object]:
+    # Values are JSON when possible, e.g. sync=true or entries=[...], plain strings otherwise
+    name, separator, value = param.partition("=")
+    if not separator:
+        raise ValueError(f"Parameter must be in NAME=VALUE format: {param}")
+
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Client of the RUTX11 Manager daemon")
+    parser.add_argument("method", type=str, help="Method to call, e.g. get_status")
+    parser.add_argument("params", nargs="*", help="Parameters of the method as NAME=VALUE")
+    parser.add_argument(
+        "--socket", type=str, default=DEFAULT_SOCKET_PATH, help="Unix socket of the daemon"
+    )
+    parsed_args = parser.parse_args(args)
+
+    try:
+        params = dict(_parse_param(param) for param in parsed_args.params)
+        with RUTX11Client(parsed_args.socket) as client:
+            result = client.call(parsed_args.method, **params)
+    except (OSError, ValueError, RUTX11RPCError) as err:
+        print(f"Failure: {err}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+import argparse
+import click
+import getpass
+import inspect
+import json
+import os
+import re
+import socket
+import socketserver
+import stat
+import threading
+
+from rutx11_client import DEFAULT_SOCKET_PATH
+from rutx11_manager import RUTX11HTTPCommands, RUTX11Manager, TokenCache
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class RUTX11Daemon:
+    # Keeps one logged in RUTX11Manager with its connection pool and configuration cache, and
+    # dispatches JSON-RPC calls to it. Reads run concurrently, writes are serialized, so that
+    # two clients changing the same collection never interleave their read-modify-write.
+    WRITE_METHODS = [
+        "add_wifi_network",
+        "remove_wifi_network",
+        "add_static_lease",
+        "import_static_leases",
+        "tune_mtu",
+    ]
+    READ_METHODS = [
+        "get_status",
+        "get_config",
+        "check_internet_connection",
+        "invalidate_cache",
+    ]
+    # Methods that take objects JSON can not carry are limited to their scalar params
+    ALLOWED_PARAMS = {"tune_mtu": ["uplinks", "force", "timeout"]}
+    # Endpoints get_config reads, with single objects of their collections. Login and actions
+    # are not configuration and are never forwarded.
+    ALLOWED_COMMANDS = [
+        value
+        for name, value in vars(RUTX11HTTPCommands).items()
+        if not name.startswith("_")
+        and value != RUTX11HTTPCommands.LOGIN
+        and "/actions/" not in value
+    ]
+
+    def __init__(self, manager: RUTX11Manager) -> None:
+        self._manager = manager
+        self._write_lock = threading.Lock()
+
+    def handle(self, request) -> dict | None:
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return self.error(None, INVALID_REQUEST, "Invalid request")
+
+        id = request.get("id")
+        method = request["method"]
+        params = request.get("params") or {}
+
+        if method not in self.WRITE_METHODS + self.READ_METHODS:
+            return self.error(id, METHOD_NOT_FOUND, f"Method not found: {method}")
+        if not isinstance(params, (dict, list)):
+            return self.error(id, INVALID_PARAMS, "Params must be an object or an array")
+
+        function = getattr(self._manager, method)
+        args, kwargs = (params, {}) if isinstance(params, list) else ([], params)
+        try:
+            bound = inspect.signature(function).bind(*args, **kwargs)
+        except TypeError as err:
+            return self.error(id, INVALID_PARAMS, str(err))
+        allowed = self.ALLOWED_PARAMS.get(method)
+        if allowed is not None:
+            rejected = [param for param in bound.arguments if param not in allowed]
+            if rejected:
+                return self.error(id, INVALID_PARAMS, f"Params not allowed: {', '.join(rejected)}")
+        if method == "get_config" and not self._allowed_command(bound.arguments["command"]):
+            return self.error(id, INVALID_PARAMS, "Command is not a configuration endpoint")
+
+        try:
+            if method in self.WRITE_METHODS:
+                with self._write_lock:
+                    result = function(*args, **kwargs)
+            else:
+                result = function(*args, **kwargs)
+        except Exception as err:
+            return self.error(id, SERVER_ERROR, str(err))
+
+        # Requests without an id are notifications and get no response
+        if id is None:
+            return None
+        return {"jsonrpc": "2.0", "id": id, "result": result}
+
+    def _allowed_command(self, command) -> bool:
+        if not isinstance(command, str):
+            return False
+        endpoint, _, object_id = command.rpartition("/")
+        return command in self.ALLOWED_COMMANDS or (
+            endpoint in self.ALLOWED_COMMANDS and re.fullmatch(r"[\w-]+", object_id) is not None
+        )
+
+    def error(self, id, code: int, message: str) -> dict:
+        return {"jsonrpc": "2.0", "id": id, "error": {"code": code, "message": message}}
+
+
+class _RPCHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        # One request per line, a client may send any number of them over one connection
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = self.server.rpc.error(None, PARSE_ERROR, "Parse error")
+            else:
+                response = self.server.rpc.handle(request)
+
+            if response is not None:
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class RUTX11DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: RUTX11Daemon) -> None:
+        self.rpc = daemon
+        # Others must not be able to replace the socket, so its directory may be writable only
+        # by the owner
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.stat(directory)
+        if info.st_uid != os.getuid() or info.st_mode & 0o022:
+            raise Exception(f"{directory} must be owned by the user and writable only by them")
+
+        # A socket left by a daemon that was killed would make bind() fail. A socket another
+        # daemon is listening on is kept.
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise Exception(f"{path} exists and is not a socket")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(path)
+                except ConnectionRefusedError:
+                    os.unlink(path)
+                else:
+                    raise Exception(f"Another daemon is listening on {path}")
+        super().__init__(path, _RPCHandler)
+        # Only the owner and its group may change the router configuration
+        os.chmod(path, 0o660)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="RUTX11 Manager daemon")
+    parser.add_argument(
+        "-i", "--device-ip", type=str, default="10.15.20.1", help="Device IP address"
+    )
+    parser.add_argument(
+        "-u", "--username", type=str, default="admin", help="Username of the router"
+    )
+    parser.add_argument(
+        "--socket", type=str, default=DEFAULT_SOCKET_PATH, help="Unix socket to listen on"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent requests to the router",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=30.0,
+        help="Time in seconds configuration read from the router is reused",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=10.0, help="Timeout of a single request in seconds"
+    )
+    parsed_args = parser.parse_args(args)
+
+    # The daemon usually runs as a service, so the password can be passed in the environment
+    password = os.environ.get("RUTX11_PASSWORD") or getpass.getpass("Enter the password: ")
+
+    try:
+        manager = RUTX11Manager(
+            username=parsed_args.username,
+            password=password,
+            device_ip=parsed_args.device_ip,
+            pool_size=parsed_args.concurrency,
+            timeout=parsed_args.timeout,
+            token_cache=TokenCache(),
+            cache_ttl=parsed_args.cache_ttl,
+        )
+    except Exception as err:
+        click.secho(f"Failed to create RUTX11Manager: {err}", fg="red")
+        return 1
+
+    try:
+        server = RUTX11DaemonServer(parsed_args.socket, RUTX11Daemon(manager))
+    except Exception as err:
+        click.secho(f"Failed to listen on {parsed_args.socket}: {err}", fg="red")
+        manager.close()
+        return 1
+    print(f"Listening on {parsed_args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(parsed_args.socket)
+        manager.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
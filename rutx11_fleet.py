@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import click
+import getpass
+import json
+import time
+
+from rutx11_manager import ChannelPlanStore, RUTX11Manager, load_records
+
+
+class AsyncRUTX11Manager:
+    # RUTX11Manager operations are blocking HTTP calls, they are run in worker threads so that
+    # many routers can be handled by one event loop.
+    def __init__(self, manager: RUTX11Manager) -> None:
+        self._manager = manager
+
+    @classmethod
+    async def create(
+        cls,
+        username: str,
+        password: str,
+        device_ip: str = "10.15.20.1",
+        pool_size: int = 4,
+        timeout: float = 10.0,
+    ) -> "AsyncRUTX11Manager":
+        manager = await asyncio.to_thread(
+            RUTX11Manager,
+            username=username,
+            password=password,
+            device_ip=device_ip,
+            pool_size=pool_size,
+            timeout=timeout,
+            channel_plans=ChannelPlanStore(),
+        )
+        return cls(manager)
+
+    async def factory_reset(self, robot_model: str, robot_serial_number: str, **kwargs) -> None:
+        await asyncio.to_thread(
+            self._manager.factory_reset, robot_model, robot_serial_number, **kwargs
+        )
+
+    async def check_drift(
+        self, robot_model: str, robot_serial_number: str, **kwargs
+    ) -> list[dict]:
+        return await asyncio.to_thread(
+            self._manager.check_drift, robot_model, robot_serial_number, **kwargs
+        )
+
+    async def reboot(self) -> bool:
+        return await asyncio.to_thread(self._manager.reboot)
+
+    async def wait_until_ready(self, timeout: float = 90.0) -> None:
+        await asyncio.to_thread(self._manager.wait_until_ready, timeout)
+
+    @property
+    def reboot_required(self) -> bool:
+        return self._manager.reboot_required
+
+    async def add_wifi_network(self, ssid: str, password: str) -> None:
+        await asyncio.to_thread(self._manager.add_wifi_network, ssid, password)
+
+    async def remove_wifi_network(self, ssid: str) -> None:
+        await asyncio.to_thread(self._manager.remove_wifi_network, ssid)
+
+    async def add_static_lease(self, ip: str, mac: str, name: str) -> None:
+        await asyncio.to_thread(self._manager.add_static_lease, ip, mac, name)
+
+    async def get_config(self, command: str) -> dict | list:
+        return await asyncio.to_thread(self._manager.get_config, command)
+
+    async def scan_wireless(self) -> tuple[list[dict], list[dict]]:
+        return await asyncio.to_thread(self._manager.scan_wireless)
+
+    async def set_wireless_channels(self, channels: dict[str, dict]) -> None:
+        await asyncio.to_thread(self._manager.set_wireless_channels, channels)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._manager.close)
+
+
+class FleetResult:
+    def __init__(self, device_ip: str, action: str) -> None:
+        self.device_ip = device_ip
+        self.action = action
+        self.success = False
+        self.error = ""
+        self.duration = 0.0
+        # Endpoints differing from the golden snapshot, found by check-drift
+        self.drift = []
+
+    def to_dict(self) -> dict:
+        return {
+            "device_ip": self.device_ip,
+            "action": self.action,
+            "success": self.success,
+            "error": self.error,
+            "duration": round(self.duration, 3),
+            "drift": self.drift,
+        }
+
+
+def load_inventory(path: str) -> list[dict]:
+    # Each entry holds device_ip and optionally username, password, robot_model and
+    # robot_serial_number.
+    hosts = load_records(path)
+
+    for host in hosts:
+        if not host.get("device_ip"):
+            raise Exception(f"Inventory entry without device_ip: {host}")
+
+    return hosts
+
+
+async def reboot(manager: AsyncRUTX11Manager, timeout: float) -> None:
+    if not await manager.reboot():
+        raise Exception("Failed to reboot the router")
+    await manager.wait_until_ready(timeout)
+
+
+async def run_action(
+    host: dict,
+    action: str,
+    params: dict,
+    host_limit: asyncio.Semaphore,
+    concurrency: int,
+    timeout: float,
+) -> FleetResult:
+    result = FleetResult(host["device_ip"], action)
+
+    async with host_limit:
+        start_time = time.monotonic()
+        manager = None
+        try:
+            manager = await AsyncRUTX11Manager.create(
+                username=host.get("username") or params["username"],
+                password=host.get("password") or params["password"],
+                device_ip=host["device_ip"],
+                pool_size=concurrency,
+                timeout=timeout,
+            )
+
+            if action == "factory-reset":
+                await manager.factory_reset(
+                    host["robot_model"], host["robot_serial_number"], dry_run=params["dry_run"]
+                )
+                if not params["dry_run"] and manager.reboot_required:
+                    await reboot(manager, params["ready_timeout"])
+            elif action == "check-drift":
+                result.drift = await manager.check_drift(
+                    host["robot_model"], host["robot_serial_number"], dry_run=params["dry_run"]
+                )
+                if not params["dry_run"] and manager.reboot_required:
+                    await reboot(manager, params["ready_timeout"])
+            elif action == "add-wifi":
+                await manager.add_wifi_network(params["ssid"], params["wifi_password"])
+            elif action == "remove-wifi":
+                await manager.remove_wifi_network(params["ssid"])
+            elif action == "add-static-lease":
+                await manager.add_static_lease(
+                    params["lease_ip"], params["lease_mac"], params["lease_name"]
+                )
+
+            result.success = True
+        except Exception as err:
+            result.error = str(err)
+        finally:
+            if manager is not None:
+                await manager.close()
+            result.duration = time.monotonic() - start_time
+
+    return result
+
+
+async def run_fleet(
+    hosts: list[dict], action: str, params: dict, max_hosts: int, concurrency: int, timeout: float
+) -> list[FleetResult]:
+    host_limit = asyncio.Semaphore(max_hosts)
+    return await asyncio.gather(
+        *[run_action(host, action, params, host_limit, concurrency, timeout) for host in hosts]
+    )
+
+
+def print_report(results: list[FleetResult]) -> None:
+    print(f"\n{'Device IP':<16} {'Action':<18} {'Status':<8} {'Time [s]':>8}  Error")
+    for result in results:
+        status = "OK" if result.success else "FAILED"
+        print(
+            f"{result.device_ip:<16} {result.action:<18} {status:<8} "
+            f"{result.duration:>8.1f}  {result.error}"
+        )
+
+    if any(result.drift for result in results):
+        print("\nDrift from the golden snapshots")
+    for result in results:
+        for drift in result.drift:
+            state = "restored" if drift["restored"] else "differs"
+            print(f"{result.device_ip:<16} {drift['endpoint']} {state}")
+
+    failed = sum(not result.success for result in results)
+    color = "red" if failed else "green"
+    click.secho(f"\n{len(results) - failed} succeeded, {failed} failed", fg=color)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="RUTX11 fleet manager")
+    parser.add_argument("inventory", type=str, help="Inventory file (CSV, JSON or YAML)")
+    parser.add_argument(
+        "-a",
+        "--action",
+        type=str,
+        required=True,
+        choices=["factory-reset", "check-drift", "add-wifi", "remove-wifi", "add-static-lease"],
+        help="Action performed on every router",
+    )
+    parser.add_argument("--ssid", type=str, help="WiFi SSID for add-wifi and remove-wifi")
+    parser.add_argument("--lease-ip", type=str, help="IP address for add-static-lease")
+    parser.add_argument("--lease-mac", type=str, help="MAC address for add-static-lease")
+    parser.add_argument("--lease-name", type=str, help="Name for add-static-lease")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print changes of factory-reset without applying, report drift without restoring",
+    )
+    parser.add_argument(
+        "--max-hosts", type=int, default=16, help="Maximum number of routers handled at once"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent requests per router",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=10.0, help="Timeout of a single request in seconds"
+    )
+    parser.add_argument(
+        "--ready-timeout",
+        type=float,
+        default=90.0,
+        help="Time in seconds a router is given to come back after a reboot",
+    )
+    parser.add_argument("--report", type=str, help="Save the report as JSON to the given file")
+    parsed_args = parser.parse_args(args)
+
+    try:
+        hosts = load_inventory(parsed_args.inventory)
+    except Exception as err:
+        click.secho(f"Failed to load inventory: {err}", fg="red")
+        return 1
+
+    params = {
+        "username": "",
+        "password": "",
+        "ssid": parsed_args.ssid,
+        "wifi_password": "",
+        "lease_ip": parsed_args.lease_ip,
+        "lease_mac": parsed_args.lease_mac,
+        "lease_name": parsed_args.lease_name,
+        "dry_run": parsed_args.dry_run,
+        "ready_timeout": parsed_args.ready_timeout,
+    }
+
+    # Credentials missing in the inventory are asked for once for the whole fleet
+    if any(not host.get("username") or not host.get("password") for host in hosts):
+        params["username"] = input("Enter the username: ")
+        params["password"] = getpass.getpass("Enter the password: ")
+
+    if parsed_args.action in ["add-wifi", "remove-wifi"] and not parsed_args.ssid:
+        click.secho("--ssid is required for this action", fg="red")
+        return 1
+
+    if parsed_args.action == "add-wifi":
+        params["wifi_password"] = getpass.getpass("Enter the WiFi password: ")
+
+    if parsed_args.action in ["factory-reset", "check-drift"]:
+        for host in hosts:
+            if not host.get("robot_model") or not host.get("robot_serial_number"):
+                click.secho(
+                    f"Inventory entry for {host['device_ip']} requires robot_model and "
+                    "robot_serial_number",
+                    fg="red",
+                )
+                return 1
+
+    results = asyncio.run(
+        run_fleet(
+            hosts,
+            parsed_args.action,
+            params,
+            parsed_args.max_hosts,
+            parsed_args.concurrency,
+            parsed_args.timeout,
+        )
+    )
+
+    print_report(results)
+
+    if parsed_args.report:
+        with open(parsed_args.report, "w") as file:
+            json.dump([result.to_dict() for result in results], file, indent=2)
+
+    return 0 if all(result.success for result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
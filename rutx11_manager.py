@@ -2,12 +2,31 @@
 
 import argparse
 import click
+import csv
+import errno
+import fcntl
 import getpass
+import hashlib
+import hmac
+import ipaddress
 import json
+import math
+import os
+import re
 import requests
-import subprocess
+import socket
+import threading
 import time
 import urllib3
+import zlib
+
+from collections.abc import Callable
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
 
 
 class RUTX11HTTPCommands:
@@ -28,53 +47,1400 @@ class RUTX11HTTPCommands:
     NTP_NTP_CLIENT = "/api/date_time/ntp/client/config/ntpclient"
     RMS_ACTIONS_CONNECT = "/api/rms/actions/connect"
     FIREWALL_ZONES_ID3 = "/api/firewall/zones/config/3"
+    INTERFACES_STATUS = "/api/interfaces/status"
+    WIRELESS_INTERFACES_STATUS = "/api/wireless/interfaces/status"
+    MODEMS_STATUS = "/api/modems/status"
+    FAILOVER_INTERFACES = "/api/failover/interfaces/config"
+    WIRELESS_SCAN_STATUS = "/api/wireless/scan/status"
+    QOS_INTERFACES = "/api/qos/interfaces/config"
+    QOS_CLASSES = "/api/qos/classes/config"
+    QOS_RULES = "/api/qos/rules/config"
+    FAILOVER_INTERFACES_STATUS = "/api/failover/interfaces/status"
+    GPS_POSITION_STATUS = "/api/gps/position/status"
+
+
+# NMEA sentences the router can forward
+NMEA_SENTENCES = [
+    "GPGSV",
+    "GPGGA",
+    "GPVTG",
+    "GPRMC",
+    "GPGSA",
+    "GLGSV",
+    "GNGSA",
+    "GNGNS",
+    "GAGSV",
+    "PQGSV",
+    "PQGSA",
+]
+# Sentences read by rutx11_nmea_receiver.py, satellites in view (GSV) are not needed for a fix
+DEFAULT_NMEA_SENTENCES = ["GPGGA", "GPVTG", "GPRMC", "GPGSA", "GNGSA", "GNGNS"]
+
+
+class WiFiConnectionStage:
+    ASSOCIATING = "associating"
+    ASSOCIATED = "associated"
+    DHCP_LEASE = "DHCP lease obtained on wwan"
+    INTERNET = "internet reachable"
+
+
+class FailoverProfile:
+    # Failover (mwan) settings of the uplinks. Interfaces are listed from the most preferred.
+    # An uplink is considered down after `down` failed health checks sent every `interval`
+    # seconds (`failure_interval` once a check failed). It is used again only after `up`
+    # successful checks sent every `recovery_interval` seconds, so a flapping WiFi does not make
+    # the router switch back and forth.
+    DEFAULT_INTERFACES = ["wwan", "mob1s1a1", "mob1s2a1"]
+    DEFAULT_TRACK_IPS = ["1.1.1.1", "8.8.8.8"]
+
+    def __init__(
+        self,
+        interfaces: list[str] | None = None,
+        track_ips: list[str] | None = None,
+        reliability: int = 1,
+        interval: int = 1,
+        failure_interval: int = 1,
+        recovery_interval: int = 2,
+        timeout: int = 1,
+        down: int = 3,
+        up: int = 10,
+    ) -> None:
+        interfaces = list(interfaces if interfaces is not None else self.DEFAULT_INTERFACES)
+        track_ips = list(track_ips if track_ips is not None else self.DEFAULT_TRACK_IPS)
+        if not interfaces:
+            raise Exception("Failover profile requires at least one interface")
+        if not 1 <= reliability <= len(track_ips):
+            raise Exception("Reliability must be between 1 and the number of tracked IPs")
+        if min(interval, failure_interval, recovery_interval, timeout, down, up) < 1:
+            raise Exception("Failover intervals, timeout and thresholds must be at least 1")
+
+        self.interfaces = interfaces
+        self.track_ips = track_ips
+        self.reliability = reliability
+        self.interval = interval
+        self.failure_interval = failure_interval
+        self.recovery_interval = recovery_interval
+        self.timeout = timeout
+        self.down = down
+        self.up = up
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FailoverProfile":
+        return cls(**data)
+
+    def to_config(self) -> list[dict]:
+        return [
+            {
+                "id": interface,
+                "enabled": "1",
+                "metric": str(priority),
+                "track_ip": self.track_ips,
+                "reliability": str(self.reliability),
+                "interval": str(self.interval),
+                "failure_interval": str(self.failure_interval),
+                "recovery_interval": str(self.recovery_interval),
+                "timeout": str(self.timeout),
+                "down": str(self.down),
+                "up": str(self.up),
+            }
+            for priority, interface in enumerate(self.interfaces, start=1)
+        ]
+
+
+class TrafficClass:
+    # Traffic matching any of the ports, DSCP values or LAN hosts of a class is queued with its
+    # priority (1 is served first) and guaranteed its share of the uplink bandwidth in percent
+    def __init__(
+        self,
+        name: str,
+        priority: int,
+        share: int,
+        ports: list[str] | None = None,
+        proto: str = "all",
+        dscp: list[int] | None = None,
+        hosts: list[str] | None = None,
+    ) -> None:
+        ports = list(ports or [])
+        dscp = list(dscp or [])
+        hosts = list(hosts or [])
+        if not 1 <= share <= 100:
+            raise Exception(f"Bandwidth share of {name} must be between 1 and 100 percent")
+        for value in dscp:
+            if not 0 <= value <= 63:
+                raise Exception(f"Invalid DSCP value {value} in {name}")
+
+        self.name = name
+        self.priority = priority
+        self.share = share
+        self.ports = ports
+        self.proto = proto
+        self.dscp = dscp
+        self.hosts = hosts
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TrafficClass":
+        return cls(**data)
+
+
+DSCP_EF = 46
+DSCP_CS1 = 8
+
+
+def _default_traffic_classes() -> list[TrafficClass]:
+    # ROS 2 (DDS) and SSH traffic is control traffic, as is anything marked Expedited
+    # Forwarding. Traffic marked CS1 is bulk, e.g. rosbag or map uploads, everything else is
+    # best effort. Each profile gets its own classes, so changing one does not change others.
+    return [
+        TrafficClass("control", 1, 30, ports=["22", "7400-7600"], dscp=[DSCP_EF]),
+        TrafficClass("best_effort", 2, 50),
+        TrafficClass("bulk", 3, 20, dscp=[DSCP_CS1]),
+    ]
+
+
+class QoSProfile:
+    # Queueing of uplink traffic. Shaping to slightly below the link rate keeps the queue on
+    # the router, where traffic classes are applied, instead of in the modem or access point.
+    # Link rates differ between sites, so only interfaces given a bandwidth are shaped and QoS
+    # of the other uplinks is disabled.
+    INTERFACES = ["wwan", "mob1s1a1", "mob1s2a1"]
+
+    def __init__(
+        self,
+        classes: list[TrafficClass] | None = None,
+        bandwidth: dict[str, tuple[int, int]] | None = None,
+    ) -> None:
+        classes = classes if classes is not None else _default_traffic_classes()
+        if sum(traffic_class.share for traffic_class in classes) > 100:
+            raise Exception("Bandwidth shares of traffic classes exceed 100 percent")
+        for interface, rates in (bandwidth or {}).items():
+            if min(rates) < 1:
+                raise Exception(f"Bandwidth of {interface} must be at least 1 kbit/s")
+
+        self.classes = classes
+        # Download and upload rate in kbit/s for each shaped interface
+        self.bandwidth = bandwidth or {}
+
+    def to_dict(self) -> dict:
+        return {
+            "classes": [traffic_class.to_dict() for traffic_class in self.classes],
+            "bandwidth": {interface: list(rates) for interface, rates in self.bandwidth.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QoSProfile":
+        return cls(
+            [TrafficClass.from_dict(traffic_class) for traffic_class in data["classes"]],
+            {interface: tuple(rates) for interface, rates in data["bandwidth"].items()},
+        )
+
+    def interfaces_config(self) -> list[dict]:
+        config = []
+        for interface in self.INTERFACES + [
+            interface for interface in self.bandwidth if interface not in self.INTERFACES
+        ]:
+            if interface not in self.bandwidth:
+                config.append({"id": interface, "enabled": "0"})
+                continue
+            download, upload = self.bandwidth[interface]
+            config.append(
+                {
+                    "id": interface,
+                    "enabled": "1",
+                    "download": str(download),
+                    "upload": str(upload),
+                }
+            )
+        return config
+
+    def classes_config(self) -> list[dict]:
+        return [
+            {
+                "name": traffic_class.name,
+                "priority": str(traffic_class.priority),
+                "share": str(traffic_class.share),
+            }
+            for traffic_class in self.classes
+        ]
+
+    def rules_config(self) -> list[dict]:
+        # One rule for each kind of match, the router combines the fields of a rule with AND
+        rules = []
+        for traffic_class in self.classes:
+            matches = [("ports", ",".join(traffic_class.ports))] if traffic_class.ports else []
+            matches += [("dscp", str(value)) for value in traffic_class.dscp]
+            matches += [("srchost", host) for host in traffic_class.hosts]
+            for index, (field, value) in enumerate(matches):
+                rule = {"name": f"{traffic_class.name}_{index}", "target": traffic_class.name}
+                if field == "ports":
+                    rule["proto"] = traffic_class.proto
+                rule[field] = value
+                rules.append(rule)
+        return rules
+
+
+class ConfigSection:
+    # Section kinds:
+    # - UPDATE: fields of an object (or of listed objects matched by id) are updated with PUT,
+    # - CREATE: an object matching `match` has to exist in a collection, it is created with POST,
+    # - CLEAR: a collection has to be empty, except for objects matching one of `keep`.
+    UPDATE = "update"
+    CREATE = "create"
+    CLEAR = "clear"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        endpoint: str,
+        data: dict | list | None = None,
+        kind: str = UPDATE,
+        match: dict | None = None,
+        keep: list[dict] | None = None,
+        prepare: Callable[[], None] | None = None,
+        reapply_after: tuple[str, ...] = (),
+        depends_on: tuple[str, ...] = (),
+        requires_reboot: bool = False,
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.endpoint = endpoint
+        self.data = data
+        self.kind = kind
+        self.match = match or {}
+        self.keep = keep or []
+        # Called before the object is created, e.g. to release resources held by other objects
+        self.prepare = prepare
+        # Sections whose creation removes this one from the router
+        self.reapply_after = reapply_after
+        # Sections that have to be applied before this one
+        self.depends_on = depends_on
+        # Most changes take effect after the router reloads affected services on its own, these
+        # ones only after a reboot
+        self.requires_reboot = requires_reboot
+
+
+class ConfigChange:
+    def __init__(self, section: ConfigSection, method: str, endpoint: str, data: dict) -> None:
+        self.section = section
+        self.method = method
+        self.endpoint = endpoint
+        self.data = data
+        # A change coalesced from several sections holds all of them, and the id of each list
+        # item is mapped to the section it comes from
+        self.sections = [section]
+        self.item_sections = {}
+
+    def __str__(self) -> str:
+        names = ", ".join(section.name for section in self.sections)
+        data = json.dumps(self.data, indent=2)
+        return f"{names}: {self.method} {self.endpoint}\n{data}"
+
+
+def _normalize(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _diff_object(current: dict, desired: dict) -> dict:
+    return {
+        key: value
+        for key, value in desired.items()
+        if _normalize(current.get(key)) != _normalize(value)
+    }
+
+
+def _diff_items(current: list, desired: list) -> list:
+    current_by_id = {item.get("id"): item for item in current}
+
+    changes = []
+    for item in desired:
+        diff = _diff_object(current_by_id.get(item["id"], {}), item)
+        if diff:
+            changes.append({"id": item["id"], **diff})
+
+    return changes
+
+
+def _interface_address(status: dict) -> str | None:
+    # Depending on the firmware version the address is either a plain field or a netifd list
+    if status.get("ipaddr"):
+        return status["ipaddr"]
+
+    for address in status.get("ipv4-address") or []:
+        if address.get("address"):
+            return address["address"]
+
+    return None
+
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "rutx11_manager"
+)
+
+
+class _JSONFile:
+    # JSON object shared between processes through a file readable only by the owner. A lock
+    # file serializes read-modify-write cycles of concurrent processes.
+    def __init__(self, path: str) -> None:
+        self._path = path
+
+    def _read(self) -> dict:
+        try:
+            with open(self._path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data: dict) -> None:
+        tmp_path = self._path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self._path)
+
+    def _lock(self) -> "_FileLock":
+        os.makedirs(os.path.dirname(self._path), mode=0o700, exist_ok=True)
+        return _FileLock(self._path + ".lock")
+
+
+class TokenCache(_JSONFile):
+    # Tokens of all managers are kept in one file. A token is used only by a manager given the
+    # password it was obtained with, compared by a salted hash.
+    EXPIRY_MARGIN = 10.0
+    PASSWORD_HASH_ITERATIONS = 100_000
+
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, "tokens.json")) -> None:
+        super().__init__(path)
+
+    def get(self, key: str, password: str) -> str | None:
+        with self._lock():
+            entry = self._read().get(key)
+
+        if entry is None or entry["expires_at"] - self.EXPIRY_MARGIN < time.time():
+            return None
+        if "salt" not in entry or not hmac.compare_digest(
+            entry["password_hash"], self._password_hash(password, bytes.fromhex(entry["salt"]))
+        ):
+            return None
+        return entry["token"]
+
+    def set(self, key: str, token: str, expires_in: float, password: str) -> None:
+        salt = os.urandom(16)
+        with self._lock():
+            tokens = self._read()
+            tokens[key] = {
+                "token": token,
+                "expires_at": time.time() + expires_in,
+                "salt": salt.hex(),
+                "password_hash": self._password_hash(password, salt),
+            }
+            # Expired tokens of other devices are dropped on the way
+            self._write({k: v for k, v in tokens.items() if v["expires_at"] > time.time()})
+
+    def invalidate(self, key: str, token: str) -> None:
+        with self._lock():
+            tokens = self._read()
+            if tokens.get(key, {}).get("token") == token:
+                del tokens[key]
+                self._write(tokens)
+
+    def _password_hash(self, password: str, salt: bytes) -> str:
+        return hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), salt, self.PASSWORD_HASH_ITERATIONS
+        ).hex()
+
+
+class UplinkHistory(_JSONFile):
+    # Measurements of WiFi uplinks kept between runs, the newest MAX_ENTRIES per network
+    MAX_ENTRIES = 20
+
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, "uplink_history.json")) -> None:
+        super().__init__(path)
+
+    def get(self, key: str, ssid: str) -> list[dict]:
+        with self._lock():
+            return self._read().get(key, {}).get(ssid, [])
+
+    def add(self, key: str, ssid: str, measurement: dict) -> None:
+        with self._lock():
+            history = self._read()
+            entries = history.setdefault(key, {}).setdefault(ssid, [])
+            entries.append(measurement)
+            del entries[: -self.MAX_ENTRIES]
+            self._write(history)
+
+
+def _median(values: list[float]) -> float | None:
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+# Linux socket options of path MTU discovery, the socket module does not export them
+IP_MTU_DISCOVER = 10
+IP_PMTUDISC_DO = 2
+IP_MTU = 14
+
+# Ethernet MTU is the largest one of the uplinks, every IPv4 path carries at least 576 bytes
+MAX_MTU = 1500
+MIN_MTU = 576
+IP_UDP_HEADERS = 28
+IP_TCP_HEADERS = 40
+# Outer IP and UDP headers plus the framing and authentication of a tunnel such as Husarnet
+TUNNEL_OVERHEAD = 80
+
+
+def _dns_query(query_id: bytes, size: int) -> bytes:
+    # Query for the SOA of the root zone, padded with the EDNS padding option (RFC 7830) to an
+    # IP packet of the given size. Any DNS server answers it with a short response.
+    header = query_id + bytes.fromhex("0100 0001 0000 0000 0001")
+    question = bytes.fromhex("00 0006 0001")
+    padding = size - IP_UDP_HEADERS - len(header) - len(question) - 15
+    option = (12).to_bytes(2, "big") + padding.to_bytes(2, "big") + bytes(padding)
+    opt = bytes.fromhex("00 0029 04d0 00000000") + len(option).to_bytes(2, "big")
+    return header + question + opt + option
+
+
+def _send_probe(sock: socket.socket, size: int, attempts: int) -> bool:
+    for _ in range(attempts):
+        query_id = os.urandom(2)
+        try:
+            sock.send(_dns_query(query_id, size))
+            # Answers to earlier, larger probes may still arrive
+            while sock.recv(4096)[:2] != query_id:
+                pass
+            return True
+        except ConnectionRefusedError:
+            # Port unreachable from the target also means the packet got there
+            return True
+        except socket.timeout:
+            continue
+
+    return False
+
+
+def probe_path_mtu(
+    target: tuple[str, int],
+    low: int = MIN_MTU,
+    high: int = MAX_MTU,
+    timeout: float = 1.0,
+    attempts: int = 2,
+) -> int:
+    # Binary search of the largest packet reaching a DNS server with fragmentation prohibited.
+    # A packet larger than the MTU of a hop is either rejected with ICMP "fragmentation needed",
+    # after which the kernel knows the MTU and send fails, or dropped silently by a PMTU black
+    # hole, common on tunnels over LTE, and times out.
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        sock.settimeout(timeout)
+        sock.connect(target)
+
+        if not _send_probe(sock, low, attempts):
+            raise Exception(f"No answer from {target[0]}:{target[1]} to {low} byte packets")
+
+        while low < high:
+            size = (low + high + 1) // 2
+            try:
+                reached = _send_probe(sock, size, attempts)
+            except OSError as err:
+                if err.errno != errno.EMSGSIZE:
+                    raise
+                high = min(size - 1, sock.getsockopt(socket.IPPROTO_IP, IP_MTU))
+                continue
+
+            if reached:
+                low = size
+            else:
+                high = size - 1
+
+        return low
+
+
+class PathMTUCache(_JSONFile):
+    # Path MTU of an uplink measured on each network it connected to, e.g. a WiFi network or
+    # a mobile operator. Paths change rarely, an entry is probed again after MAX_AGE.
+    MAX_AGE = 7 * 24 * 3600.0
+
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, "path_mtu.json")) -> None:
+        super().__init__(path)
+
+    def get(self, key: str, network: str) -> int | None:
+        with self._lock():
+            entry = self._read().get(key, {}).get(network)
+
+        if entry is None or entry["time"] + self.MAX_AGE < time.time():
+            return None
+        return entry["mtu"]
+
+    def set(self, key: str, network: str, mtu: int) -> None:
+        with self._lock():
+            entries = self._read()
+            entries.setdefault(key, {})[network] = {"mtu": mtu, "time": time.time()}
+            self._write(entries)
+
+
+class ChannelPlanStore(_JSONFile):
+    # Channel plan last applied to each router, restored with the default settings
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, "channel_plans.json")) -> None:
+        super().__init__(path)
+
+    def get(self, device_ip: str) -> dict[str, dict] | None:
+        with self._lock():
+            return self._read().get(device_ip)
+
+    def set(self, device_ip: str, channels: dict[str, dict]) -> None:
+        with self._lock():
+            plans = self._read()
+            plans[device_ip] = channels
+            self._write(plans)
+
+
+class OperationJournal:
+    # Progress of factory_reset for one device and one target configuration. A section is
+    # "in_progress" while it is written, "applied" once the router accepted it, "failed" when
+    # writing or verifying it failed and "done" once a read confirmed its target state.
+    IN_PROGRESS = "in_progress"
+    APPLIED = "applied"
+    FAILED = "failed"
+    DONE = "done"
+
+    def __init__(self, directory: str, device_ip: str, target_hash: str) -> None:
+        name = f"{device_ip.replace(':', '_')}-{target_hash}.json"
+        self._path = os.path.join(directory, name)
+        self._lock = threading.Lock()
+        self.sections = self._read()
+
+    def mark(self, name: str, status: str, state_hash: str | None = None) -> None:
+        with self._lock:
+            self.sections[name] = {
+                "status": status,
+                "state_hash": state_hash,
+                "updated": time.time(),
+            }
+
+            os.makedirs(os.path.dirname(self._path), mode=0o700, exist_ok=True)
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(self.sections, file, indent=2)
+            os.replace(tmp_path, self._path)
+
+    def status(self, name: str) -> str | None:
+        return self.sections.get(name, {}).get("status")
+
+    def reset(self) -> None:
+        with self._lock:
+            self.sections = {}
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+
+    def _read(self) -> dict:
+        try:
+            with open(self._path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+
+def _state_hash(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _snapshot_commands() -> list[str]:
+    # Configuration endpoints of the API. Actions and status endpoints are left out, as are
+    # objects read together with their collection, e.g. INTERFACES_LAN with INTERFACES.
+    commands = [
+        command
+        for name, command in vars(RUTX11HTTPCommands).items()
+        if name.isupper()
+        and command != RUTX11HTTPCommands.LOGIN
+        and "/actions/" not in command
+        and not command.endswith("/status")
+    ]
+    return [command for command in commands if command.rpartition("/")[0] not in commands]
+
+
+SNAPSHOT_COMMANDS = _snapshot_commands()
+
+# Endpoints whose objects are used in order, e.g. WiFi networks are tried from the first one
+ORDERED_SNAPSHOT_COMMANDS = [RUTX11HTTPCommands.WIRELESS_MULTI_AP, RUTX11HTTPCommands.QOS_RULES]
+
+# Fields set for each router separately, by a channel plan or by MTU tuning for the networks
+# it uses, left out of snapshots
+DEVICE_SNAPSHOT_FIELDS = {
+    RUTX11HTTPCommands.WIRELESS_DEVICES: ["channel", "htmode"],
+    RUTX11HTTPCommands.INTERFACES: ["mtu"],
+    RUTX11HTTPCommands.FIREWALL_ZONES_ID3: ["mtu_fix"],
+}
+
+# Fields whose values are stored only as a keyed hash, so that snapshots hold no passwords
+SECRET_FIELDS = ["key", "password"]
+
+# Identifiers the router assigns to created objects, they differ between routers
+_ASSIGNED_ID = re.compile(r"^cfg[0-9a-f]+$")
+
+
+def _normalize_snapshot(
+    value,
+    secret: bytes,
+    serial_number: str | None = None,
+    ordered: bool = False,
+    ignored: list[str] = [],
+):
+    # Router assigned identifiers are dropped and, unless their order matters, the objects
+    # without them sorted, as their order follows the order of creation. The serial number in
+    # SSIDs is replaced, so that snapshots of robots of one model are equal.
+    if isinstance(value, dict):
+        normalized = {}
+        for key, item in value.items():
+            if key in ignored:
+                continue
+            if key == "id" and isinstance(item, str) and _ASSIGNED_ID.match(item):
+                continue
+            if key in SECRET_FIELDS and item:
+                digest = hmac.new(secret, str(item).encode(), hashlib.sha256).hexdigest()
+                normalized[key] = "hmac-sha256:" + digest
+            elif key == "ssid" and serial_number and isinstance(item, str):
+                normalized[key] = item.replace(serial_number, "{serial}")
+            else:
+                normalized[key] = _normalize_snapshot(
+                    item, secret, serial_number, ordered, ignored
+                )
+        return normalized
+
+    if isinstance(value, list):
+        items = [
+            _normalize_snapshot(item, secret, serial_number, ordered, ignored) for item in value
+        ]
+        if not ordered and any(isinstance(item, dict) and "id" not in item for item in items):
+            items.sort(key=lambda item: json.dumps(item, sort_keys=True))
+        return items
+
+    return _normalize(value)
+
+
+def _target_kwargs(options: dict) -> dict:
+    return {
+        "nmea_sentences": options["nmea_sentences"],
+        "nmea_interval": options["nmea_interval"],
+        "failover_profile": FailoverProfile.from_dict(options["failover_profile"]),
+        "qos_profile": QoSProfile.from_dict(options["qos_profile"]),
+    }
+
+
+def _content_hash(data) -> str:
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+class SnapshotStore:
+    # Content addressed store of configuration snapshots. Every section (the data of one
+    # endpoint) is saved once, zlib compressed, in a file named after the hash of its content,
+    # so snapshots of a fleet share the sections that are equal. A snapshot is a manifest
+    # object mapping endpoints to section hashes, and the golden snapshot of a robot model is
+    # the hash of a manifest. Secrets are hashed with a key of the store, so hashes of short
+    # passwords can not be looked up in a precomputed table.
+    def __init__(self, directory: str = os.path.join(DEFAULT_CACHE_DIR, "snapshots")) -> None:
+        self._directory = directory
+
+    def secret(self) -> bytes:
+        path = os.path.join(self._directory, "secret")
+        try:
+            with open(path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(self._directory, mode=0o700, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            # Created by a concurrent process
+            with open(path, "rb") as file:
+                return file.read()
+        secret = os.urandom(32)
+        with os.fdopen(fd, "wb") as file:
+            file.write(secret)
+        return secret
+
+    def save(self, sections: dict[str, object], **info) -> str:
+        manifest = {
+            "time": time.time(),
+            **info,
+            "sections": {command: self.put(data) for command, data in sections.items()},
+        }
+        return self.put(manifest)
+
+    def put(self, data) -> str:
+        hash = _content_hash(data)
+        path = self._object_path(hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as file:
+                file.write(zlib.compress(json.dumps(data, sort_keys=True).encode()))
+            os.replace(tmp_path, path)
+        return hash
+
+    def get(self, hash: str):
+        try:
+            with open(self._object_path(hash), "rb") as file:
+                return json.loads(zlib.decompress(file.read()))
+        except OSError:
+            raise Exception(f"Snapshot object {hash} not found")
+
+    def set_golden(self, robot_model: str, snapshot_id: str) -> None:
+        # The manifest has to exist, a typo must not leave the model without a golden snapshot
+        self.get(snapshot_id)
+        path = os.path.join(self._directory, "golden", robot_model)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as file:
+            file.write(snapshot_id)
+        os.replace(path + ".tmp", path)
+
+    def golden(self, robot_model: str) -> str | None:
+        try:
+            with open(os.path.join(self._directory, "golden", robot_model)) as file:
+                return file.read().strip()
+        except OSError:
+            return None
+
+    def _object_path(self, hash: str) -> str:
+        return os.path.join(self._directory, "objects", hash[:2], hash[2:])
+
+
+class _FileLock:
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._fd = None
+
+    def __enter__(self) -> None:
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc) -> None:
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+
+def load_records(path: str) -> list[dict]:
+    if path.endswith(".json"):
+        with open(path) as file:
+            return json.load(file)
+
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise Exception("PyYAML is required to read YAML files")
+
+        with open(path) as file:
+            return yaml.safe_load(file) or []
+
+    with open(path, newline="") as file:
+        return list(csv.DictReader(file))
+
+
+def _parse_mac(mac: str) -> str:
+    if not re.fullmatch(r"[0-9A-Fa-f]{2}([:-][0-9A-Fa-f]{2}){5}", mac):
+        raise ValueError(f"Invalid MAC address: {mac}")
+    return mac.replace("-", ":").upper()
+
+
+def _parse_static_lease(entry: dict) -> dict:
+    ip = str(entry.get("ip") or "").strip()
+    mac = str(entry.get("mac") or "").strip()
+    name = str(entry.get("name") or "").strip()
+    if ip == "" or mac == "" or name == "":
+        raise ValueError("IP, MAC and name are required")
+
+    try:
+        ipaddress.IPv4Address(ip)
+    except ValueError:
+        raise ValueError(f"Invalid IP address: {ip}")
+
+    return {"ip": ip, "mac": _parse_mac(mac), "name": name}
+
+
+# Writes changing other parts of the configuration than the written endpoint
+_WRITE_SIDE_EFFECTS = {
+    # Removing the Multi AP interface removes its wwan network interface
+    RUTX11HTTPCommands.WIRELESS_INTERFACES: [
+        RUTX11HTTPCommands.INTERFACES,
+        RUTX11HTTPCommands.FAILOVER_INTERFACES,
+        RUTX11HTTPCommands.QOS_INTERFACES,
+    ],
+    # Failover and QoS entries are created and removed with WAN interfaces
+    RUTX11HTTPCommands.INTERFACES: [
+        RUTX11HTTPCommands.FAILOVER_INTERFACES,
+        RUTX11HTTPCommands.QOS_INTERFACES,
+    ],
+}
+
+
+def _affected_by(command: str, written: list[str]) -> bool:
+    changed = written + [
+        effect for endpoint in written for effect in _WRITE_SIDE_EFFECTS.get(endpoint, [])
+    ]
+    # Writing an object changes its collection and writing a collection changes its objects
+    return any(
+        command == endpoint
+        or endpoint.startswith(command + "/")
+        or command.startswith(endpoint + "/")
+        for endpoint in changed
+    )
+
+
+# Timing of the connection opened by the current thread and the configuration step it works on
+_trace_context = threading.local()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        start_time = time.perf_counter()
+        sock = super()._new_conn()
+        _trace_context.connect = time.perf_counter() - start_time
+        return sock
+
+    def connect(self) -> None:
+        start_time = time.perf_counter()
+        super().connect()
+        _trace_context.tls = time.perf_counter() - start_time - _trace_context.connect
+
+    def request(self, *args, **kwargs) -> None:
+        super().request(*args, **kwargs)
+        self._request_sent = time.perf_counter()
+
+    def getresponse(self, *args, **kwargs):
+        # Time from sending the request to the response headers, without connecting
+        response = super().getresponse(*args, **kwargs)
+        _trace_context.server = time.perf_counter() - self._request_sent
+        return response
+
+
+@contextmanager
+def _trace_step(step: str):
+    _trace_context.step = step
+    try:
+        yield
+    finally:
+        _trace_context.step = ""
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": HTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class RequestTrace:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.records = []
+
+    def record(self, record: dict) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as file:
+            for record in self.records:
+                file.write(json.dumps(record) + "\n")
+
+    def print_summary(self) -> None:
+        steps = {}
+        for record in self.records:
+            step = steps.setdefault(record["step"] or "-", [0, 0, 0, 0.0, 0.0])
+            step[0] += 1
+            step[1] += record["retries"]
+            step[2] += record["new_connection"]
+            step[3] += record["total"]
+            step[4] += record["server"]
+
+        print(
+            f"{'Step':<26} {'Requests':>8} {'Retries':>7} {'Connects':>8} "
+            f"{'Total [s]':>9} {'Server [s]':>10}"
+        )
+        for name, (count, retries, connects, total, server) in steps.items():
+            print(
+                f"{name:<26} {count:>8} {retries:>7} {connects:>8} {total:>9.3f} {server:>10.3f}"
+            )
+
+
+def _collection(change: ConfigChange) -> str | None:
+    # Collections of the API are served at ".../config" and their objects at ".../config/<id>",
+    # a collection accepts a list of objects with ids in a single PUT.
+    if change.method != "PUT":
+        return None
+    if isinstance(change.data["data"], list) and change.endpoint.endswith("/config"):
+        return change.endpoint
+
+    collection, _, _ = change.endpoint.rpartition("/")
+    if isinstance(change.data["data"], dict) and collection.endswith("/config"):
+        return collection
+    return None
+
+
+def _has_cycle(plan: list[ConfigChange]) -> bool:
+    change_of = {section.name: change for change in plan for section in change.sections}
+    graph = {
+        id(change): {
+            id(change_of[dependency])
+            for section in change.sections
+            for dependency in section.depends_on
+            if dependency in change_of and change_of[dependency] is not change
+        }
+        for change in plan
+    }
+
+    visited = set()
+    in_progress = set()
+
+    def visit(node: int) -> bool:
+        if node in in_progress:
+            return True
+        if node in visited:
+            return False
+        in_progress.add(node)
+        if any(visit(dependency) for dependency in graph[node]):
+            return True
+        in_progress.remove(node)
+        visited.add(node)
+        return False
+
+    return any(visit(node) for node in graph)
+
+
+def _merge_changes(collection: str, changes: list[ConfigChange]) -> ConfigChange:
+    items = []
+    item_sections = {}
+    for change in changes:
+        if isinstance(change.data["data"], list):
+            change_items = change.data["data"]
+        else:
+            id = change.endpoint.rpartition("/")[2]
+            change_items = [{"id": id, **change.data["data"]}]
+
+        for item in change_items:
+            items.append(item)
+            item_sections[item["id"]] = change.section.name
+
+    merged = ConfigChange(changes[0].section, "PUT", collection, {"data": items})
+    merged.sections = [section for change in changes for section in change.sections]
+    merged.item_sections = item_sections
+    return merged
+
+
+def _coalesce(plan: list[ConfigChange]) -> list[ConfigChange]:
+    # PUTs to one collection are merged into a single list request as long as merging does not
+    # create a dependency cycle, e.g. between two sections waiting for a third one.
+    plan = list(plan)
+    collections = list(dict.fromkeys(filter(None, map(_collection, plan))))
+
+    for collection in collections:
+        group = [change for change in plan if _collection(change) == collection]
+        merged = [group[0]]
+        for change in group[1:]:
+            candidate_plan = [item for item in plan if item not in merged and item is not change]
+            candidate_plan.append(_merge_changes(collection, merged + [change]))
+            if not _has_cycle(candidate_plan):
+                merged.append(change)
+
+        if len(merged) > 1:
+            index = plan.index(merged[0])
+            plan = [change for change in plan if change not in merged]
+            plan.insert(index, _merge_changes(collection, merged))
+
+    return plan
 
 
 class RUTX11Manager:
-    def __init__(self, username: str, password: str, device_ip: str = "10.15.20.1") -> None:
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        device_ip: str = "10.15.20.1",
+        pool_size: int = 4,
+        retries: int = 3,
+        timeout: float = 10.0,
+        internet_check_target: tuple[str, int] = ("8.8.8.8", 53),
+        probe_timeout: float = 0.5,
+        token_cache: TokenCache | bool | None = None,
+        trace: RequestTrace | None = None,
+        cache_ttl: float = 30.0,
+        journal_dir: str | bool | None = None,
+        channel_plans: ChannelPlanStore | None = None,
+    ) -> None:
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+        # Token cache and journal in the cache directory are used unless others are given,
+        # False disables them
+        if token_cache is None:
+            token_cache = TokenCache()
+        if journal_dir is None:
+            journal_dir = os.path.join(DEFAULT_CACHE_DIR, "journal")
+
         self._username = username
         self._password = password
         self._token = None
+        self._token_cache = token_cache or None
+        self._token_cache_key = f"{username}@{device_ip}"
+        self._login_lock = threading.Lock()
+        self._trace = trace
+        # Parsed responses of GET requests: command -> (data, ETag, time of the response)
+        self._cache = {}
+        self._cache_ttl = cache_ttl
+        self._cache_lock = threading.Lock()
+        # Start of the last state read, later reads of the same operation reuse what it cached
+        self._state_read_at = float("inf")
+        self.reboot_required = False
         self._device_ip = device_ip
+        self._journal_dir = journal_dir or None
+        self._journal = None
+        self._channel_plans = channel_plans
         self._request_url = "https://" + device_ip
+        self._timeout = timeout
+        self._pool_size = pool_size
+        self._internet_check_target = internet_check_target
+        self._probe_timeout = probe_timeout
+        self._session = self._create_session(pool_size, retries)
 
         if not self._is_available():
             raise Exception(f"Device at {device_ip} is not available")
 
-        self._login()
+        token = (
+            self._token_cache.get(self._token_cache_key, password) if self._token_cache else None
+        )
+        if token is not None:
+            self._set_token(token)
+        else:
+            self._login()
+
+    def factory_reset(
+        self,
+        robot_model: str,
+        robot_serial_number: str,
+        dry_run: bool = False,
+        concurrency: int | None = None,
+        nmea_sentences: list[str] = DEFAULT_NMEA_SENTENCES,
+        nmea_interval: int = 1,
+        failover_profile: FailoverProfile | None = None,
+        qos_profile: QoSProfile | None = None,
+        wireless_channels: dict[str, dict] | None = None,
+    ) -> list[ConfigChange]:
+        self._set_target(
+            robot_model,
+            robot_serial_number,
+            nmea_sentences,
+            nmea_interval,
+            failover_profile,
+            qos_profile,
+            wireless_channels,
+        )
+
+        concurrency = concurrency or self._pool_size
+        sections = self._target_config()
+
+        if dry_run:
+            plan = _coalesce(self._plan(sections, concurrency))
+            if not plan:
+                print("Router configuration is up to date")
+            for change in plan:
+                print(change)
+            return plan
+
+        try:
+            if self._journal_dir is not None:
+                target_hash = _state_hash(
+                    [(section.name, section.endpoint, section.data) for section in sections]
+                )
+                self._journal = OperationJournal(self._journal_dir, self._device_ip, target_hash)
+                sections = self._resume(sections)
+
+            state = self._read_state(sections, concurrency)
+            plan = _coalesce(self._plan(sections, concurrency, state))
+            changed = {section.name for change in plan for section in change.sections}
+            self._apply_plan(plan, concurrency)
+
+            for section in sections:
+                if section.name not in changed:
+                    print(f"{section.description} already configured")
+
+            # Endpoints changed by the written sections are read back, the state read for the
+            # plan is kept for the others. Sections still differing from the target are failed
+            # and the state of the others is recorded.
+            written = [section.endpoint for section in sections if section.name in changed]
+            state.update(
+                self._read_state(
+                    [section for section in sections if _affected_by(section.endpoint, written)],
+                    concurrency,
+                )
+            )
+            remaining = self._plan(sections, concurrency, state)
+            failed = {section.name for change in remaining for section in change.sections}
+            if self._journal is not None:
+                for section in sections:
+                    if section.name in failed:
+                        self._journal.mark(section.name, OperationJournal.FAILED)
+                    else:
+                        self._journal.mark(
+                            section.name,
+                            OperationJournal.DONE,
+                            _state_hash(state[section.endpoint]),
+                        )
+
+            if failed:
+                descriptions = [
+                    section.description for section in sections if section.name in failed
+                ]
+                raise Exception(
+                    f"Failed to configure: {', '.join(descriptions)}. Run again to resume."
+                )
 
-    def factory_reset(self, robot_model: str, robot_serial_number: str) -> None:
+            return plan
+        finally:
+            self._journal = None
+
+    def snapshot(
+        self,
+        robot_serial_number: str | None = None,
+        commands: list[str] = SNAPSHOT_COMMANDS,
+        store: SnapshotStore | None = None,
+    ) -> dict[str, object]:
+        # Configuration read from every endpoint and normalized, so that snapshots of robots of
+        # one model configured the same way are equal. Secrets are hashed with the key of the
+        # store the snapshot is compared with.
+        secret = (store or SnapshotStore()).secret()
+        results = self.read_status(commands)
+        failed = [command for command, data in zip(commands, results) if data is None]
+        if failed:
+            raise Exception(f"Failed to read {', '.join(failed)}")
+
+        return {
+            command: _normalize_snapshot(
+                data,
+                secret,
+                robot_serial_number,
+                ordered=command in ORDERED_SNAPSHOT_COMMANDS,
+                ignored=DEVICE_SNAPSHOT_FIELDS.get(command, []),
+            )
+            for command, data in zip(commands, results)
+        }
+
+    def save_snapshot(
+        self,
+        robot_model: str,
+        robot_serial_number: str,
+        store: SnapshotStore | None = None,
+        golden: bool = False,
+        **target: object,
+    ) -> str:
+        # The options of the default configuration (see factory_reset, which takes the same
+        # options) are saved with the snapshot, check_drift restores drifted sections with them
+        store = store or SnapshotStore()
+        self._set_target(robot_model, robot_serial_number, **target)
+        snapshot_id = store.save(
+            self.snapshot(robot_serial_number, store=store),
+            device_ip=self._device_ip,
+            robot_model=robot_model,
+            target=self._target_options(),
+        )
+        if golden:
+            store.set_golden(robot_model, snapshot_id)
+        return snapshot_id
+
+    def check_drift(
+        self,
+        robot_model: str,
+        robot_serial_number: str,
+        store: SnapshotStore | None = None,
+        dry_run: bool = False,
+        concurrency: int | None = None,
+    ) -> list[dict]:
+        # Sections are compared by hash with the golden snapshot of the robot model. Sections
+        # of the default configuration, with the options saved in the golden snapshot, that
+        # write to a drifted endpoint are restored, and the endpoint is compared again.
+        store = store or SnapshotStore()
+        snapshot_id = store.golden(robot_model)
+        if snapshot_id is None:
+            raise Exception(f"No golden snapshot of {robot_model}")
+        manifest = store.get(snapshot_id)
+        golden = manifest["sections"]
+
+        current = self.snapshot(robot_serial_number, list(golden), store)
+        drifted = [
+            {"endpoint": command, "sections": [], "restored": False}
+            for command, hash in golden.items()
+            if _content_hash(current[command]) != hash
+        ]
+        if not drifted or dry_run:
+            return drifted
+
+        if "target" not in manifest:
+            raise Exception(
+                f"Golden snapshot of {robot_model} has no default settings options, "
+                "save it again to restore drifted sections"
+            )
+        self._set_target(robot_model, robot_serial_number, **_target_kwargs(manifest["target"]))
+        concurrency = concurrency or self._pool_size
+        target_sections = self._target_config()
+        sections = []
+        for drift in drifted:
+            for section in target_sections:
+                if section.endpoint == drift["endpoint"] or section.endpoint.startswith(
+                    drift["endpoint"] + "/"
+                ):
+                    drift["sections"].append(section.description)
+                    sections.append(section)
+
+        if sections:
+            self._journal = None
+            self._apply_plan(_coalesce(self._plan(sections, concurrency)), concurrency)
+
+            restored = self.snapshot(
+                robot_serial_number, [drift["endpoint"] for drift in drifted], store
+            )
+            for drift in drifted:
+                drift["restored"] = (
+                    _content_hash(restored[drift["endpoint"]]) == golden[drift["endpoint"]]
+                )
+
+        return drifted
+
+    def _set_target(
+        self,
+        robot_model: str,
+        robot_serial_number: str,
+        nmea_sentences: list[str] = DEFAULT_NMEA_SENTENCES,
+        nmea_interval: int = 1,
+        failover_profile: FailoverProfile | None = None,
+        qos_profile: QoSProfile | None = None,
+        wireless_channels: dict[str, dict] | None = None,
+    ) -> None:
         if robot_model not in ["PTH", "LNX"]:
             raise Exception("Invalid robot model. Valid options are 'PTH' or 'LNX'.")
 
         if len(robot_serial_number) != 4:
             raise Exception("Robot serial number must be 4 characters long")
 
+        unknown_sentences = set(nmea_sentences) - set(NMEA_SENTENCES)
+        if unknown_sentences:
+            raise Exception(f"Unknown NMEA sentences: {', '.join(sorted(unknown_sentences))}")
+
+        if nmea_interval < 1:
+            raise Exception("NMEA forwarding interval must be at least 1 second")
+
         self._robot_model = robot_model
         self._robot_serial_number = robot_serial_number
+        self._nmea_sentences = nmea_sentences
+        self._nmea_interval = nmea_interval
+        self._failover_profile = failover_profile or FailoverProfile()
+        self._qos_profile = qos_profile or QoSProfile()
+        # Without a plan the one last applied to the router is kept
+        if wireless_channels is None and self._channel_plans is not None:
+            wireless_channels = self._channel_plans.get(self._device_ip)
+        self._wireless_channels = wireless_channels
+
+    def _target_options(self) -> dict:
+        # Wireless channels are planned for each router, they are not options of a model
+        return {
+            "nmea_sentences": self._nmea_sentences,
+            "nmea_interval": self._nmea_interval,
+            "failover_profile": self._failover_profile.to_dict(),
+            "qos_profile": self._qos_profile.to_dict(),
+        }
+
+    def _resume(self, sections: list[ConfigSection]) -> list[ConfigSection]:
+        # Sections verified by an interrupted or failed restore are skipped, unless a section
+        # they are reapplied after is written again. A journal of a completed restore is
+        # started over.
+        statuses = {section.name: self._journal.status(section.name) for section in sections}
+        if not any(statuses.values()):
+            return sections
+        if all(status == OperationJournal.DONE for status in statuses.values()):
+            self._journal.reset()
+            return sections
+
+        pending = [
+            section for section in sections if statuses[section.name] != OperationJournal.DONE
+        ]
+        names = {section.name for section in pending}
+        pending = [
+            section
+            for section in sections
+            if section.name in names or names.intersection(section.reapply_after)
+        ]
+
+        print(
+            f"Resuming previous restore: {len(sections) - len(pending)} of {len(sections)} "
+            "sections were verified and are skipped"
+        )
+        for section in pending:
+            if statuses[section.name] == OperationJournal.IN_PROGRESS:
+                click.secho(f"{section.description} was interrupted while writing", fg="yellow")
+        return pending
 
-        self._configure_dhcp()
-        self._configure_interfaces_wan()
-        self._configure_interfaces_wwan()
-        self._configure_interfaces_lan()
-        self._configure_firewall()
-        self._configure_ntp_client()
-        self._configure_gps()
-        self._configure_nmea()
-        self._configure_wireless_devices()
-        self._configure_wireless_interfaces()
-        self._configure_multi_ap_interface()
-        self._configure_static_leases()
-
-    def reboot(self) -> None:
+    def reboot(self) -> bool:
         success, _ = self._request_post(RUTX11HTTPCommands.REBOOT, {})
         if not success:
             click.secho("Failed to reboot the router", fg="red")
+            return False
+
+        self.reboot_required = False
+        return True
+
+    def wait_until_ready(self, timeout: float = 90.0, down_timeout: float = 30.0) -> None:
+        start_time = time.monotonic()
+
+        # The router keeps serving requests for a moment after accepting the reboot
+        while self._probe(*self._device_address()):
+            if time.monotonic() - start_time > down_timeout:
+                click.secho("Router did not go down, assuming it has already rebooted", fg="yellow")
+                break
+            time.sleep(0.2)
+
+        with self._cache_lock:
+            self._cache.clear()
+        if self._token_cache is not None and self._token is not None:
+            self._token_cache.invalidate(self._token_cache_key, self._token)
+
+        while True:
+            if self._probe(*self._device_address()):
+                try:
+                    self._login()
+                    return
+                except Exception:
+                    # The HTTP server starts before the API accepts logins
+                    pass
+
+            if time.monotonic() - start_time > timeout:
+                raise Exception(f"Router is not ready {timeout:.0f} s after reboot")
+            time.sleep(0.5)
 
     def add_wifi_network(self, ssid: str, password: str) -> None:
-        success, response = self._request_get(RUTX11HTTPCommands.WIRELESS_MULTI_AP)
+        success, networks = self._get_data(RUTX11HTTPCommands.WIRELESS_MULTI_AP)
         if not success:
             raise Exception("Failed to get WiFi networks")
 
@@ -86,7 +1452,7 @@ class RUTX11Manager:
             }
         }
 
-        for network in response.json()["data"]:
+        for network in networks:
             if network["ssid"] == ssid:
                 click.secho("WiFi network already exists, updating password", fg="yellow")
                 success, _ = self._request_put(
@@ -106,333 +1472,1380 @@ class RUTX11Manager:
         print("WiFi network added successfully")
 
     def remove_wifi_network(self, ssid: str) -> None:
-        success, response = self._request_get(RUTX11HTTPCommands.WIRELESS_MULTI_AP)
+        success, networks = self._get_data(RUTX11HTTPCommands.WIRELESS_MULTI_AP)
         if not success:
-            raise Exception("Failed to get WiFi networks", fg="red")
+            raise Exception("Failed to get WiFi networks")
 
-        for network in response.json()["data"]:
+        for network in networks:
             if network["ssid"] == ssid:
                 success, _ = self._request_delete(
                     f"{RUTX11HTTPCommands.WIRELESS_MULTI_AP}/{network['id']}", {}
                 )
 
                 if not success:
-                    raise Exception("Failed to remove WiFi network", fg="red")
+                    raise Exception("Failed to remove WiFi network")
 
                 print("WiFi network removed successfully")
                 return
 
         click.secho("WiFi network not found", fg="yellow")
 
-    def add_static_lease(self, ip: str, mac: str, name: str) -> None:
-        if ip == "" or mac == "" or name == "":
-            raise Exception("IP, MAC and name are required", fg="red")
-
-        ip_parts = ip.split(".")
-        if len(ip_parts) != 4:
-            raise Exception("Invalid IP address", fg="red")
+    def set_failover_profile(self, profile: FailoverProfile) -> None:
+        plan = self._plan([self._failover_section(profile)], 1)
+        if not plan:
+            print("Failover already configured")
+            return
 
-        mac_parts = mac.split(":")
-        if len(mac_parts) != 6:
-            raise Exception("Invalid MAC address", fg="red")
+        results = self._apply_plan(plan, 1)
+        if not all(results.values()):
+            raise Exception("Failed to configure failover")
 
-        data = {
-            "data": {
-                "ip": ip,
-                "mac": mac,
-                "name": name,
-            }
-        }
+    def set_qos_profile(self, profile: QoSProfile) -> None:
+        plan = _coalesce(self._plan(self._qos_sections(profile), 1))
+        if not plan:
+            print("QoS already configured")
+            return
 
-        success, _ = self._request_post(RUTX11HTTPCommands.DHCP_STATIC_LEASES, data)
+        results = self._apply_plan(plan, 1)
+        if not all(results.values()):
+            raise Exception("Failed to configure QoS")
+
+    def measure_qos(
+        self,
+        load_target: tuple[str, int],
+        profile: QoSProfile,
+        duration: float = 10.0,
+        streams: int = 4,
+        probe_interval: float = 0.1,
+    ) -> dict:
+        # Uploads to load_target saturate the uplink while TCP handshakes with the internet
+        # check target, marked as control traffic (DSCP EF), measure its round trip time. The
+        # test runs with QoS disabled and then enabled on the interfaces shaped by the profile,
+        # which has to be applied to the router. Enabling QoS of an interface without the rate
+        # of its link would throttle it instead.
+        success, interfaces = self._get_data(RUTX11HTTPCommands.QOS_INTERFACES)
         if not success:
-            raise Exception("Failed to add static lease.", fg="red")
+            raise Exception("Failed to get QoS interfaces")
+        enabled = {interface["id"]: interface.get("enabled", "0") for interface in interfaces}
+        if not set(profile.bandwidth).intersection(enabled):
+            raise Exception("No uplink is shaped by the QoS profile")
 
-        print("Static lease added successfully")
+        results = {"idle": self._measure_control_rtt(min(duration, 3.0), probe_interval)}
+        try:
+            for name, shaped in [("without_qos", set()), ("with_qos", set(profile.bandwidth))]:
+                self._set_qos_enabled({id: "1" if id in shaped else "0" for id in enabled})
+                print(f"Saturating the uplink {name.replace('_', ' ')}")
+                results[name] = self._measure_under_load(
+                    load_target, duration, streams, probe_interval
+                )
+        finally:
+            self._set_qos_enabled(enabled)
 
-    def check_internet_connection(self) -> bool:
-        return self._ping_ip("8.8.8.8")
+        return results
 
-    def _is_available(self) -> bool:
-        return self._ping_ip(self._device_ip)
+    def scan_wireless(self) -> tuple[list[dict], list[dict]]:
+        # Returns the networks seen by the radios and the status of the router's own wireless
+        # interfaces, which holds the channels they operate on
+        scan, status = self.read_status(
+            [RUTX11HTTPCommands.WIRELESS_SCAN_STATUS, RUTX11HTTPCommands.WIRELESS_INTERFACES_STATUS]
+        )
+        if scan is None or status is None:
+            raise Exception("Failed to scan wireless networks")
+
+        return scan, status
+
+    def set_wireless_channels(self, channels: dict[str, dict]) -> None:
+        plan = self._plan([self._wireless_devices_section(channels)], 1)
+        if not plan:
+            print("Wireless channels already configured")
+        else:
+            results = self._apply_plan(plan, 1)
+            if not all(results.values()):
+                raise Exception("Failed to configure wireless channels")
+
+        if self._channel_plans is not None:
+            self._channel_plans.set(self._device_ip, channels)
+
+    def measure_failover(
+        self, uplink: str = "wwan", timeout: float = 120.0, probe_interval: float = 0.2
+    ) -> dict:
+        # The uplink is disabled and enabled again while the internet check target is probed.
+        # Outage is the time the internet was unreachable, detection is the time until the
+        # router reports the uplink offline (and online again on failback).
+        if not self.check_internet_connection():
+            raise Exception("Internet is not reachable, failover can not be measured")
+
+        endpoint = f"{RUTX11HTTPCommands.INTERFACES}/{uplink}"
+        results = {}
+        try:
+            print(f"Disabling {uplink}")
+            if not self._request_put(endpoint, {"data": {"enabled": "0"}})[0]:
+                raise Exception(f"Failed to disable {uplink}")
+            detection, outage = self._watch_failover(uplink, False, timeout, probe_interval)
+            results["failover_detection"] = detection
+            results["failover_outage"] = outage
+        finally:
+            # A failure to enable the uplink is only reported here, so that it does not replace
+            # the error of the measurement
+            print(f"Enabling {uplink}")
+            enabled = self._request_put(endpoint, {"data": {"enabled": "1"}})[0]
+            if not enabled:
+                click.secho(f"Failed to enable {uplink}", fg="red")
+        if not enabled:
+            raise Exception(f"Failed to enable {uplink}")
+
+        detection, outage = self._watch_failover(uplink, True, timeout, probe_interval)
+        results["failback_detection"] = detection
+        results["failback_outage"] = outage
+        return results
+
+    def tune_mtu(
+        self,
+        uplinks: list[str] | None = None,
+        cache: PathMTUCache | bool | None = None,
+        force: bool = False,
+        timeout: float = 120.0,
+    ) -> list[dict]:
+        # Path MTU over each uplink (the active one by default) is probed with the internet
+        # check target, which has to be a DNS server, and written as the MTU of the interface.
+        # MSS clamping on the WAN zone derives the TCP MSS from it. Results are cached for the
+        # network the uplink is connected to, so on a known network nothing is probed. False
+        # disables the cache.
+        cache = (PathMTUCache() if cache is None else cache) or None
+        online = self._online_uplinks()
+        if not online:
+            raise Exception("No uplink is online")
+
+        results = []
+        for uplink in uplinks or online[:1]:
+            network = self._uplink_network(uplink)
+            mtu = None
+            if cache is not None and not force:
+                mtu = cache.get(self._token_cache_key, network)
+
+            result = {"uplink": uplink, "network": network, "cached": mtu is not None}
+            if mtu is None:
+                mtu = self._probe_uplink_mtu(uplink, timeout)
+                if cache is not None:
+                    cache.set(self._token_cache_key, network, mtu)
+
+            result["mtu"] = mtu
+            result["mss"] = mtu - IP_TCP_HEADERS
+            result["tunnel_mtu"] = mtu - TUNNEL_OVERHEAD
+            results.append(result)
+
+        sections = [
+            ConfigSection(
+                "interfaces_mtu",
+                "Uplink MTU",
+                RUTX11HTTPCommands.INTERFACES,
+                [{"id": result["uplink"], "mtu": str(result["mtu"])} for result in results],
+            ),
+            ConfigSection(
+                "mss_clamping",
+                "MSS clamping",
+                RUTX11HTTPCommands.FIREWALL_ZONES_ID3,
+                {"mtu_fix": "1"},
+            ),
+        ]
+        plan = self._plan(sections, 1)
+        if not plan:
+            print("MTU already configured")
+            return results
+
+        applied = self._apply_plan(plan, 1)
+        if not all(applied.values()):
+            raise Exception("Failed to configure MTU")
+
+        return results
+
+    def rank_wifi_networks(
+        self,
+        throughput_url: str,
+        timeout: float = 60.0,
+        history: UplinkHistory | None = None,
+        dry_run: bool = False,
+    ) -> list[dict]:
+        # Every configured network is enabled alone and measured, downloading from
+        # throughput_url, then the networks are written back ordered from the best one, which
+        # the router prefers. The score is the median of the recent measurements kept in the
+        # history, so one noisy probe does not reorder the networks.
+        success, networks = self._get_data(RUTX11HTTPCommands.WIRELESS_MULTI_AP)
+        if not success:
+            raise Exception("Failed to get WiFi networks")
+        networks = [dict(network) for network in networks]
+        if not networks:
+            raise Exception("No WiFi networks configured")
 
-    def _ping_ip(self, ip: str) -> bool:
+        history_key = self._token_cache_key
+        results = []
         try:
-            res = subprocess.run(
-                ["ping", "-c 1", "-w 1", ip],
-                capture_output=True,
-                text=True,
-                check=True,
+            for network in networks:
+                print(f"Measuring {network['ssid']}")
+                self._enable_wifi_networks([network["id"]], networks)
+                measurement = self._measure_uplink(network["ssid"], timeout, throughput_url)
+
+                if history is not None:
+                    history.add(history_key, network["ssid"], measurement)
+                    recent = history.get(history_key, network["ssid"])
+                else:
+                    recent = [measurement]
+
+                results.append(
+                    {
+                        "ssid": network["ssid"],
+                        **measurement,
+                        "score_throughput": _median([entry["throughput"] for entry in recent]),
+                        "score_rtt": _median([entry["rtt"] for entry in recent]),
+                    }
+                )
+        finally:
+            # Networks are enabled as before even when a measurement is interrupted. A failure
+            # to do so is only reported here, so that it does not replace the error of the
+            # measurement.
+            enabled = [network["id"] for network in networks if network["enabled"] == "1"]
+            try:
+                self._enable_wifi_networks(enabled, networks)
+                restored = True
+            except Exception as err:
+                click.secho(f"Failed to enable WiFi networks as before: {err}", fg="red")
+                restored = False
+        if not restored:
+            raise Exception("Failed to enable WiFi networks as before")
+
+        # Unreachable uplinks go last, then the fastest first and the lowest RTT on a tie
+        results.sort(
+            key=lambda result: (
+                result["rtt"] is None,
+                -(result["score_throughput"] or 0.0),
+                result["score_rtt"] if result["score_rtt"] is not None else math.inf,
             )
-            if res.returncode != 0:
-                return False
-        except subprocess.CalledProcessError:
-            return False
+        )
 
-        return True
+        ranked_ssids = [result["ssid"] for result in results]
+        if ranked_ssids == [network["ssid"] for network in networks]:
+            print("WiFi networks are already in the best order")
+            return results
 
-    def _login(self) -> None:
-        url = self._request_url + RUTX11HTTPCommands.LOGIN
-        data = {
-            "username": self._username,
-            "password": self._password,
-        }
-
-        response = requests.post(url, json=data, verify=False)
-        if response.status_code != 200:
-            click.secho(f"Failed to connect: {json.dumps(response.json(), indent=2)}", fg="red")
-            raise Exception(f"Failed to connect")
+        if dry_run:
+            print("WiFi networks order would be: " + ", ".join(ranked_ssids))
+            return results
 
-        self._token = response.json()["data"]["token"]
-        print("Logged in successfully")
+        self._reorder_wifi_networks(networks, ranked_ssids)
 
-    def _configure_dhcp(self) -> None:
-        data = {"data": {"leasetime": "12h"}}
+        print("WiFi networks reordered: " + ", ".join(ranked_ssids))
+        return results
 
-        success, _ = self._request_put(RUTX11HTTPCommands.DHCP_SERVER_LAN, data)
+    def add_static_lease(self, ip: str, mac: str, name: str) -> None:
+        self.import_static_leases([{"ip": ip, "mac": mac, "name": name}])
+
+    def import_static_leases(
+        self, entries: list[dict], sync: bool = False, dry_run: bool = False
+    ) -> None:
+        leases = []
+        errors = []
+        for index, entry in enumerate(entries, start=1):
+            try:
+                leases.append(_parse_static_lease(entry))
+            except ValueError as err:
+                errors.append(f"entry {index}: {err}")
+
+        for key in ["ip", "mac", "name"]:
+            values = [lease[key] for lease in leases]
+            for value in sorted({value for value in values if values.count(value) > 1}):
+                errors.append(f"duplicated {key} {value}")
+
+        success, lan = self._get_data(RUTX11HTTPCommands.INTERFACES_LAN)
         if not success:
-            click.secho("Failed to configure DHCP.", fg="red")
-            return
-
-        print("DHCP configured successfully")
+            raise Exception("Failed to get LAN interface")
 
-    def _configure_interfaces_wan(self) -> None:
-        data = {
-            "data": [
-                {
-                    "id": id,
-                    "enabled": "0",
-                    "ifname": [],
-                }
-                for id in ["wan", "wan6"]
-            ]
-        }
+        subnet = ipaddress.IPv4Network(
+            f"{lan['ipaddr']}/{lan.get('netmask') or '255.255.255.0'}", strict=False
+        )
+        for lease in leases:
+            if ipaddress.IPv4Address(lease["ip"]) not in subnet:
+                errors.append(f"{lease['ip']} is outside of the LAN subnet {subnet}")
+            elif lease["ip"] == lan["ipaddr"]:
+                errors.append(f"{lease['ip']} is the router address")
 
-        success, _ = self._request_put(RUTX11HTTPCommands.INTERFACES, data)
+        success, current_leases = self._get_data(RUTX11HTTPCommands.DHCP_STATIC_LEASES)
         if not success:
-            click.secho("Failed to configure WAN interface.", fg="red")
+            raise Exception("Failed to get static leases")
+
+        # Leases with a MAC address the router accepted but that can not be matched, e.g. added
+        # by hand, are not updated. They are still removed by sync and checked for collisions.
+        existing = {}
+        unmatched = []
+        for lease in current_leases:
+            try:
+                existing[_parse_mac(str(lease.get("mac") or ""))] = lease
+            except ValueError as err:
+                click.secho(f"Skipping existing lease {lease.get('name')}: {err}", fg="yellow")
+                unmatched.append(lease)
+        imported_macs = {lease["mac"] for lease in leases}
+
+        to_create = []
+        to_update = []
+        for lease in leases:
+            current = existing.get(lease["mac"])
+            if current is None:
+                to_create.append(lease)
+            elif current.get("ip") != lease["ip"] or current.get("name") != lease["name"]:
+                to_update.append({"id": current["id"], **lease})
+
+        to_delete = [
+            lease["id"] for mac, lease in existing.items() if sync and mac not in imported_macs
+        ]
+        to_delete += [lease["id"] for lease in unmatched if sync]
+
+        # Leases kept on the router must not collide with the imported ones
+        kept = list(existing.items()) + [(current.get("mac"), current) for current in unmatched]
+        for mac, current in kept:
+            if mac in imported_macs or current["id"] in to_delete:
+                continue
+            for lease in leases:
+                if current.get("ip") == lease["ip"] or current.get("name") == lease["name"]:
+                    errors.append(
+                        f"{lease['mac']} collides with the existing lease {current.get('name')} "
+                        f"({current.get('ip')}, {mac})"
+                    )
+
+        if errors:
+            raise Exception("Invalid static leases:\n" + "\n".join(errors))
+
+        if dry_run:
+            print(
+                f"Static leases to create: {len(to_create)}, to update: {len(to_update)}, "
+                f"to delete: {len(to_delete)}"
+            )
             return
 
-        print("WAN interface configured successfully")
+        # Each kind of change is sent as a single list request. Deletions go first to release
+        # addresses reused by the imported leases.
+        if to_delete:
+            success, _ = self._request_delete(
+                RUTX11HTTPCommands.DHCP_STATIC_LEASES, {"data": to_delete}
+            )
+            if not success:
+                raise Exception("Failed to delete static leases")
+
+        if to_update:
+            success, _ = self._request_put(
+                RUTX11HTTPCommands.DHCP_STATIC_LEASES, {"data": to_update}
+            )
+            if not success:
+                raise Exception("Failed to update static leases")
 
-    def _configure_interfaces_wwan(self) -> None:
-        # Multi AP has to release wwan first. Removing it also removes the wwan interface so there
-        # is no need to do that after.
-        self._remove_multi_ap_interface()
+        if to_create:
+            success, _ = self._request_post(
+                RUTX11HTTPCommands.DHCP_STATIC_LEASES, {"data": to_create}
+            )
+            if not success:
+                raise Exception("Failed to add static leases")
 
-        data = {
-            "data": {
-                "area_type": "wan",
-                "id": "wwan",
-                "metric": "2",
-                "proto": "dhcp",
-                "name": "wwan",
-            }
-        }
+        print(
+            f"Static leases imported successfully: {len(to_create)} added, "
+            f"{len(to_update)} updated, {len(to_delete)} deleted"
+        )
 
-        success, _ = self._request_post(RUTX11HTTPCommands.INTERFACES, data)
+    def get_config(self, command: str) -> dict | list:
+        success, data = self._get_data(command, self._cache_ttl)
         if not success:
-            click.secho("Failed to configure WWAN interface.", fg="red")
-            return
+            raise Exception(f"Failed to get {command}")
 
-        print("WWAN interface configured successfully")
+        return data
 
-    def _configure_interfaces_lan(self) -> None:
-        data = {
-            "data": {
-                "ipaddr": "10.15.20.1",
-                "ifname": ["eth0", "eth1"],
-            }
+    def get_status(self) -> dict:
+        interfaces, wireless = self.read_status(
+            [RUTX11HTTPCommands.INTERFACES_STATUS, RUTX11HTTPCommands.WIRELESS_INTERFACES_STATUS]
+        )
+        if interfaces is None:
+            raise Exception("Failed to get interfaces status")
+        if wireless is None:
+            raise Exception("Failed to get wireless interfaces status")
+
+        return {
+            "interfaces": interfaces,
+            "wireless_interfaces": wireless,
+            "internet": self.check_internet_connection(),
         }
 
-        success, _ = self._request_put(RUTX11HTTPCommands.INTERFACES_LAN, data)
-        if not success:
-            click.secho("Failed to configure LAN interface.", fg="red")
-            return
+    def read_status(self, commands: list[str]) -> list:
+        # Status endpoints are read in parallel over the pooled connections, data of an endpoint
+        # that failed is None
+        def read(command: str):
+            success, response = self._request_get(command)
+            return response.json()["data"] if success else None
 
-        print("LAN interface configured successfully")
+        with ThreadPoolExecutor(max_workers=min(len(commands), self._pool_size)) as executor:
+            return list(executor.map(read, commands))
 
-    def _configure_firewall(self):
-        data = {"data": {"network": ["wan", "wan6", "mob1s1a1", "mob1s2a1", "wwan"]}}
+    def check_internet_connection(self) -> bool:
+        host, port = self._internet_check_target
+        return self._probe(host, port)
+
+    def wait_for_internet_connection(self, timeout: float = 180.0) -> bool:
+        start_time = time.monotonic()
+        delay = 0.25
+        while not self.check_internet_connection():
+            remaining = timeout - (time.monotonic() - start_time)
+            if remaining <= 0:
+                return False
 
-        success, _ = self._request_put(RUTX11HTTPCommands.FIREWALL_ZONES_ID3, data)
-        if not success:
-            click.secho("Failed to configure firewall.", fg="red")
-            return
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 5.0)
 
-        print("Firewall configured successfully")
+        return True
 
-    def _configure_ntp_client(self) -> None:
-        data = {
-            "data": {
-                "enabled": "1",
-                "zoneName": "Europe/Warsaw",
-                "interval": "86400",
-                "sync_enabled": "1",
-            }
-        }
+    def wait_for_wifi_connection(
+        self,
+        ssid: str,
+        timeout: float = 180.0,
+        on_stage: Callable[[str], None] | None = None,
+    ) -> None:
+        stages = [
+            WiFiConnectionStage.ASSOCIATING,
+            WiFiConnectionStage.ASSOCIATED,
+            WiFiConnectionStage.DHCP_LEASE,
+            WiFiConnectionStage.INTERNET,
+        ]
+        reported = 0
+
+        start_time = time.monotonic()
+        delay = 0.25
+        while True:
+            stage = self._wifi_connection_stage(ssid)
+            for reached in stages[reported : stages.index(stage) + 1]:
+                if on_stage is not None:
+                    on_stage(reached)
+            reported = max(reported, stages.index(stage) + 1)
+
+            if stage == WiFiConnectionStage.INTERNET:
+                return
 
-        success, _ = self._request_put(RUTX11HTTPCommands.NTP_NTP_CLIENT, data)
-        if not success:
-            click.secho("Failed to configure NTP client.", fg="red")
-            return
+            remaining = timeout - (time.monotonic() - start_time)
+            if remaining <= 0:
+                raise Exception(f"Timed out in stage '{stages[reported - 1]}' for {ssid}")
 
-        print("NTP client configured successfully")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 5.0)
 
-    def _configure_gps(self) -> None:
-        data = {
-            "data": {
-                "enabled": "1",
-                "galileo_sup": "1",
-                "glonass_sup": "1",  # in script value is 7, but api accepts 0 or 1
-                "beidou_sup": "1",  # in script value is 3, but api accepts 0 or 1
-            }
-        }
+    def invalidate_cache(self) -> None:
+        # Configuration changed by other clients, e.g. the web interface, is read again
+        with self._cache_lock:
+            self._cache.clear()
+
+    def close(self) -> None:
+        self._session.close()
 
-        success, _ = self._request_put(RUTX11HTTPCommands.GPS_GLOBAL, data)
+    def _set_qos_enabled(self, enabled: dict[str, str]) -> None:
+        data = [{"id": id, "enabled": state} for id, state in enabled.items()]
+        success, _ = self._request_put(RUTX11HTTPCommands.QOS_INTERFACES, {"data": data})
         if not success:
-            click.secho("Failed to configure GPS.", fg="red")
-            return
+            raise Exception("Failed to switch QoS")
+
+    def _measure_under_load(
+        self, load_target: tuple[str, int], duration: float, streams: int, probe_interval: float
+    ) -> dict:
+        stop = threading.Event()
+        sent = [0] * streams
+
+        def upload(index: int) -> None:
+            chunk = bytes(65536)
+            with socket.create_connection(load_target, timeout=self._timeout) as connection:
+                connection.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, DSCP_CS1 << 2)
+                while not stop.is_set():
+                    connection.sendall(chunk)
+                    sent[index] += len(chunk)
+
+        start_time = time.monotonic()
+        with ThreadPoolExecutor(max_workers=streams) as executor:
+            uploads = [executor.submit(upload, index) for index in range(streams)]
+            try:
+                # Queues fill up within the first second of the upload
+                time.sleep(1.0)
+                result = self._measure_control_rtt(duration, probe_interval)
+            finally:
+                stop.set()
+            for future in uploads:
+                future.result()
+
+        result["upload_bps"] = sum(sent) * 8 / (time.monotonic() - start_time)
+        return result
+
+    def _measure_control_rtt(self, duration: float, probe_interval: float) -> dict:
+        rtts = []
+        lost = 0
+        end_time = time.monotonic() + duration
+        while time.monotonic() < end_time:
+            probe_time = time.monotonic()
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+                    probe.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, DSCP_EF << 2)
+                    probe.settimeout(1.0)
+                    probe.connect(self._internet_check_target)
+                rtts.append(time.monotonic() - probe_time)
+            except OSError:
+                lost += 1
+            time.sleep(max(0.0, probe_interval - (time.monotonic() - probe_time)))
+
+        rtts.sort()
+        return {
+            "probes": len(rtts) + lost,
+            "lost": lost,
+            "rtt_median": _median(rtts),
+            "rtt_p95": rtts[min(len(rtts) - 1, int(len(rtts) * 0.95))] if rtts else None,
+            "rtt_max": rtts[-1] if rtts else None,
+        }
 
-        print("GPS configured successfully")
+    def _watch_failover(
+        self, uplink: str, online: bool, timeout: float, probe_interval: float
+    ) -> tuple[float, float]:
+        # Returns the time until the router reports the uplink in the expected state and the
+        # total time the internet was unreachable until then, at the resolution of probe_interval
+        state = "online" if online else "offline"
+        start_time = time.monotonic()
+        last_probe_time = start_time
+        outage = 0.0
+        detection = None
+        while True:
+            reachable = self.check_internet_connection()
+            probe_time = time.monotonic()
+            if not reachable:
+                outage += probe_time - last_probe_time
+            last_probe_time = probe_time
+
+            if detection is None:
+                success, response = self._request_get(
+                    RUTX11HTTPCommands.FAILOVER_INTERFACES_STATUS
+                )
+                statuses = response.json()["data"] if success else []
+                if any(
+                    status.get("id") == uplink and status.get("status") == state
+                    for status in statuses
+                ):
+                    detection = time.monotonic() - start_time
+
+            if detection is not None and reachable:
+                return detection, outage
+
+            if probe_time - start_time > timeout:
+                raise Exception(
+                    f"{uplink} is not {state} with internet reachable after {timeout:.0f} s"
+                )
 
-    def _configure_nmea(self) -> None:
-        data = {
-            "data": {
-                "enabled": "1",
-                "port": "5000",
-                "proto": "udp",
-                "hostname": "10.15.20.2",
-            }
+            time.sleep(max(0.0, probe_interval - (time.monotonic() - probe_time)))
+
+    def _online_uplinks(self) -> list[str]:
+        # Uplinks reported online by failover, from the one the router currently uses
+        success, config = self._get_data(RUTX11HTTPCommands.FAILOVER_INTERFACES)
+        if not success:
+            raise Exception("Failed to get failover interfaces")
+        success, response = self._request_get(RUTX11HTTPCommands.FAILOVER_INTERFACES_STATUS)
+        if not success:
+            raise Exception("Failed to get failover status")
+
+        online = {
+            status.get("id")
+            for status in response.json()["data"]
+            if status.get("status") == "online"
         }
-        success, _ = self._request_put(RUTX11HTTPCommands.GPS_NMEA_NMEA_FORWARDING, data)
+        entries = sorted(config, key=lambda entry: int(entry.get("metric") or 0))
+        return [entry["id"] for entry in entries if entry["id"] in online]
+
+    def _uplink_network(self, uplink: str) -> str:
+        # Name of the network the uplink is connected to, the path MTU is cached for it
+        if uplink == "wwan":
+            status = self.read_status([RUTX11HTTPCommands.WIRELESS_INTERFACES_STATUS])[0] or []
+            for iface in status:
+                if iface.get("mode") in ["multi_ap", "sta"] and iface.get("ssid"):
+                    return f"wwan/{iface['ssid']}"
+        elif uplink.startswith("mob"):
+            modems = self.read_status([RUTX11HTTPCommands.MODEMS_STATUS])[0] or []
+            if modems and modems[0].get("operator"):
+                return f"{uplink}/{modems[0]['operator']}"
+
+        return uplink
+
+    def _probe_uplink_mtu(self, uplink: str, timeout: float) -> int:
+        endpoint = f"{RUTX11HTTPCommands.INTERFACES}/{uplink}"
+        success, config = self._get_data(endpoint)
         if not success:
-            click.secho("Failed to configure NMEA.", fg="red")
-            return
+            raise Exception(f"Failed to get {uplink} interface")
+
+        # The MTU of the interface caps the probe, it may have been tuned on a worse network.
+        # The original MTU is kept unless the probe succeeds and a new one is written.
+        original_mtu = config.get("mtu")
+        reset_mtu = bool(original_mtu) and int(original_mtu) < MAX_MTU
+        preferred = []
+        probed = False
+        try:
+            if reset_mtu and not self._request_put(endpoint, {"data": {"mtu": str(MAX_MTU)}})[0]:
+                reset_mtu = False
+                raise Exception(f"Failed to reset MTU of {uplink}")
+
+            # Uplinks preferred over the probed one are disabled until the probe is done
+            online = self._online_uplinks()
+            if uplink not in online:
+                raise Exception(f"{uplink} is not online")
+            preferred = online[: online.index(uplink)]
+
+            for other in preferred:
+                print(f"Disabling {other}")
+                success, _ = self._request_put(
+                    f"{RUTX11HTTPCommands.INTERFACES}/{other}", {"data": {"enabled": "0"}}
+                )
+                if not success:
+                    raise Exception(f"Failed to disable {other}")
+
+            start_time = time.monotonic()
+            while self._online_uplinks()[:1] != [uplink]:
+                if time.monotonic() - start_time > timeout:
+                    raise Exception(f"Router did not switch to {uplink} in {timeout:.0f} s")
+                time.sleep(0.5)
+            if not self.wait_for_internet_connection(timeout):
+                raise Exception(f"Internet is not reachable over {uplink}")
+
+            print(f"Probing path MTU over {uplink}")
+            path_mtu = probe_path_mtu(self._internet_check_target)
+            probed = True
+            return path_mtu
+        finally:
+            if reset_mtu and not probed:
+                print(f"Restoring MTU {original_mtu} of {uplink}")
+                if not self._request_put(endpoint, {"data": {"mtu": original_mtu}})[0]:
+                    click.secho(f"Failed to restore MTU of {uplink}", fg="red")
+            for other in preferred:
+                print(f"Enabling {other}")
+                success, _ = self._request_put(
+                    f"{RUTX11HTTPCommands.INTERFACES}/{other}", {"data": {"enabled": "1"}}
+                )
+                if not success:
+                    click.secho(f"Failed to enable {other}", fg="red")
+
+    def _reorder_wifi_networks(self, networks: list[dict], ranked_ssids: list[str]) -> None:
+        # Items can not be moved within a collection, so copies are created in the new order
+        # after the existing ones, which are removed only once all copies exist
+        masked = [
+            network["ssid"]
+            for network in networks
+            if network.get("encryption") != "none" and not (network.get("key") or "").strip("*")
+        ]
+        if masked:
+            raise Exception(
+                "Passwords of WiFi networks are not readable, they can not be reordered: "
+                + ", ".join(masked)
+            )
 
-        data = {
-            "data": [
-                {
-                    "id": id,
-                    "forwarding_enabled": "1",
-                    "forwarding_interval": "1",
-                }
-                for id in [
-                    "GPGSV",
-                    "GPGGA",
-                    "GPVTG",
-                    "GPRMC",
-                    "GPGSA",
-                    "GLGSV",
-                    "GNGSA",
-                    "GNGNS",
-                    "GAGSV",
-                    "PQGSV",
-                    "PQGSA",
-                ]
-            ]
+        by_ssid = {network["ssid"]: network for network in networks}
+        ranked = [
+            {key: value for key, value in by_ssid[ssid].items() if key != "id"}
+            for ssid in ranked_ssids
+        ]
+        success, response = self._request_post(
+            RUTX11HTTPCommands.WIRELESS_MULTI_AP, {"data": ranked}
+        )
+        if not success:
+            raise Exception("Failed to add WiFi networks in the new order")
+
+        success, _ = self._request_delete(
+            RUTX11HTTPCommands.WIRELESS_MULTI_AP, {"data": [network["id"] for network in networks]}
+        )
+        if not success:
+            # The copies go, so the networks are left as they were
+            created = [network["id"] for network in response.json()["data"]]
+            if not self._request_delete(RUTX11HTTPCommands.WIRELESS_MULTI_AP, {"data": created})[0]:
+                click.secho("Failed to remove copies of WiFi networks", fg="red")
+            raise Exception("Failed to remove WiFi networks in the previous order")
+
+    def _enable_wifi_networks(self, ids: list[str], networks: list[dict]) -> None:
+        data = [
+            {"id": network["id"], "enabled": "1" if network["id"] in ids else "0"}
+            for network in networks
+        ]
+        success, _ = self._request_put(RUTX11HTTPCommands.WIRELESS_MULTI_AP, {"data": data})
+        if not success:
+            raise Exception("Failed to enable WiFi networks")
+
+    def _measure_uplink(self, ssid: str, timeout: float, throughput_url: str) -> dict:
+        # Times of the stages are as precise as polling in wait_for_wifi_connection
+        start_time = time.monotonic()
+        stage_times = {}
+
+        def on_stage(stage: str) -> None:
+            stage_times[stage] = time.monotonic() - start_time
+
+        measurement = {
+            "time": time.time(),
+            "association_time": None,
+            "dhcp_time": None,
+            "rtt": None,
+            "throughput": None,
         }
+        try:
+            self.wait_for_wifi_connection(ssid, timeout=timeout, on_stage=on_stage)
+        except Exception as err:
+            click.secho(f"{ssid}: {err}", fg="yellow")
+            return measurement
+
+        measurement["association_time"] = stage_times.get(WiFiConnectionStage.ASSOCIATED)
+        measurement["dhcp_time"] = stage_times.get(WiFiConnectionStage.DHCP_LEASE)
+        measurement["rtt"] = self._measure_rtt()
+        measurement["throughput"] = self._measure_throughput(throughput_url)
+        return measurement
+
+    def _measure_rtt(self, samples: int = 5) -> float | None:
+        # Time of the TCP handshake with the internet check target is one round trip
+        rtts = []
+        for _ in range(samples):
+            start_time = time.monotonic()
+            if self._probe(*self._internet_check_target):
+                rtts.append(time.monotonic() - start_time)
+        return _median(rtts)
+
+    def _measure_throughput(
+        self, url: str, max_bytes: int = 2_000_000, max_time: float = 5.0
+    ) -> float | None:
+        # Download rate in bits per second, the probe stops after max_bytes or max_time
+        received = 0
+        start_time = time.monotonic()
+        try:
+            with requests.get(url, stream=True, timeout=self._timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=65536):
+                    received += len(chunk)
+                    if received >= max_bytes or time.monotonic() - start_time >= max_time:
+                        break
+        except requests.RequestException as err:
+            click.secho(f"Throughput probe failed: {err}", fg="yellow")
+            return None
+
+        elapsed = time.monotonic() - start_time
+        return received * 8 / elapsed if elapsed > 0 else None
+
+    def _create_session(self, pool_size: int, retries: int) -> requests.Session:
+        # POST is not retried by the adapter, so an object is never created twice on the router.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "PUT", "DELETE"],
+            raise_on_status=False,
+        )
+        adapter = _TimedHTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        return session
 
-        success, _ = self._request_put(RUTX11HTTPCommands.GPS_NMEA_RULES, data)
+    def _wifi_connection_stage(self, ssid: str) -> str:
+        success, response = self._request_get(RUTX11HTTPCommands.WIRELESS_INTERFACES_STATUS)
         if not success:
-            click.secho("Failed to configure NMEA rules.", fg="red")
-            return
+            return WiFiConnectionStage.ASSOCIATING
+
+        iface = None
+        for status in response.json()["data"]:
+            if status.get("mode") in ["multi_ap", "sta"] and status.get("ssid") == ssid:
+                iface = status
+                break
 
-        print("NMEA configured successfully")
+        if iface is None:
+            return WiFiConnectionStage.ASSOCIATING
 
-    def _configure_wireless_devices(self) -> None:
+        reason = str(iface.get("disconnect_reason", "")).lower()
+        if any(failure in reason for failure in ["auth", "wrong_key", "handshake"]):
+            raise Exception(f"Authentication to {ssid} failed. Check the password")
+
+        if _normalize(iface.get("up")) != "1":
+            return WiFiConnectionStage.ASSOCIATING
+
+        success, response = self._request_get(f"{RUTX11HTTPCommands.INTERFACES_STATUS}/wwan")
+        if not success or not _interface_address(response.json()["data"]):
+            return WiFiConnectionStage.ASSOCIATED
+
+        if not self.check_internet_connection():
+            return WiFiConnectionStage.DHCP_LEASE
+
+        return WiFiConnectionStage.INTERNET
+
+    def _device_address(self) -> tuple[str, int]:
+        host, _, port = self._device_ip.partition(":")
+        return host, int(port or 443)
+
+    def _is_available(self, attempts: int = 3) -> bool:
+        delay = 0.2
+        for attempt in range(attempts):
+            if self._probe(*self._device_address()):
+                return True
+            if attempt < attempts - 1:
+                time.sleep(delay)
+                delay *= 2
+
+        return False
+
+    def _probe(self, host: str, port: int) -> bool:
+        # A TCP connection is enough to tell the host is reachable, and unlike ICMP it requires
+        # neither the ping binary nor raw socket privileges.
+        try:
+            with socket.create_connection((host, port), timeout=self._probe_timeout):
+                return True
+        except OSError:
+            return False
+
+    def _login(self) -> None:
+        url = self._request_url + RUTX11HTTPCommands.LOGIN
         data = {
-            "data": [
-                {
-                    "id": id,
-                    "channel": "auto",
-                }
-                for id in ["radio0", "radio1"]
-            ]
+            "username": self._username,
+            "password": self._password,
         }
 
-        success, _ = self._request_put(RUTX11HTTPCommands.WIRELESS_DEVICES, data)
-        if not success:
-            click.secho("Failed to configure wireless devices.", fg="red")
-            return
+        response = self._timed_request("POST", url, data)
+        if response.status_code != 200:
+            click.secho(f"Failed to connect: {json.dumps(response.json(), indent=2)}", fg="red")
+            raise Exception(f"Failed to connect")
 
-        data = {"data": {"country": "PL"}}
+        login_data = response.json()["data"]
+        self._set_token(login_data["token"])
+        if self._token_cache is not None:
+            self._token_cache.set(
+                self._token_cache_key,
+                login_data["token"],
+                float(login_data.get("expires", 299)),
+                self._password,
+            )
+        print("Logged in successfully")
+
+    def _set_token(self, token: str) -> None:
+        self._token = token
+        self._session.headers["Authorization"] = "Bearer " + token
+
+    def _get_data(self, command: str, max_age: float = 0.0) -> tuple[bool, dict | list | None]:
+        # Read-through cache of configuration, returned data must not be modified by the caller.
+        # Data younger than max_age is returned without a request, older data is revalidated
+        # with its ETag. Plain reads accept cached data, the first read of a plan or of a
+        # verification of writes always asks the router. Status endpoints change on their own
+        # and are read with _request_get.
+        with self._cache_lock:
+            entry = self._cache.get(command)
 
-        success, _ = self._request_put(RUTX11HTTPCommands.WIRELESS_DEVICES_GLOBAL, data)
+        if entry is not None and time.monotonic() - entry[2] < max_age:
+            return True, entry[0]
+
+        headers = {"If-None-Match": entry[1]} if entry is not None and entry[1] else None
+        success, response = self._request_get(command, headers)
         if not success:
-            click.secho("Failed to configure wireless devices.", fg="red")
-            return
+            return False, None
+
+        if response.status_code == 304:
+            data = entry[0]
+        else:
+            data = response.json()["data"]
+
+        with self._cache_lock:
+            self._cache[command] = (data, response.headers.get("ETag"), time.monotonic())
+
+        return True, data
+
+    def _invalidate_cache(self, command: str) -> None:
+        with self._cache_lock:
+            for cached in list(self._cache):
+                if _affected_by(cached, [command]):
+                    del self._cache[cached]
+
+    def _send(
+        self, method: str, url: str, data: dict | None = None, headers: dict | None = None
+    ) -> requests.Response:
+        token = self._token
+        response = self._timed_request(method, url, data, headers)
+        if response.status_code != 401:
+            return response
+
+        # The token expired or was revoked by the router, log in again and retry once. When
+        # concurrent requests hit this at once only the first one logs in.
+        with self._login_lock:
+            if self._token == token:
+                if self._token_cache is not None:
+                    self._token_cache.invalidate(self._token_cache_key, token)
+                self._login()
+
+        return self._timed_request(method, url, data, headers)
+
+    def _timed_request(
+        self, method: str, url: str, data: dict | None, headers: dict | None = None
+    ) -> requests.Response:
+        _trace_context.connect = 0.0
+        _trace_context.tls = 0.0
+        _trace_context.server = 0.0
+
+        start_time = time.perf_counter()
+        response = self._session.request(
+            method, url, json=data, headers=headers, timeout=self._timeout, verify=False
+        )
+        total = time.perf_counter() - start_time
 
-        print("Wireless devices configured successfully")
+        if self._trace is not None:
+            retries = getattr(response.raw, "retries", None)
+            self._trace.record(
+                {
+                    "timestamp": time.time(),
+                    "step": getattr(_trace_context, "step", ""),
+                    "method": method,
+                    "endpoint": url.removeprefix(self._request_url),
+                    "request_bytes": len(response.request.body or b""),
+                    "response_bytes": len(response.content),
+                    "status": response.status_code,
+                    # The router is addressed by IP, so connecting involves no name resolution
+                    "connect": round(_trace_context.connect, 6),
+                    "tls": round(_trace_context.tls, 6),
+                    "server": round(_trace_context.server, 6),
+                    "total": round(total, 6),
+                    "retries": len(retries.history) if retries is not None else 0,
+                    "new_connection": _trace_context.connect > 0,
+                }
+            )
 
-    def _configure_wireless_interfaces(self) -> None:
+        return response
+
+    def _target_config(self) -> list[ConfigSection]:
+        # Besides the Multi AP interface releasing wwan, sections writing to the same config
+        # package (network, wireless, gps, dhcp) depend on each other, so that the router does
+        # not apply two concurrent changes of one package.
         prefix = "Lynx_" if self._robot_model == "LNX" else "Panther_"
 
-        data = {
-            "data": [
+        return [
+            ConfigSection(
+                "dhcp",
+                "DHCP",
+                RUTX11HTTPCommands.DHCP_SERVER_LAN,
+                {"leasetime": "12h"},
+            ),
+            ConfigSection(
+                "interfaces_wan",
+                "WAN interface",
+                RUTX11HTTPCommands.INTERFACES,
+                [
+                    {
+                        "id": id,
+                        "enabled": "0",
+                        "ifname": [],
+                    }
+                    for id in ["wan", "wan6"]
+                ],
+            ),
+            ConfigSection(
+                "interfaces_wwan",
+                "WWAN interface",
+                RUTX11HTTPCommands.INTERFACES,
                 {
-                    "id": "default_radio0",
-                    "ssid": prefix + self._robot_serial_number,
-                    "key": "husarion",
+                    "area_type": "wan",
+                    "id": "wwan",
+                    "metric": "2",
+                    "proto": "dhcp",
+                    "name": "wwan",
                 },
+                kind=ConfigSection.CREATE,
+                match={"id": "wwan"},
+                # Multi AP has to release wwan first. Removing it also removes the wwan interface
+                # so there is no need to do that after.
+                prepare=self._remove_multi_ap_interface,
+                depends_on=("interfaces_wan",),
+            ),
+            ConfigSection(
+                "interfaces_lan",
+                "LAN interface",
+                RUTX11HTTPCommands.INTERFACES_LAN,
                 {
-                    "id": "default_radio1",
-                    "ssid": prefix + "5G_" + self._robot_serial_number,
-                    "key": "husarion",
+                    "ipaddr": "10.15.20.1",
+                    "ifname": ["eth0", "eth1"],
                 },
-            ]
-        }
-
-        success, _ = self._request_put(RUTX11HTTPCommands.WIRELESS_INTERFACES, data)
-        if not success:
-            click.secho("Failed to configure wireless interfaces.", fg="red")
-            return
-
-        print("Wireless interfaces configured successfully")
+                depends_on=("interfaces_wwan",),
+                requires_reboot=True,
+            ),
+            ConfigSection(
+                "firewall",
+                "Firewall",
+                RUTX11HTTPCommands.FIREWALL_ZONES_ID3,
+                {"network": ["wan", "wan6", "mob1s1a1", "mob1s2a1", "wwan"]},
+                depends_on=("interfaces_wwan",),
+            ),
+            self._failover_section(self._failover_profile),
+            *self._qos_sections(self._qos_profile),
+            ConfigSection(
+                "ntp_client",
+                "NTP client",
+                RUTX11HTTPCommands.NTP_NTP_CLIENT,
+                {
+                    "enabled": "1",
+                    "zoneName": "Europe/Warsaw",
+                    "interval": "86400",
+                    "sync_enabled": "1",
+                },
+            ),
+            ConfigSection(
+                "gps",
+                "GPS",
+                RUTX11HTTPCommands.GPS_GLOBAL,
+                {
+                    "enabled": "1",
+                    "galileo_sup": "1",
+                    "glonass_sup": "1",  # in script value is 7, but api accepts 0 or 1
+                    "beidou_sup": "1",  # in script value is 3, but api accepts 0 or 1
+                },
+                # Constellations are applied by the modem when it starts
+                requires_reboot=True,
+            ),
+            ConfigSection(
+                "nmea_forwarding",
+                "NMEA",
+                RUTX11HTTPCommands.GPS_NMEA_NMEA_FORWARDING,
+                {
+                    "enabled": "1",
+                    "port": "5000",
+                    "proto": "udp",
+                    "hostname": "10.15.20.2",
+                },
+            ),
+            ConfigSection(
+                "nmea_rules",
+                "NMEA rules",
+                RUTX11HTTPCommands.GPS_NMEA_RULES,
+                [
+                    {
+                        "id": id,
+                        "forwarding_enabled": "1" if id in self._nmea_sentences else "0",
+                        "forwarding_interval": str(self._nmea_interval),
+                    }
+                    for id in NMEA_SENTENCES
+                ],
+                depends_on=("nmea_forwarding",),
+            ),
+            self._wireless_devices_section(self._wireless_channels),
+            ConfigSection(
+                "wireless_devices_global",
+                "Wireless devices global settings",
+                RUTX11HTTPCommands.WIRELESS_DEVICES_GLOBAL,
+                {"country": "PL"},
+                depends_on=("wireless_devices",),
+                # Regulatory domain is loaded with the wireless drivers
+                requires_reboot=True,
+            ),
+            ConfigSection(
+                "wireless_interfaces",
+                "Wireless interfaces",
+                RUTX11HTTPCommands.WIRELESS_INTERFACES,
+                [
+                    {
+                        "id": "default_radio0",
+                        "ssid": prefix + self._robot_serial_number,
+                        "key": "husarion",
+                    },
+                    {
+                        "id": "default_radio1",
+                        "ssid": prefix + "5G_" + self._robot_serial_number,
+                        "key": "husarion",
+                    },
+                ],
+                depends_on=("wireless_devices_global",),
+            ),
+            ConfigSection(
+                "multi_ap_interface",
+                "Multi AP interface",
+                RUTX11HTTPCommands.WIRELESS_INTERFACES,
+                {
+                    "id": "wifi-iface",
+                    "network": "wwan",
+                    "device": ["radio1"],
+                    "mode": "multi_ap",
+                    "enabled": "1",
+                    "scan_time": "30",
+                },
+                kind=ConfigSection.CREATE,
+                match={"mode": "multi_ap"},
+                prepare=self._remove_multi_ap_interface,
+                reapply_after=("interfaces_wwan",),
+                depends_on=("interfaces_wwan", "wireless_interfaces"),
+            ),
+            ConfigSection(
+                "static_leases",
+                "Static leases",
+                RUTX11HTTPCommands.DHCP_STATIC_LEASES,
+                kind=ConfigSection.CLEAR,
+                depends_on=("dhcp",),
+            ),
+        ]
+
+    def _wireless_devices_section(self, channels: dict[str, dict] | None) -> ConfigSection:
+        # Channels are chosen by the router unless a channel plan gives channel and htmode.
+        # Radios a plan leaves out, e.g. the one connected to a WiFi uplink, are not changed.
+        if channels is None:
+            channels = {id: {"channel": "auto"} for id in ["radio0", "radio1"]}
+        return ConfigSection(
+            "wireless_devices",
+            "Wireless devices",
+            RUTX11HTTPCommands.WIRELESS_DEVICES,
+            [{"id": id, **channels[id]} for id in ["radio0", "radio1"] if id in channels],
+        )
 
-    def _configure_multi_ap_interface(self) -> None:
-        self._remove_multi_ap_interface()
+    def _qos_sections(self, profile: QoSProfile) -> list[ConfigSection]:
+        # Classes and rules are created by name, so they are matched by name and not by the
+        # identifiers the router assigns to them
+        sections = [
+            ConfigSection(
+                "qos_interfaces",
+                "QoS interfaces",
+                RUTX11HTTPCommands.QOS_INTERFACES,
+                profile.interfaces_config(),
+                # QoS entry of wwan is created by the router together with the interface
+                depends_on=("interfaces_wwan",),
+            )
+        ]
+        for config in profile.classes_config():
+            sections.append(
+                ConfigSection(
+                    f"qos_class_{config['name']}",
+                    f"QoS class {config['name']}",
+                    RUTX11HTTPCommands.QOS_CLASSES,
+                    config,
+                    kind=ConfigSection.CREATE,
+                    match={"name": config["name"]},
+                )
+            )
+        for config in profile.rules_config():
+            sections.append(
+                ConfigSection(
+                    f"qos_rule_{config['name']}",
+                    f"QoS rule {config['name']}",
+                    RUTX11HTTPCommands.QOS_RULES,
+                    config,
+                    kind=ConfigSection.CREATE,
+                    match={"name": config["name"]},
+                    depends_on=(f"qos_class_{config['target']}",),
+                )
+            )
 
-        data = {
-            "data": {
-                "id": "wifi-iface",
-                "network": "wwan",
-                "device": ["radio1"],
-                "mode": "multi_ap",
-                "enabled": "1",
-                "scan_time": "30",
-            }
-        }
+        # Classes and rules of a previous profile are removed, rules first, as a class can not
+        # be removed while a rule points to it
+        sections += [
+            ConfigSection(
+                "qos_rules_stale",
+                "Stale QoS rules",
+                RUTX11HTTPCommands.QOS_RULES,
+                kind=ConfigSection.CLEAR,
+                keep=[{"name": config["name"]} for config in profile.rules_config()],
+            ),
+            ConfigSection(
+                "qos_classes_stale",
+                "Stale QoS classes",
+                RUTX11HTTPCommands.QOS_CLASSES,
+                kind=ConfigSection.CLEAR,
+                keep=[{"name": config["name"]} for config in profile.classes_config()],
+                depends_on=("qos_rules_stale",),
+            ),
+        ]
+        return sections
+
+    def _failover_section(self, profile: FailoverProfile) -> ConfigSection:
+        return ConfigSection(
+            "failover",
+            "Failover",
+            RUTX11HTTPCommands.FAILOVER_INTERFACES,
+            profile.to_config(),
+            # Failover entry of wwan is created by the router together with the interface
+            depends_on=("interfaces_wwan",),
+        )
 
-        success, _ = self._request_post(RUTX11HTTPCommands.WIRELESS_INTERFACES, data)
-        if not success:
-            click.secho("Failed to configure Multi AP interface.", fg="red")
-            return
+    def _read_state(self, sections: list[ConfigSection], concurrency: int) -> dict:
+        # Several sections share an endpoint, each one is read only once
+        endpoints = list(dict.fromkeys(section.endpoint for section in sections))
+        self._state_read_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return dict(zip(endpoints, executor.map(self._read_data, endpoints)))
+
+    def _plan(
+        self, sections: list[ConfigSection], concurrency: int, current_state: dict | None = None
+    ) -> list[ConfigChange]:
+        if current_state is None:
+            current_state = self._read_state(sections, concurrency)
+
+        plan = []
+        created = set()
+
+        for section in sections:
+            current = current_state[section.endpoint]
+            if current is None:
+                click.secho(
+                    f"Unable to read {section.description}, it will be fully rewritten",
+                    fg="yellow",
+                )
 
-        print("Multi AP interface configured successfully")
+            change = self._diff_section(section, current)
+            if created.intersection(section.reapply_after):
+                change = ConfigChange(section, "POST", section.endpoint, {"data": section.data})
+
+            if change is not None:
+                plan.append(change)
+                if change.method == "POST":
+                    created.add(section.name)
+
+        return plan
+
+    def _read_data(self, command: str):
+        with _trace_step("plan"):
+            _, data = self._get_data(command)
+        return data
+
+    def _get_planned_data(self, command: str) -> tuple[bool, dict | list | None]:
+        # Steps applying a plan reuse data read since the state of the plan was read, writes
+        # made by the plan invalidate the endpoints they change
+        return self._get_data(command, time.monotonic() - self._state_read_at)
+
+    def _apply_plan(self, plan: list[ConfigChange], concurrency: int) -> dict[str, bool]:
+        # Changes waiting for each other would never be started
+        if _has_cycle(plan):
+            names = [section.name for change in plan for section in change.sections]
+            raise Exception(f"Dependency cycle between sections {', '.join(names)}")
+
+        pending = list(plan)
+        running = {}
+        results = {}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while pending or running:
+                unfinished = {
+                    section.name
+                    for change in pending + list(running.values())
+                    for section in change.sections
+                }
+                for change in list(pending):
+                    # Dependencies outside of the plan are already in place on the router
+                    names = {section.name for section in change.sections}
+                    blocked = [
+                        dependency
+                        for section in change.sections
+                        for dependency in section.depends_on
+                        if dependency in unfinished and dependency not in names
+                    ]
+                    if not blocked:
+                        pending.remove(change)
+                        running[executor.submit(self._apply_change, change)] = change
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+                    results.update(future.result())
+
+        return results
+
+    def _diff_section(self, section: ConfigSection, current) -> ConfigChange | None:
+        if section.kind == ConfigSection.CLEAR:
+            ids = [
+                item["id"]
+                for item in current or []
+                if not any(
+                    all(item.get(key) == value for key, value in keep.items())
+                    for keep in section.keep
+                )
+            ]
+            if not ids:
+                return None
+            return ConfigChange(section, "DELETE", section.endpoint, {"data": ids})
+
+        if section.kind == ConfigSection.CREATE:
+            existing = None
+            for item in current or []:
+                if all(item.get(key) == value for key, value in section.match.items()):
+                    existing = item
+                    break
+
+            if existing is None:
+                return ConfigChange(section, "POST", section.endpoint, {"data": section.data})
+
+            # Identifiers of created objects are assigned by the router
+            desired = {key: value for key, value in section.data.items() if key != "id"}
+            diff = _diff_object(existing, desired)
+            if not diff:
+                return None
+            endpoint = f"{section.endpoint}/{existing['id']}"
+            return ConfigChange(section, "PUT", endpoint, {"data": diff})
+
+        if isinstance(section.data, list):
+            diff = _diff_items(current if isinstance(current, list) else [], section.data)
+        else:
+            diff = _diff_object(current if isinstance(current, dict) else {}, section.data)
+
+        if not diff:
+            return None
+        return ConfigChange(section, "PUT", section.endpoint, {"data": diff})
+
+    def _apply_change(self, change: ConfigChange) -> dict[str, bool]:
+        if self._journal is not None:
+            for section in change.sections:
+                self._journal.mark(section.name, OperationJournal.IN_PROGRESS)
 
-    def _configure_static_leases(self) -> None:
-        success, response = self._request_get(RUTX11HTTPCommands.DHCP_STATIC_LEASES)
+        try:
+            with _trace_step(",".join(section.name for section in change.sections)):
+                if change.method == "POST" and change.section.prepare is not None:
+                    change.section.prepare()
+
+                if change.method == "POST":
+                    success, response = self._request_post(change.endpoint, change.data)
+                elif change.method == "DELETE":
+                    success, response = self._request_delete(change.endpoint, change.data)
+                else:
+                    success, response = self._request_put(change.endpoint, change.data)
+        except Exception:
+            if self._journal is not None:
+                for section in change.sections:
+                    self._journal.mark(section.name, OperationJournal.FAILED)
+            raise
+
+        failed = set()
         if not success:
-            click.secho("Failed to get static leases.", fg="red")
-            return
-
-        if response.json()["data"]:
-            data_delete = {"data": [lease["id"] for lease in response.json()["data"]]}
-            success, _ = self._request_delete(RUTX11HTTPCommands.DHCP_STATIC_LEASES, data_delete)
-            if not success:
-                click.secho("Failed to delete static leases.", fg="red")
-                return
+            failed = {section.name for section in change.sections}
+            # Errors of a list request point to the items that failed, the other items are
+            # applied by the router
+            try:
+                errors = response.json().get("errors") or []
+            except ValueError:
+                errors = []
+            item_failures = {
+                change.item_sections.get(error.get("section") or error.get("id"))
+                for error in errors
+            }
+            if item_failures and None not in item_failures:
+                failed = item_failures
+
+        results = {}
+        for section in change.sections:
+            results[section.name] = section.name not in failed
+            if section.name in failed:
+                click.secho(f"Failed to configure {section.description}.", fg="red")
+            else:
+                print(f"{section.description} configured successfully")
+                if section.requires_reboot:
+                    self.reboot_required = True
+
+            if self._journal is not None:
+                failed_section = section.name in failed
+                self._journal.mark(
+                    section.name,
+                    OperationJournal.FAILED if failed_section else OperationJournal.APPLIED,
+                )
 
-        print("Static leases configured successfully")
+        return results
 
     def _remove_multi_ap_interface(self) -> None:
-        success, response = self._request_get(RUTX11HTTPCommands.WIRELESS_INTERFACES)
+        success, ifaces = self._get_planned_data(RUTX11HTTPCommands.WIRELESS_INTERFACES)
         if not success:
             click.secho("Failed to get wireless interfaces.", fg="red")
             return
 
-        for iface in response.json()["data"]:
+        for iface in ifaces:
             if iface["mode"] == "multi_ap":
                 print("Deleting existing Multi AP interface")
                 success, _ = self._request_delete(
@@ -443,12 +2856,13 @@ class RUTX11Manager:
                     return
                 break
 
-    def _request_get(self, command: str) -> tuple[bool, requests.Response]:
+    def _request_get(
+        self, command: str, headers: dict | None = None
+    ) -> tuple[bool, requests.Response]:
         url = self._request_url + command
-        headers = {"Authorization": "Bearer " + self._token}
 
-        response = requests.get(url, headers=headers, verify=False)
-        if response.status_code != 200:
+        response = self._send("GET", url, headers=headers)
+        if response.status_code != 200 and response.status_code != 304:
             click.secho(
                 f"Failed to get data from {url}: {response.status_code} {response.reason}.",
                 fg="red",
@@ -460,9 +2874,9 @@ class RUTX11Manager:
 
     def _request_put(self, command: str, data: dict) -> tuple[bool, requests.Response]:
         url = self._request_url + command
-        headers = {"Authorization": "Bearer " + self._token}
 
-        response = requests.put(url, headers=headers, json=data, verify=False)
+        response = self._send("PUT", url, data)
+        self._invalidate_cache(command)
         if response.status_code != 200:
             click.secho(
                 f"Failed to put data for {url}: {response.status_code} {response.reason}.",
@@ -475,9 +2889,9 @@ class RUTX11Manager:
 
     def _request_post(self, command: str, data: dict) -> tuple[bool, requests.Response]:
         url = self._request_url + command
-        headers = {"Authorization": "Bearer " + self._token}
 
-        response = requests.post(url, headers=headers, json=data, verify=False)
+        response = self._send("POST", url, data)
+        self._invalidate_cache(command)
         if response.status_code != 200 and response.status_code != 201:
             click.secho(
                 f"Failed to post data for {url}: {response.status_code} {response.reason}.",
@@ -490,9 +2904,9 @@ class RUTX11Manager:
 
     def _request_delete(self, command: str, data: dict) -> requests.Response:
         url = self._request_url + command
-        headers = {"Authorization": "Bearer " + self._token}
 
-        response = requests.delete(url, headers=headers, json=data, verify=False)
+        response = self._send("DELETE", url, data)
+        self._invalidate_cache(command)
         if response.status_code != 200:
             click.secho(
                 f"Failed to delete object for {url}: {response.status_code} {response.reason}.",
@@ -504,33 +2918,126 @@ class RUTX11Manager:
         return True, response
 
 
-def main(args=None):
-    parser = argparse.ArgumentParser(description="RUTX11 Manager")
-    parser.add_argument(
-        "-i", "--device-ip", type=str, default="10.15.20.1", help="Device IP address"
+def _failover_profile(parsed_args: argparse.Namespace) -> FailoverProfile:
+    return FailoverProfile(
+        track_ips=parsed_args.failover_track_ips.split(","),
+        interval=parsed_args.failover_interval,
+        down=parsed_args.failover_down,
+        up=parsed_args.failover_up,
     )
-    parser.add_argument("-c", "--wifi-connect", action="store_true", help="Connect to WiFi")
-    parser.add_argument("-d", "--wifi-disconnect", action="store_true", help="Disconnect from WiFi")
-    parser.add_argument("-s", "--add-static-lease", action="store_true", help="Add static lease")
-    parser.add_argument("--restore-default", action="store_true", help="Restore default settings")
-    parsed_args = parser.parse_args(args)
+
+
+def _qos_profile(parsed_args: argparse.Namespace) -> QoSProfile:
+    bandwidth = {}
+    for entry in filter(None, (parsed_args.qos_bandwidth or "").split(",")):
+        interface, _, rates = entry.partition("=")
+        download, _, upload = rates.partition("/")
+        if not interface or not download.isdigit() or not upload.isdigit():
+            raise Exception(f"QoS bandwidth must be in INTERFACE=DOWNLOAD/UPLOAD format: {entry}")
+        bandwidth[interface] = (int(download), int(upload))
+
+    return QoSProfile(bandwidth=bandwidth)
+
+
+def _reboot(manager: RUTX11Manager, timeout: float) -> None:
+    print("Rebooting the router")
+    if not manager.reboot():
+        return
 
     try:
-        username = input("Enter the username: ")
-        password = getpass.getpass("Enter the password: ")
-        manager = RUTX11Manager(
-            username=username, password=password, device_ip=parsed_args.device_ip
-        )
+        manager.wait_until_ready(timeout)
     except Exception as err:
-        click.secho(f"Failed to create RUTX11Manager: {err}", fg="red")
+        click.secho(f"Failure: {err}", fg="red")
         return
 
+    print("Router is ready")
+
+
+def _run_commands(manager: RUTX11Manager, parsed_args: argparse.Namespace) -> None:
     if parsed_args.restore_default:
         print("Restoring default settings")
         robot_model = input("Enter the robot model (PTH/LNX): ")
         robot_serial_number = input("Enter the robot serial number: ")
-        manager.factory_reset(robot_model, robot_serial_number)
-        manager.reboot()
+        try:
+            manager.factory_reset(
+                robot_model,
+                robot_serial_number,
+                dry_run=parsed_args.dry_run,
+                nmea_sentences=parsed_args.nmea_sentences.split(","),
+                nmea_interval=parsed_args.nmea_interval,
+                failover_profile=_failover_profile(parsed_args),
+                qos_profile=_qos_profile(parsed_args),
+            )
+        except Exception as err:
+            click.secho(f"Failure: {err}", fg="red")
+            return
+
+        if parsed_args.dry_run:
+            return
+
+        if not manager.reboot_required:
+            print("Changes were applied without a reboot")
+            return
+
+        _reboot(manager, parsed_args.ready_timeout)
+        return
+
+    if parsed_args.snapshot:
+        robot_model = input("Enter the robot model (PTH/LNX): ")
+        robot_serial_number = input("Enter the robot serial number: ")
+        store = SnapshotStore()
+        try:
+            snapshot_id = manager.save_snapshot(
+                robot_model,
+                robot_serial_number,
+                store,
+                golden=parsed_args.set_golden,
+                nmea_sentences=parsed_args.nmea_sentences.split(","),
+                nmea_interval=parsed_args.nmea_interval,
+                failover_profile=_failover_profile(parsed_args),
+                qos_profile=_qos_profile(parsed_args),
+            )
+        except Exception as err:
+            click.secho(f"Failure: {err}", fg="red")
+            return
+
+        for command, hash in store.get(snapshot_id)["sections"].items():
+            print(f"{hash[:16]}  {command}")
+        print(f"Snapshot {snapshot_id} saved")
+        if parsed_args.set_golden:
+            print(f"Snapshot is the golden snapshot of {robot_model}")
+        return
+
+    if parsed_args.check_drift:
+        robot_model = input("Enter the robot model (PTH/LNX): ")
+        robot_serial_number = input("Enter the robot serial number: ")
+        try:
+            drifted = manager.check_drift(
+                robot_model, robot_serial_number, dry_run=parsed_args.dry_run
+            )
+        except Exception as err:
+            click.secho(f"Failure: {err}", fg="red")
+            return
+
+        if not drifted:
+            click.secho("Router configuration matches the golden snapshot", fg="green")
+            return
+
+        for drift in drifted:
+            if parsed_args.dry_run:
+                click.secho(f"{drift['endpoint']} differs", fg="yellow")
+            elif drift["restored"]:
+                print(f"{drift['endpoint']} restored ({', '.join(drift['sections'])})")
+            elif not drift["sections"]:
+                click.secho(
+                    f"{drift['endpoint']} differs and is not part of the default settings",
+                    fg="yellow",
+                )
+            else:
+                click.secho(f"{drift['endpoint']} still differs after restoring", fg="red")
+
+        if manager.reboot_required:
+            _reboot(manager, parsed_args.ready_timeout)
         return
 
     if parsed_args.wifi_disconnect:
@@ -552,21 +3059,104 @@ def main(args=None):
             click.secho(f"Failure: {err}", fg="red")
             return
 
-        start_time = time.time()
-        timeout = 180  # 3 minutes
         print("Waiting to establish an internet connection. This may take few minutes.")
-        while not manager.check_internet_connection():
-            time_diff = time.time() - start_time
-            if time_diff > timeout:
-                click.secho(
-                    "\nFailed to connect to the internet. Check SSID name and password", fg="red"
-                )
-                return
+        try:
+            manager.wait_for_wifi_connection(
+                ssid, timeout=180, on_stage=lambda stage: print(f"WiFi: {stage}")  # 3 minutes
+            )
+        except Exception as err:
+            click.secho(f"Failed to connect to the internet: {err}", fg="red")
+            return
+
+        print("Connected to the Internet")
+
+    if parsed_args.measure_failover:
+        print("Measuring failover, the WiFi uplink is disabled for a moment")
+        try:
+            results = manager.measure_failover()
+        except Exception as err:
+            click.secho(f"Failure: {err}", fg="red")
+            return
+
+        print(
+            f"Failover: WiFi reported offline after {results['failover_detection']:.1f} s, "
+            f"internet unreachable for {results['failover_outage']:.1f} s"
+        )
+        print(
+            f"Failback: WiFi reported online after {results['failback_detection']:.1f} s, "
+            f"internet unreachable for {results['failback_outage']:.1f} s"
+        )
+
+    if parsed_args.tune_mtu is not None:
+        print("Tuning MTU of the uplinks")
+        try:
+            results = manager.tune_mtu(
+                parsed_args.tune_mtu or None, force=parsed_args.force_mtu_probe
+            )
+        except Exception as err:
+            click.secho(f"Failure: {err}", fg="red")
+            return
+
+        print(f"\n{'Uplink':<10} {'Network':<32} {'MTU':>5} {'MSS':>5} {'Tunnel MTU':>10}")
+        for result in results:
+            network = result["network"] + (" (cached)" if result["cached"] else "")
+            print(
+                f"{result['uplink']:<10} {network:<32} {result['mtu']:>5} {result['mss']:>5} "
+                f"{result['tunnel_mtu']:>10}"
+            )
+
+    if parsed_args.measure_qos:
+        host, _, port = parsed_args.measure_qos.rpartition(":")
+        if not host or not port.isdigit():
+            click.secho("QoS load target must be in HOST:PORT format", fg="red")
+            return
+
+        print("Measuring control traffic RTT while the uplink is saturated")
+        try:
+            results = manager.measure_qos((host, int(port)), _qos_profile(parsed_args))
+        except Exception as err:
+            click.secho(f"Failure: {err}", fg="red")
+            return
+
+        print(f"\n{'Load':<12} {'Median [ms]':>11} {'P95 [ms]':>9} {'Lost':>5} {'Mbit/s':>7}")
+        for name, result in results.items():
+            values = [
+                result["rtt_median"] * 1000 if result["rtt_median"] is not None else None,
+                result["rtt_p95"] * 1000 if result["rtt_p95"] is not None else None,
+                result["upload_bps"] / 1e6 if "upload_bps" in result else None,
+            ]
+            columns = [
+                f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+                for value, width in zip(values, [11, 9, 7])
+            ]
+            print(
+                f"{name.replace('_', ' '):<12} {columns[0]} {columns[1]} {result['lost']:>5} "
+                f"{columns[2]}"
+            )
 
-            dots = "." * int(time_diff % 3 + 1)
-            print(f"\r{' ' * 4}\r{dots}", end="", flush=True)
+    if parsed_args.rank_wifi_networks:
+        print("Ranking WiFi networks, each of them is enabled alone while it is measured")
+        try:
+            results = manager.rank_wifi_networks(
+                parsed_args.rank_wifi_networks, history=UplinkHistory(), dry_run=parsed_args.dry_run
+            )
+        except Exception as err:
+            click.secho(f"Failure: {err}", fg="red")
+            return
 
-        print("\nConnected to the Internet")
+        print(f"\n{'SSID':<32} {'Assoc. [s]':>10} {'DHCP [s]':>9} {'RTT [ms]':>9} {'Mbit/s':>8}")
+        for result in results:
+            values = [
+                result["association_time"],
+                result["dhcp_time"],
+                result["rtt"] * 1000 if result["rtt"] is not None else None,
+                result["throughput"] / 1e6 if result["throughput"] is not None else None,
+            ]
+            columns = [
+                f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+                for value, width in zip(values, [10, 9, 9, 8])
+            ]
+            print(f"{result['ssid']:<32} " + " ".join(columns))
 
     if parsed_args.add_static_lease:
         ip = input("Enter the IP address: ")
@@ -577,6 +3167,207 @@ def main(args=None):
         except Exception as err:
             click.secho(f"Failure: {err}", fg="red")
 
+    if parsed_args.import_static_leases:
+        print("Importing static leases")
+        try:
+            manager.import_static_leases(
+                load_records(parsed_args.import_static_leases),
+                sync=parsed_args.sync_static_leases,
+                dry_run=parsed_args.dry_run,
+            )
+        except Exception as err:
+            click.secho(f"Failure: {err}", fg="red")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="RUTX11 Manager")
+    parser.add_argument(
+        "-i", "--device-ip", type=str, default="10.15.20.1", help="Device IP address"
+    )
+    parser.add_argument("-c", "--wifi-connect", action="store_true", help="Connect to WiFi")
+    parser.add_argument("-d", "--wifi-disconnect", action="store_true", help="Disconnect from WiFi")
+    parser.add_argument("-s", "--add-static-lease", action="store_true", help="Add static lease")
+    parser.add_argument(
+        "--rank-wifi-networks",
+        type=str,
+        metavar="THROUGHPUT_URL",
+        help="Measure every configured WiFi network, downloading from THROUGHPUT_URL, and order "
+        "them from the best uplink",
+    )
+    parser.add_argument(
+        "--import-static-leases",
+        type=str,
+        metavar="FILE",
+        help="Import static leases from a CSV, JSON or YAML file",
+    )
+    parser.add_argument(
+        "--sync-static-leases",
+        action="store_true",
+        help="Used with --import-static-leases, delete static leases missing in the file",
+    )
+    parser.add_argument("--restore-default", action="store_true", help="Restore default settings")
+    parser.add_argument(
+        "--nmea-sentences",
+        type=str,
+        default=",".join(DEFAULT_NMEA_SENTENCES),
+        help="Comma separated NMEA sentences forwarded by the router after restoring defaults",
+    )
+    parser.add_argument(
+        "--nmea-interval",
+        type=int,
+        default=1,
+        help="Interval of NMEA sentences forwarding in seconds",
+    )
+    parser.add_argument(
+        "--failover-track-ips",
+        type=str,
+        default="1.1.1.1,8.8.8.8",
+        help="Comma separated hosts pinged to check health of uplinks after restoring defaults",
+    )
+    parser.add_argument(
+        "--failover-interval",
+        type=int,
+        default=1,
+        help="Interval of uplink health checks in seconds",
+    )
+    parser.add_argument(
+        "--failover-down",
+        type=int,
+        default=3,
+        help="Failed health checks after which an uplink is considered down",
+    )
+    parser.add_argument(
+        "--failover-up",
+        type=int,
+        default=10,
+        help="Successful health checks after which a recovered uplink is used again",
+    )
+    parser.add_argument(
+        "--qos-bandwidth",
+        type=str,
+        help="Comma separated INTERFACE=DOWNLOAD/UPLOAD rates in kbit/s the uplinks are shaped to "
+        "after restoring default settings, QoS of uplinks not listed is disabled",
+    )
+    parser.add_argument(
+        "--measure-qos",
+        type=str,
+        metavar="HOST:PORT",
+        help="Saturate the uplink with uploads to HOST:PORT and report control traffic RTT "
+        "with and without QoS",
+    )
+    parser.add_argument(
+        "--measure-failover",
+        action="store_true",
+        help="Disable the WiFi uplink for a moment and report failover and failback latency",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Save a snapshot of the router configuration, the program will ask for robot "
+        "model and serial number",
+    )
+    parser.add_argument(
+        "--set-golden",
+        action="store_true",
+        help="Used with --snapshot, make the snapshot the golden one of the robot model",
+    )
+    parser.add_argument(
+        "--check-drift",
+        action="store_true",
+        help="Compare the configuration with the golden snapshot of the robot model and "
+        "restore default settings of the sections that differ",
+    )
+    parser.add_argument(
+        "--tune-mtu",
+        nargs="*",
+        metavar="UPLINK",
+        help="Probe the path MTU over the uplinks (the active one if none is given) and set "
+        "their MTU and MSS clamping accordingly",
+    )
+    parser.add_argument(
+        "--force-mtu-probe",
+        action="store_true",
+        help="Probe the path MTU even on networks with a cached result",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print changes required to restore default settings without applying them, "
+        "measure WiFi networks without reordering them, or report drift without restoring it",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent requests when restoring default settings",
+    )
+    parser.add_argument(
+        "--internet-check-target",
+        type=str,
+        default="8.8.8.8:53",
+        help="HOST:PORT reached over TCP to check the internet connection, a DNS server "
+        "queried over UDP to probe the path MTU",
+    )
+    parser.add_argument(
+        "--no-token-cache",
+        action="store_true",
+        help="Always log in instead of reusing a token cached by a previous run",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="FILE",
+        help="Save timing of every request to the router as JSON lines",
+    )
+    parser.add_argument(
+        "--trace-summary",
+        action="store_true",
+        help="Print timing of requests to the router grouped by configuration step",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=10.0, help="Timeout of a single request in seconds"
+    )
+    parser.add_argument(
+        "--ready-timeout",
+        type=float,
+        default=90.0,
+        help="Time in seconds the router is given to come back after a reboot",
+    )
+    parsed_args = parser.parse_args(args)
+
+    host, _, port = parsed_args.internet_check_target.rpartition(":")
+    if not host or not port.isdigit():
+        click.secho("Internet check target must be in HOST:PORT format", fg="red")
+        return
+
+    trace = RequestTrace() if parsed_args.trace or parsed_args.trace_summary else None
+
+    try:
+        username = input("Enter the username: ")
+        password = getpass.getpass("Enter the password: ")
+        manager = RUTX11Manager(
+            username=username,
+            password=password,
+            device_ip=parsed_args.device_ip,
+            pool_size=parsed_args.concurrency,
+            timeout=parsed_args.timeout,
+            internet_check_target=(host, int(port)),
+            token_cache=False if parsed_args.no_token_cache else None,
+            trace=trace,
+            channel_plans=ChannelPlanStore(),
+        )
+    except Exception as err:
+        click.secho(f"Failed to create RUTX11Manager: {err}", fg="red")
+        return
+
+    try:
+        _run_commands(manager, parsed_args)
+    finally:
+        if parsed_args.trace:
+            trace.save(parsed_args.trace)
+        if parsed_args.trace_summary:
+            trace.print_summary()
+
 
 if __name__ == "__main__":
     main()
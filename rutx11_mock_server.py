@@ -0,0 +1,626 @@
+#!/usr/bin/env python3
+
+import argparse
+import copy
+import json
+import os
+import random
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rutx11_manager import RUTX11HTTPCommands
+
+
+def _default_failover(id: str) -> dict:
+    return {
+        "id": id,
+        "enabled": "1",
+        "metric": "1",
+        "track_ip": ["1.1.1.1", "8.8.8.8"],
+        "reliability": "1",
+        "interval": "10",
+        "failure_interval": "5",
+        "recovery_interval": "5",
+        "timeout": "2",
+        "down": "5",
+        "up": "5",
+    }
+
+
+def _default_qos(id: str) -> dict:
+    return {"id": id, "enabled": "0", "download": "1024000", "upload": "1024000"}
+
+
+def default_state() -> dict:
+    # Configuration of a router straight after a firmware factory reset. Collections are lists of
+    # objects with an "id", their items are also served at "<collection>/<id>".
+    return {
+        "/api/dhcp/servers/ipv4/config": [
+            {"id": "lan", "interface": "lan", "leasetime": "1h", "start": "100", "limit": "150"}
+        ],
+        RUTX11HTTPCommands.DHCP_STATIC_LEASES: [],
+        RUTX11HTTPCommands.INTERFACES: [
+            {
+                "id": "lan",
+                "area_type": "lan",
+                "proto": "static",
+                "ipaddr": "192.168.1.1",
+                "netmask": "255.255.255.0",
+                "ifname": ["eth0"],
+            },
+            {"id": "wan", "area_type": "wan", "proto": "dhcp", "enabled": "1", "ifname": ["eth1"]},
+            {"id": "wan6", "area_type": "wan", "proto": "dhcpv6", "enabled": "1", "ifname": []},
+            {"id": "mob1s1a1", "area_type": "wan", "proto": "wwan", "metric": "3"},
+            {"id": "mob1s2a1", "area_type": "wan", "proto": "wwan", "metric": "4"},
+        ],
+        RUTX11HTTPCommands.WIRELESS_DEVICES: [
+            {"id": "radio0", "channel": "1", "band": "2g"},
+            {"id": "radio1", "channel": "36", "band": "5g"},
+        ],
+        RUTX11HTTPCommands.WIRELESS_DEVICES_GLOBAL: {"country": "US"},
+        RUTX11HTTPCommands.WIRELESS_INTERFACES: [
+            {
+                "id": "default_radio0",
+                "device": ["radio0"],
+                "mode": "ap",
+                "network": "lan",
+                "ssid": "RUTX11_0000",
+                "key": "",
+            },
+            {
+                "id": "default_radio1",
+                "device": ["radio1"],
+                "mode": "ap",
+                "network": "lan",
+                "ssid": "RUTX11_0000_5G",
+                "key": "",
+            },
+        ],
+        RUTX11HTTPCommands.WIRELESS_MULTI_AP: [],
+        # Networks seen by the radios, other routers of a fleet can be added by tests
+        RUTX11HTTPCommands.WIRELESS_SCAN_STATUS: [
+            {"ssid": "Warehouse", "bssid": "02:00:00:00:01:01", "channel": "6", "signal": -67},
+            {"ssid": "Office_5G", "bssid": "02:00:00:00:01:02", "channel": "44", "signal": -78},
+        ],
+        RUTX11HTTPCommands.GPS_GLOBAL: {
+            "enabled": "0",
+            "galileo_sup": "0",
+            "glonass_sup": "0",
+            "beidou_sup": "0",
+        },
+        "/api/gps/nmea/config": [
+            {
+                "id": "nmea_forwarding",
+                "enabled": "0",
+                "port": "8500",
+                "proto": "tcp",
+                "hostname": "",
+            }
+        ],
+        RUTX11HTTPCommands.GPS_NMEA_RULES: [
+            {"id": id, "forwarding_enabled": "0", "forwarding_interval": "5"}
+            for id in [
+                "GPGSV",
+                "GPGGA",
+                "GPVTG",
+                "GPRMC",
+                "GPGSA",
+                "GLGSV",
+                "GNGSA",
+                "GNGNS",
+                "GAGSV",
+                "PQGSV",
+                "PQGSA",
+            ]
+        ],
+        "/api/date_time/ntp/client/config": [
+            {
+                "id": "ntpclient",
+                "enabled": "0",
+                "zoneName": "UTC",
+                "interval": "3600",
+                "sync_enabled": "0",
+            }
+        ],
+        RUTX11HTTPCommands.FAILOVER_INTERFACES: [
+            _default_failover(id) for id in ["wan", "mob1s1a1", "mob1s2a1"]
+        ],
+        RUTX11HTTPCommands.QOS_INTERFACES: [
+            _default_qos(id) for id in ["wan", "mob1s1a1", "mob1s2a1"]
+        ],
+        RUTX11HTTPCommands.QOS_CLASSES: [],
+        RUTX11HTTPCommands.QOS_RULES: [],
+        "/api/firewall/zones/config": [
+            {"id": "1", "name": "lan", "network": ["lan"]},
+            {"id": "3", "name": "wan", "network": ["wan", "wan6", "mob1s1a1"]},
+        ],
+    }
+
+
+class MockRUTX11Stats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.writes = 0
+            self.connections = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def add(self, **values: int) -> None:
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "writes": self.writes,
+                "handshakes": self.connections,
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+            }
+
+
+class MockRUTX11State:
+    def __init__(self, state: dict | None = None) -> None:
+        self._lock = threading.Lock()
+        self._config = state if state is not None else default_state()
+        self._start_time = time.monotonic()
+
+    def get(self, path: str):
+        with self._lock:
+            if path == RUTX11HTTPCommands.WIRELESS_INTERFACES_STATUS:
+                return self._wireless_status()
+            if path.startswith(RUTX11HTTPCommands.INTERFACES_STATUS + "/"):
+                return self._interface_status(path.rsplit("/", 1)[1])
+            if path == RUTX11HTTPCommands.MODEMS_STATUS:
+                return self._modems_status()
+            if path == RUTX11HTTPCommands.GPS_POSITION_STATUS:
+                return self._gps_status()
+            if path == RUTX11HTTPCommands.FAILOVER_INTERFACES_STATUS:
+                return self._failover_status()
+            if path == RUTX11HTTPCommands.INTERFACES_STATUS:
+                return [
+                    self._interface_status(iface["id"])
+                    for iface in self._config[RUTX11HTTPCommands.INTERFACES]
+                ]
+
+            container, item = self._resolve(path)
+            return copy.deepcopy(item if item is not None else self._config[container])
+
+    def put(self, path: str, data):
+        with self._lock:
+            container, item = self._resolve(path)
+            if item is not None:
+                item.update(data)
+                return copy.deepcopy(item)
+
+            value = self._config[container]
+            if isinstance(value, dict):
+                value.update(data)
+                return copy.deepcopy(value)
+
+            items = {item["id"]: item for item in value}
+            for update in data:
+                if update.get("id") not in items:
+                    raise KeyError(update.get("id"))
+                items[update["id"]].update(update)
+            return copy.deepcopy(data)
+
+    def post(self, path: str, data):
+        with self._lock:
+            container, item = self._resolve(path)
+            if item is not None or not isinstance(self._config[container], list):
+                raise KeyError(path)
+
+            created = []
+            for new_item in data if isinstance(data, list) else [data]:
+                new_item = dict(new_item)
+                if container != RUTX11HTTPCommands.INTERFACES or "id" not in new_item:
+                    new_item["id"] = "cfg" + uuid.uuid4().hex[:6]
+                self._config[container].append(new_item)
+                created.append(copy.deepcopy(new_item))
+
+                # Like on the real router, a WAN interface gets failover and QoS entries
+                if (
+                    container == RUTX11HTTPCommands.INTERFACES
+                    and new_item.get("area_type") == "wan"
+                ):
+                    failover = self._config[RUTX11HTTPCommands.FAILOVER_INTERFACES]
+                    failover.append(_default_failover(new_item["id"]))
+                    qos = self._config[RUTX11HTTPCommands.QOS_INTERFACES]
+                    qos.append(_default_qos(new_item["id"]))
+
+            return created if isinstance(data, list) else created[0]
+
+    def delete(self, path: str, data):
+        with self._lock:
+            container, item = self._resolve(path)
+            ids = [item["id"]] if item is not None else list(data or [])
+
+            for id in ids:
+                deleted = [entry for entry in self._config[container] if entry["id"] == id]
+                if not deleted:
+                    raise KeyError(id)
+                self._config[container].remove(deleted[0])
+
+                # Like on the real router, removing the Multi AP interface removes wwan as well
+                if deleted[0].get("mode") == "multi_ap":
+                    for collection in [
+                        RUTX11HTTPCommands.INTERFACES,
+                        RUTX11HTTPCommands.FAILOVER_INTERFACES,
+                        RUTX11HTTPCommands.QOS_INTERFACES,
+                    ]:
+                        self._config[collection] = [
+                            entry
+                            for entry in self._config[collection]
+                            if entry["id"] != deleted[0].get("network")
+                        ]
+
+            return ids
+
+    def _resolve(self, path: str) -> tuple[str, dict | None]:
+        if path in self._config:
+            return path, None
+
+        container, _, id = path.rpartition("/")
+        if isinstance(self._config.get(container), list):
+            for item in self._config[container]:
+                if item["id"] == id:
+                    return container, item
+
+        raise KeyError(path)
+
+    def _wireless_status(self) -> list:
+        status = []
+        multi_ap_networks = self._config[RUTX11HTTPCommands.WIRELESS_MULTI_AP]
+        devices = {
+            device["id"]: device for device in self._config[RUTX11HTTPCommands.WIRELESS_DEVICES]
+        }
+        for iface in self._config[RUTX11HTTPCommands.WIRELESS_INTERFACES]:
+            entry = {"id": iface["id"], "mode": iface.get("mode"), "ssid": iface.get("ssid")}
+            # Like many routers next to each other, the mock picks the same channel for "auto"
+            device = devices[iface["device"][0]]
+            entry["device"] = device["id"]
+            entry["channel"] = (
+                device["channel"]
+                if device["channel"] != "auto"
+                else ("1" if device["band"] == "2g" else "36")
+            )
+            if iface.get("mode") == "multi_ap":
+                enabled = [network for network in multi_ap_networks if network["enabled"] == "1"]
+                entry["ssid"] = enabled[0]["ssid"] if enabled else None
+                entry["up"] = bool(enabled)
+                entry["signal"] = -58 if enabled else None
+            else:
+                entry["up"] = True
+            status.append(entry)
+        return status
+
+    def _interface_status(self, id: str) -> dict:
+        for iface in self._config[RUTX11HTTPCommands.INTERFACES]:
+            if iface["id"] == id:
+                up = iface.get("enabled", "1") == "1"
+                # Counters grow by 1 Mbit/s down and 256 kbit/s up while the interface is up
+                uptime = time.monotonic() - self._start_time if up else 0.0
+                return {
+                    "id": id,
+                    "up": up,
+                    "ipaddr": "192.168.0.100" if up else "",
+                    "rx_bytes": int(uptime * 125000),
+                    "tx_bytes": int(uptime * 32000),
+                }
+        raise KeyError(id)
+
+    def _failover_status(self) -> list:
+        # Uplinks are online as soon as they are enabled, health checks are not simulated
+        interfaces = {iface["id"]: iface for iface in self._config[RUTX11HTTPCommands.INTERFACES]}
+        status = []
+        for entry in self._config[RUTX11HTTPCommands.FAILOVER_INTERFACES]:
+            iface = interfaces.get(entry["id"], {})
+            online = entry["enabled"] == "1" and iface.get("enabled", "1") == "1"
+            status.append({"id": entry["id"], "status": "online" if online else "offline"})
+        return status
+
+    def uplink_mtu(self) -> int:
+        # MTU configured on the uplink failover currently uses, the default one if none is set
+        with self._lock:
+            online = {
+                entry["id"] for entry in self._failover_status() if entry["status"] == "online"
+            }
+            entries = sorted(
+                self._config[RUTX11HTTPCommands.FAILOVER_INTERFACES],
+                key=lambda entry: int(entry["metric"]),
+            )
+            interfaces = {
+                iface["id"]: iface for iface in self._config[RUTX11HTTPCommands.INTERFACES]
+            }
+            for entry in entries:
+                if entry["id"] in online:
+                    return int(interfaces.get(entry["id"], {}).get("mtu") or 1500)
+            return 1500
+
+    def _modems_status(self) -> list:
+        return [
+            {
+                "id": "1-1",
+                "operator": "Mock",
+                "conntype": "LTE",
+                "band": "LTE B20",
+                "rssi": -71,
+                "rsrp": -98,
+                "rsrq": -9,
+                "sinr": 12,
+            }
+        ]
+
+    def _gps_status(self) -> dict:
+        enabled = self._config[RUTX11HTTPCommands.GPS_GLOBAL]["enabled"] == "1"
+        return {
+            "fix_status": "3" if enabled else "0",
+            "satellites": 11 if enabled else 0,
+            "accuracy": 1.4 if enabled else None,
+            "latitude": 51.1 if enabled else None,
+            "longitude": 17.0 if enabled else None,
+        }
+
+
+class _CountingFile:
+    def __init__(self, file, stats: MockRUTX11Stats, counter: str) -> None:
+        self._file = file
+        self._stats = stats
+        self._counter = counter
+
+    def read(self, *args):
+        data = self._file.read(*args)
+        self._stats.add(**{self._counter: len(data)})
+        return data
+
+    def readline(self, *args):
+        data = self._file.readline(*args)
+        self._stats.add(**{self._counter: len(data)})
+        return data
+
+    def write(self, data):
+        self._stats.add(**{self._counter: len(data)})
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class MockRUTX11Handler(BaseHTTPRequestHandler):
+    # Keep-alive is required to measure connection reuse of the client
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle's algorithm would delay the body
+    disable_nagle_algorithm = True
+    server: "MockRUTX11Server"
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.stats.add(connections=1)
+        self.rfile = _CountingFile(self.rfile, self.server.stats, "bytes_received")
+        self.wfile = _CountingFile(self.wfile, self.server.stats, "bytes_sent")
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_PUT(self) -> None:
+        self._handle("PUT")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_DELETE(self) -> None:
+        self._handle("DELETE")
+
+    def _handle(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+
+        # Endpoints for the benchmark harness, they are not counted as router requests
+        if self.path == "/mock/stats":
+            return self._reply(200, self.server.stats.to_dict())
+        if self.path == "/mock/reset":
+            self.server.stats.reset()
+            return self._reply(200, {})
+        if self.path.startswith("/mock/download"):
+            # Payload for throughput probes, its size is given as ?bytes=N
+            size = int(self.path.partition("bytes=")[2] or 1000000)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            self.wfile.write(bytes(size))
+            return
+
+        self.server.stats.add(requests=1, writes=int(method != "GET"))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.failure_rate and random.random() < self.server.failure_rate:
+            return self._reply(503, {"success": False, "errors": [{"error": "Injected failure"}]})
+
+        if self.path == RUTX11HTTPCommands.LOGIN:
+            token = uuid.uuid4().hex
+            self.server.tokens.add(token)
+            return self._reply(200, {"success": True, "data": {"token": token, "expires": 299}})
+
+        authorization = self.headers.get("Authorization", "")
+        if authorization.removeprefix("Bearer ") not in self.server.tokens:
+            return self._reply(401, {"success": False, "errors": [{"error": "Unauthorized"}]})
+
+        if self.path == RUTX11HTTPCommands.REBOOT:
+            return self._reply(200, {"success": True, "data": {}})
+
+        try:
+            if method == "GET":
+                data = self.server.state.get(self.path)
+            elif method == "PUT":
+                data = self.server.state.put(self.path, body.get("data"))
+            elif method == "POST":
+                data = self.server.state.post(self.path, body.get("data"))
+            else:
+                data = self.server.state.delete(self.path, body.get("data"))
+        except KeyError as err:
+            return self._reply(404, {"success": False, "errors": [{"error": f"Not found: {err}"}]})
+
+        self._reply(201 if method == "POST" else 200, {"success": True, "data": data})
+
+    def _reply(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class MockRUTX11Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        certfile: str,
+        keyfile: str,
+        state: MockRUTX11State | None = None,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        verbose: bool = False,
+        path_mtu: int = 1500,
+    ) -> None:
+        super().__init__(address, MockRUTX11Handler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+        self.state = state or MockRUTX11State()
+        self.stats = MockRUTX11Stats()
+        self.tokens = set()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.verbose = verbose
+
+        # DNS server on the same UDP port answers path MTU probes. Packets larger than the MTU
+        # of the path or of the uplink are dropped silently, like in a PMTU black hole.
+        self.path_mtu = path_mtu
+        self._dns_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._dns_socket.bind(self.server_address)
+        threading.Thread(target=self._serve_dns, daemon=True).start()
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._dns_socket.close()
+
+    def _serve_dns(self) -> None:
+        while True:
+            try:
+                query, address = self._dns_socket.recvfrom(65535)
+            except OSError:
+                return
+
+            # 20 bytes of IP and 8 bytes of UDP header
+            if len(query) + 28 > min(self.path_mtu, self.state.uplink_mtu()) or len(query) < 17:
+                continue
+            # Header with the response flag set and the question, without any answer
+            question = query[12 : 12 + query[12:].index(0) + 5]
+            response = query[:2] + bytes.fromhex("8180 0001 0000 0000 0000") + question
+            self._dns_socket.sendto(response, address)
+
+
+def generate_certificate(directory: str) -> tuple[str, str]:
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+            "-keyout",
+            keyfile,
+            "-out",
+            certfile,
+        ],
+        capture_output=True,
+        check=True,
+    )
+    return certfile, keyfile
+
+
+def start_server(
+    host: str = "127.0.0.1", port: int = 0, **kwargs
+) -> tuple[MockRUTX11Server, threading.Thread]:
+    directory = tempfile.mkdtemp(prefix="rutx11_mock_")
+    certfile, keyfile = generate_certificate(directory)
+
+    server = MockRUTX11Server((host, port), certfile, keyfile, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Mock RUTX11 REST API server")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8443, help="Port to listen on")
+    parser.add_argument("--cert", type=str, help="Certificate file, generated if not given")
+    parser.add_argument("--key", type=str, help="Private key file, generated if not given")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Delay added to each request in seconds"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="Fraction of requests failing with 503"
+    )
+    parser.add_argument(
+        "--path-mtu", type=int, default=1500, help="MTU of the simulated path to the internet"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every request")
+    parsed_args = parser.parse_args(args)
+
+    if parsed_args.cert and parsed_args.key:
+        certfile, keyfile = parsed_args.cert, parsed_args.key
+    else:
+        certfile, keyfile = generate_certificate(tempfile.mkdtemp(prefix="rutx11_mock_"))
+
+    server = MockRUTX11Server(
+        (parsed_args.host, parsed_args.port),
+        certfile,
+        keyfile,
+        latency=parsed_args.latency,
+        failure_rate=parsed_args.failure_rate,
+        verbose=parsed_args.verbose,
+        path_mtu=parsed_args.path_mtu,
+    )
+    print(f"Mock RUTX11 listening on https://{parsed_args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
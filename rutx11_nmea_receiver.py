@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+import argparse
+import math
+import select
+import socket
+import threading
+
+from array import array
+from collections.abc import Iterator
+
+MAX_DATAGRAM_SIZE = 2048
+
+
+class GNSSFix:
+    # Fields are kept in one array of doubles, NaN marks a value not reported yet
+    TIME = 0
+    LATITUDE = 1
+    LONGITUDE = 2
+    ALTITUDE = 3
+    QUALITY = 4
+    SATELLITES_USED = 5
+    SATELLITES_IN_VIEW = 6
+    HDOP = 7
+    VDOP = 8
+    PDOP = 9
+    SPEED = 10
+    COURSE = 11
+    FIX_TYPE = 12
+    FIELDS = 13
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: array | None = None) -> None:
+        self.values = values if values is not None else array("d", [math.nan] * self.FIELDS)
+
+    def copy(self) -> "GNSSFix":
+        return GNSSFix(array("d", self.values))
+
+    @property
+    def valid(self) -> bool:
+        # Quality 0 in GGA means no fix
+        return not math.isnan(self.values[self.LATITUDE]) and self.values[self.QUALITY] > 0
+
+    def to_dict(self) -> dict:
+        names = [
+            "time",
+            "latitude",
+            "longitude",
+            "altitude",
+            "quality",
+            "satellites_used",
+            "satellites_in_view",
+            "hdop",
+            "vdop",
+            "pdop",
+            "speed",
+            "course",
+            "fix_type",
+        ]
+        return {
+            name: None if math.isnan(value) else value for name, value in zip(names, self.values)
+        }
+
+
+def _checksum_valid(sentence: bytes) -> bool:
+    star = sentence.rfind(b"*")
+    if not sentence.startswith(b"$") or star < 0 or len(sentence) < star + 3:
+        return False
+
+    checksum = 0
+    for byte in sentence[1:star]:
+        checksum ^= byte
+
+    try:
+        return checksum == int(sentence[star + 1 : star + 3], 16)
+    except ValueError:
+        return False
+
+
+def _float(field: bytes) -> float:
+    return float(field) if field else math.nan
+
+
+def _coordinate(value: bytes, hemisphere: bytes) -> float:
+    # NMEA coordinates are ddmm.mmmm (latitude) or dddmm.mmmm (longitude)
+    if not value:
+        return math.nan
+    dot = value.find(b".")
+    degrees_length = (dot if dot >= 0 else len(value)) - 2
+    coordinate = float(value[:degrees_length]) + float(value[degrees_length:]) / 60.0
+    return -coordinate if hemisphere in (b"S", b"W") else coordinate
+
+
+def _time(field: bytes) -> float:
+    # Seconds since midnight UTC
+    if len(field) < 6:
+        return math.nan
+    return int(field[0:2]) * 3600 + int(field[2:4]) * 60 + float(field[4:])
+
+
+class NMEAReceiver:
+    # Sentences updating the position; a new fix is reported after one of them
+    POSITION_SENTENCES = (b"GGA", b"GNS", b"RMC")
+
+    def __init__(
+        self, host: str = "0.0.0.0", port: int = 5000, batch_size: int = 64, timeout: float = 1.0
+    ) -> None:
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.setblocking(False)
+        self._timeout = timeout
+
+        # Datagrams of one batch are read into a single preallocated buffer
+        self._batch_size = batch_size
+        self._buffer = bytearray(batch_size * MAX_DATAGRAM_SIZE)
+        self._memory = memoryview(self._buffer)
+        self._views = [
+            self._memory[index * MAX_DATAGRAM_SIZE : (index + 1) * MAX_DATAGRAM_SIZE]
+            for index in range(batch_size)
+        ]
+        self._lengths = array("I", [0] * batch_size)
+
+        self._fix = GNSSFix()
+        self._latest_fix = GNSSFix()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+        self.received = 0
+        self.invalid = 0
+
+    def close(self) -> None:
+        self.stop()
+        self._socket.close()
+
+    def sentences(self) -> Iterator[bytes]:
+        # Ends after stop(), at the latest when the receive timeout expires
+        while not self._stopped.is_set():
+            for index in range(self._receive_batch()):
+                # Sentences are located in the shared buffer, only each one is copied out
+                start = index * MAX_DATAGRAM_SIZE
+                end = start + self._lengths[index]
+                while start < end:
+                    newline = self._buffer.find(b"\r\n", start, end)
+                    if newline < 0:
+                        newline = end
+                    if newline > start:
+                        sentence = bytes(self._memory[start:newline])
+                        if _checksum_valid(sentence):
+                            self.received += 1
+                            yield sentence
+                        else:
+                            self.invalid += 1
+                    start = newline + 2
+
+    def fixes(self) -> Iterator[GNSSFix]:
+        for sentence in self.sentences():
+            if self._update(sentence):
+                fix = self._fix.copy()
+                with self._lock:
+                    self._latest_fix = fix
+                yield fix
+
+    def latest_fix(self) -> GNSSFix:
+        with self._lock:
+            return self._latest_fix.copy()
+
+    def start(self) -> None:
+        # Keeps latest_fix up to date in a background thread
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        for _ in self.fixes():
+            pass
+
+    def _receive_batch(self) -> int:
+        # Python exposes no recvmmsg(), so after waking up all datagrams already queued are
+        # drained with non-blocking reads and a burst of sentences costs a single wakeup.
+        readable, _, _ = select.select([self._socket], [], [], self._timeout)
+        if not readable or self._stopped.is_set():
+            return 0
+
+        count = 0
+        while count < self._batch_size:
+            try:
+                self._lengths[count] = self._socket.recv_into(self._views[count])
+            except (BlockingIOError, InterruptedError):
+                break
+            count += 1
+
+        return count
+
+    def _update(self, sentence: bytes) -> bool:
+        fields = sentence[1 : sentence.rfind(b"*")].split(b",")
+        kind = fields[0][2:]
+        values = self._fix.values
+
+        try:
+            if kind == b"GGA" and len(fields) >= 10:
+                values[GNSSFix.TIME] = _time(fields[1])
+                values[GNSSFix.LATITUDE] = _coordinate(fields[2], fields[3])
+                values[GNSSFix.LONGITUDE] = _coordinate(fields[4], fields[5])
+                values[GNSSFix.QUALITY] = _float(fields[6])
+                values[GNSSFix.SATELLITES_USED] = _float(fields[7])
+                values[GNSSFix.HDOP] = _float(fields[8])
+                values[GNSSFix.ALTITUDE] = _float(fields[9])
+            elif kind == b"GNS" and len(fields) >= 10:
+                values[GNSSFix.TIME] = _time(fields[1])
+                values[GNSSFix.LATITUDE] = _coordinate(fields[2], fields[3])
+                values[GNSSFix.LONGITUDE] = _coordinate(fields[4], fields[5])
+                values[GNSSFix.QUALITY] = 0.0 if fields[6].strip(b"N") == b"" else 1.0
+                values[GNSSFix.SATELLITES_USED] = _float(fields[7])
+                values[GNSSFix.HDOP] = _float(fields[8])
+                values[GNSSFix.ALTITUDE] = _float(fields[9])
+            elif kind == b"RMC" and len(fields) >= 9:
+                values[GNSSFix.TIME] = _time(fields[1])
+                if fields[2] == b"A":
+                    values[GNSSFix.LATITUDE] = _coordinate(fields[3], fields[4])
+                    values[GNSSFix.LONGITUDE] = _coordinate(fields[5], fields[6])
+                values[GNSSFix.SPEED] = _float(fields[7]) * 0.514444  # knots to m/s
+                values[GNSSFix.COURSE] = _float(fields[8])
+            elif kind == b"VTG" and len(fields) >= 8:
+                values[GNSSFix.COURSE] = _float(fields[1])
+                values[GNSSFix.SPEED] = _float(fields[7]) / 3.6  # km/h to m/s
+            elif kind == b"GSA" and len(fields) >= 18:
+                values[GNSSFix.FIX_TYPE] = _float(fields[2])
+                values[GNSSFix.PDOP] = _float(fields[15])
+                values[GNSSFix.HDOP] = _float(fields[16])
+                values[GNSSFix.VDOP] = _float(fields[17])
+            elif kind == b"GSV" and len(fields) >= 4 and fields[2] == b"1":
+                # Only the first message of a sequence is read, it holds the total in view
+                values[GNSSFix.SATELLITES_IN_VIEW] = _float(fields[3])
+            else:
+                return False
+        except ValueError:
+            self.invalid += 1
+            return False
+
+        return kind in self.POSITION_SENTENCES
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Receiver of NMEA sentences forwarded by RUTX11")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=5000, help="UDP port to listen on")
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="Maximum number of datagrams read at once"
+    )
+    parsed_args = parser.parse_args(args)
+
+    receiver = NMEAReceiver(parsed_args.host, parsed_args.port, parsed_args.batch_size)
+    print(f"Listening for NMEA sentences on udp://{parsed_args.host}:{parsed_args.port}")
+    try:
+        for fix in receiver.fixes():
+            print(fix.to_dict())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+
+import argparse
+import click
+import csv
+import getpass
+import math
+import os
+import re
+import threading
+import time
+
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rutx11_manager import RUTX11HTTPCommands, RUTX11Manager, TokenCache
+
+# Name and help of every metric, NaN marks a value the router did not report
+TELEMETRY_FIELDS = [
+    ("wifi_signal_dbm", "WiFi client signal strength in dBm"),
+    ("lte_rssi_dbm", "LTE RSSI in dBm"),
+    ("lte_rsrp_dbm", "LTE RSRP in dBm"),
+    ("lte_sinr_db", "LTE SINR in dB"),
+    ("lte_band", "LTE band number"),
+    ("wwan_rx_bps", "WiFi client uplink receive rate in bits per second"),
+    ("wwan_tx_bps", "WiFi client uplink transmit rate in bits per second"),
+    ("mob1s1a1_rx_bps", "LTE uplink receive rate in bits per second"),
+    ("mob1s1a1_tx_bps", "LTE uplink transmit rate in bits per second"),
+    ("gnss_fix_status", "GNSS fix status, 0 means no fix"),
+    ("gnss_satellites", "Number of GNSS satellites in use"),
+    ("gnss_accuracy_m", "GNSS horizontal accuracy in meters"),
+    ("poll_latency_s", "Time of reading all status endpoints in seconds"),
+]
+FIELD_NAMES = [name for name, _ in TELEMETRY_FIELDS]
+
+# Interfaces whose byte counters are turned into throughput
+THROUGHPUT_INTERFACES = ["wwan", "mob1s1a1"]
+
+STATUS_COMMANDS = [
+    RUTX11HTTPCommands.WIRELESS_INTERFACES_STATUS,
+    RUTX11HTTPCommands.MODEMS_STATUS,
+    RUTX11HTTPCommands.INTERFACES_STATUS,
+    RUTX11HTTPCommands.GPS_POSITION_STATUS,
+]
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class TelemetryBuffer:
+    # Fixed-size history of samples. Each field is a preallocated array of doubles written in a
+    # circle, so memory use does not grow however long the collector runs.
+    def __init__(self, capacity: int, fields: list[str] = FIELD_NAMES) -> None:
+        if capacity < 1:
+            raise Exception("Telemetry buffer capacity must be at least 1 sample")
+
+        self.capacity = capacity
+        self.fields = fields
+        self._times = array("d", [math.nan] * capacity)
+        self._columns = [array("d", [math.nan] * capacity) for _ in fields]
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, timestamp: float, values: list[float]) -> None:
+        with self._lock:
+            self._times[self._next] = timestamp
+            for column, value in zip(self._columns, values):
+                column[self._next] = value
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def latest(self) -> tuple[float, list[float]] | None:
+        with self._lock:
+            if not self._count:
+                return None
+            index = (self._next - 1) % self.capacity
+            return self._times[index], [column[index] for column in self._columns]
+
+    def rows(self) -> list[tuple]:
+        # Samples from the oldest to the newest, as (timestamp, value, value, ...)
+        with self._lock:
+            start = (self._next - self._count) % self.capacity
+            indices = [(start + offset) % self.capacity for offset in range(self._count)]
+            return [
+                (self._times[index], *[column[index] for column in self._columns])
+                for index in indices
+            ]
+
+    def save_csv(self, path: str) -> None:
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["timestamp"] + self.fields)
+            for row in self.rows():
+                writer.writerow(["" if math.isnan(value) else value for value in row])
+
+    def save_parquet(self, path: str) -> None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception("pyarrow is required to save Parquet files")
+
+        rows = self.rows()
+        names = ["timestamp"] + self.fields
+        table = pyarrow.table({name: [row[i] for row in rows] for i, name in enumerate(names)})
+        pyarrow.parquet.write_table(table, path)
+
+    def save(self, path: str) -> None:
+        if path.endswith(".parquet"):
+            self.save_parquet(path)
+        else:
+            self.save_csv(path)
+
+
+class TelemetryCollector:
+    # Polls status endpoints of the router. The interval is doubled, up to max_interval, while
+    # the readings do not change and drops back to interval when they do. It also never falls
+    # below the time of a poll divided by max_duty_cycle, so a router slowed down by load is
+    # polled less often.
+    CHANGE_THRESHOLD = 0.05
+
+    def __init__(
+        self,
+        manager: RUTX11Manager,
+        device_ip: str,
+        capacity: int = 86400,
+        interval: float = 1.0,
+        max_interval: float = 30.0,
+        max_duty_cycle: float = 0.05,
+    ) -> None:
+        self._manager = manager
+        self.device_ip = device_ip
+        self.buffer = TelemetryBuffer(capacity)
+        self._min_interval = interval
+        self._max_interval = max_interval
+        self._max_duty_cycle = max_duty_cycle
+        self.interval = interval
+
+        self._counters = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.polls = 0
+        self.failed_polls = 0
+
+    def poll(self) -> list[float]:
+        start_time = time.monotonic()
+        wireless, modems, interfaces, gps = self._manager.read_status(STATUS_COMMANDS)
+        latency = time.monotonic() - start_time
+
+        sample = dict.fromkeys(FIELD_NAMES, math.nan)
+        sample["poll_latency_s"] = latency
+
+        for iface in wireless or []:
+            if iface.get("mode") in ["multi_ap", "sta"] and iface.get("up"):
+                sample["wifi_signal_dbm"] = _float(iface.get("signal"))
+
+        if modems:
+            modem = modems[0]
+            sample["lte_rssi_dbm"] = _float(modem.get("rssi"))
+            sample["lte_rsrp_dbm"] = _float(modem.get("rsrp"))
+            sample["lte_sinr_db"] = _float(modem.get("sinr"))
+            band = re.search(r"\d+", str(modem.get("band") or ""))
+            sample["lte_band"] = float(band.group()) if band else math.nan
+
+        for iface in interfaces or []:
+            if iface.get("id") in THROUGHPUT_INTERFACES:
+                rx_bps, tx_bps = self._throughput(iface, start_time)
+                sample[f"{iface['id']}_rx_bps"] = rx_bps
+                sample[f"{iface['id']}_tx_bps"] = tx_bps
+
+        if gps:
+            sample["gnss_fix_status"] = _float(gps.get("fix_status"))
+            sample["gnss_satellites"] = _float(gps.get("satellites"))
+            sample["gnss_accuracy_m"] = _float(gps.get("accuracy"))
+
+        values = [sample[name] for name in FIELD_NAMES]
+        previous = self.buffer.latest()
+        self.buffer.append(time.time(), values)
+        self._adapt_interval(previous[1] if previous else None, values, latency)
+        return values
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def prometheus(self) -> str:
+        lines = []
+        labels = f'{{device="{self.device_ip}"}}'
+        latest = self.buffer.latest()
+        if latest is not None:
+            for (name, help), value in zip(TELEMETRY_FIELDS, latest[1]):
+                if math.isnan(value):
+                    continue
+                lines.append(f"# HELP rutx11_{name} {help}")
+                lines.append(f"# TYPE rutx11_{name} gauge")
+                lines.append(f"rutx11_{name}{labels} {value}")
+
+        lines.append("# HELP rutx11_telemetry_poll_interval_seconds Current polling interval")
+        lines.append("# TYPE rutx11_telemetry_poll_interval_seconds gauge")
+        lines.append(f"rutx11_telemetry_poll_interval_seconds{labels} {self.interval}")
+        lines.append("# HELP rutx11_telemetry_polls_total Polls of the router status")
+        lines.append("# TYPE rutx11_telemetry_polls_total counter")
+        lines.append(f"rutx11_telemetry_polls_total{labels} {self.polls}")
+        lines.append("# HELP rutx11_telemetry_failed_polls_total Failed polls of the router status")
+        lines.append("# TYPE rutx11_telemetry_failed_polls_total counter")
+        lines.append(f"rutx11_telemetry_failed_polls_total{labels} {self.failed_polls}")
+        return "\n".join(lines) + "\n"
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.polls += 1
+            try:
+                self.poll()
+            except Exception as err:
+                self.failed_polls += 1
+                self.interval = min(self.interval * 2, self._max_interval)
+                click.secho(f"Failed to poll router status: {err}", fg="red")
+
+            self._stop.wait(self.interval)
+
+    def _throughput(self, iface: dict, timestamp: float) -> tuple[float, float]:
+        counters = (_float(iface.get("rx_bytes")), _float(iface.get("tx_bytes")))
+        previous = self._counters.get(iface["id"])
+        self._counters[iface["id"]] = (timestamp, counters)
+        if previous is None or timestamp <= previous[0]:
+            return math.nan, math.nan
+
+        elapsed = timestamp - previous[0]
+        rates = [(current - last) * 8 / elapsed for current, last in zip(counters, previous[1])]
+        # Counters start from zero again after the interface restarts
+        return tuple(rate if rate >= 0 else math.nan for rate in rates)
+
+    def _adapt_interval(
+        self, previous: list[float] | None, values: list[float], latency: float
+    ) -> None:
+        changed = previous is None
+        for name, last, value in zip(FIELD_NAMES, previous or [], values):
+            if name == "poll_latency_s" or (math.isnan(last) and math.isnan(value)):
+                continue
+            if math.isnan(last) != math.isnan(value):
+                changed = True
+            elif abs(value - last) > self.CHANGE_THRESHOLD * max(abs(last), 1.0):
+                changed = True
+
+        if changed:
+            self.interval = self._min_interval
+        else:
+            self.interval = min(self.interval * 2, self._max_interval)
+        self.interval = max(self.interval, latency / self._max_duty_cycle)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    server: "PrometheusServer"
+
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.collector.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class PrometheusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], collector: TelemetryCollector) -> None:
+        self.collector = collector
+        super().__init__(address, _MetricsHandler)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="RUTX11 link telemetry collector")
+    parser.add_argument(
+        "-i", "--device-ip", type=str, default="10.15.20.1", help="Device IP address"
+    )
+    parser.add_argument(
+        "-u", "--username", type=str, default="admin", help="Username of the router"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=1.0, help="Shortest polling interval in seconds"
+    )
+    parser.add_argument(
+        "--max-interval",
+        type=float,
+        default=30.0,
+        help="Longest polling interval in seconds, used while readings do not change",
+    )
+    parser.add_argument(
+        "--capacity", type=int, default=86400, help="Number of samples kept in memory"
+    )
+    parser.add_argument(
+        "--prometheus-port",
+        type=int,
+        default=9101,
+        help="Port of the Prometheus metrics endpoint, 0 disables it",
+    )
+    parser.add_argument(
+        "--output", type=str, help="Save samples on exit to a CSV or .parquet file"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=10.0, help="Timeout of a single request in seconds"
+    )
+    parsed_args = parser.parse_args(args)
+
+    if parsed_args.capacity < 1:
+        click.secho("Capacity must be at least 1 sample", fg="red")
+        return 1
+
+    password = os.environ.get("RUTX11_PASSWORD") or getpass.getpass("Enter the password: ")
+
+    try:
+        manager = RUTX11Manager(
+            username=parsed_args.username,
+            password=password,
+            device_ip=parsed_args.device_ip,
+            timeout=parsed_args.timeout,
+            token_cache=TokenCache(),
+        )
+    except Exception as err:
+        click.secho(f"Failed to create RUTX11Manager: {err}", fg="red")
+        return 1
+
+    collector = TelemetryCollector(
+        manager,
+        parsed_args.device_ip,
+        capacity=parsed_args.capacity,
+        interval=parsed_args.interval,
+        max_interval=parsed_args.max_interval,
+    )
+
+    server = None
+    if parsed_args.prometheus_port:
+        server = PrometheusServer(("", parsed_args.prometheus_port), collector)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://0.0.0.0:{parsed_args.prometheus_port}/metrics")
+
+    collector.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.stop()
+        if server is not None:
+            server.shutdown()
+        if parsed_args.output:
+            collector.buffer.save(parsed_args.output)
+            print(f"Saved {len(collector.buffer)} samples to {parsed_args.output}")
+        manager.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,66 @@
+from rutx11_channels import CHANNELS_2G, _covered, channel_metrics, plan_channels
+
+
+def _survey(ssid: str, heard: dict[str, float], radios: dict[str, str] | None = None) -> dict:
+    # Survey of a router with its access point on radio0 (2.4 GHz) and radio1 (5 GHz), hearing
+    # the given SSIDs on both bands
+    return {
+        "radios": radios if radios is not None else {"radio0": "2g", "radio1": "5g"},
+        "widths": {"radio0": 20, "radio1": 20},
+        "ssids": [ssid],
+        "channels": {"radio0": 1, "radio1": 36},
+        "scan": [
+            {"ssid": other, "channel": channel, "signal": signal}
+            for other, signal in heard.items()
+            for channel in [1, 36]
+        ],
+    }
+
+
+def _overlap(first: dict, second: dict) -> bool:
+    width = int(first["htmode"].removeprefix("VHT").removeprefix("HT"))
+    return bool(_covered(int(first["channel"]), width) & _covered(int(second["channel"]), width))
+
+
+def test_neighbouring_routers_get_separate_channels():
+    names = ["a", "b", "c"]
+    surveys = {
+        name: _survey(name, {other: -50.0 for other in names if other != name}) for name in names
+    }
+
+    plan = plan_channels(surveys)
+
+    assert {int(plan[name]["radio0"]["channel"]) for name in names} == set(CHANNELS_2G)
+    # Three routers do not fit on the 80 or 40 MHz blocks without DFS channels
+    assert {plan[name]["radio1"]["htmode"] for name in names} == {"VHT20"}
+    for first in names:
+        for second in names:
+            if first < second:
+                assert not _overlap(plan[first]["radio1"], plan[second]["radio1"])
+
+
+def test_routers_out_of_range_use_the_widest_channels():
+    surveys = {"a": _survey("a", {"b": -90.0}), "b": _survey("b", {"a": -90.0})}
+
+    plan = plan_channels(surveys, threshold=-85.0)
+
+    assert {plan[name]["radio1"]["htmode"] for name in surveys} == {"VHT80"}
+
+
+def test_uplink_radio_is_left_out_of_the_plan():
+    surveys = {"a": _survey("a", {}, radios={"radio0": "2g"}), "b": _survey("b", {})}
+
+    plan = plan_channels(surveys)
+
+    assert set(plan["a"]) == {"radio0"}
+    assert set(plan["b"]) == {"radio0", "radio1"}
+
+
+def test_metrics_count_co_channel_networks():
+    surveys = {"a": _survey("a", {"b": -60.0, "foreign": -70.0}), "b": _survey("b", {})}
+
+    metrics = channel_metrics(surveys)
+
+    assert metrics["a"]["radio0"]["co_channel_fleet"] == 1
+    assert metrics["a"]["radio0"]["co_channel_foreign"] == 1
+    assert metrics["b"]["radio1"]["interference_dbm"] is None
@@ -0,0 +1,66 @@
+import os
+import pytest
+import socket
+
+from rutx11_daemon import INVALID_PARAMS, RUTX11Daemon, RUTX11DaemonServer
+from rutx11_manager import RUTX11HTTPCommands
+
+
+def test_object_params_of_tune_mtu_are_rejected(manager):
+    daemon = RUTX11Daemon(manager)
+
+    response = daemon.handle(
+        {"jsonrpc": "2.0", "id": 1, "method": "tune_mtu", "params": {"cache": {}}}
+    )
+
+    assert response["error"]["code"] == INVALID_PARAMS
+    assert "cache" in response["error"]["message"]
+
+
+def test_get_config_reads_only_configuration_endpoints(manager):
+    daemon = RUTX11Daemon(manager)
+
+    def get_config(command: str) -> dict:
+        return daemon.handle(
+            {"jsonrpc": "2.0", "id": 1, "method": "get_config", "params": {"command": command}}
+        )
+
+    assert "result" in get_config(RUTX11HTTPCommands.GPS_GLOBAL)
+    assert "result" in get_config(f"{RUTX11HTTPCommands.INTERFACES}/wan")
+    for command in [
+        RUTX11HTTPCommands.REBOOT,
+        RUTX11HTTPCommands.LOGIN,
+        f"{RUTX11HTTPCommands.INTERFACES}/../../system/actions/reboot",
+    ]:
+        assert get_config(command)["error"]["code"] == INVALID_PARAMS
+
+
+def test_socket_of_a_running_daemon_is_kept(tmp_path):
+    path = str(tmp_path / "rutx11_manager.sock")
+    server = RUTX11DaemonServer(path, RUTX11Daemon(None))
+    try:
+        with pytest.raises(Exception, match="Another daemon"):
+            RUTX11DaemonServer(path, RUTX11Daemon(None))
+        assert os.path.exists(path)
+    finally:
+        server.server_close()
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / "rutx11_manager.sock")
+    # Socket left by a killed daemon, nothing listens on it
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    server = RUTX11DaemonServer(path, RUTX11Daemon(None))
+    server.server_close()
+
+
+def test_socket_in_a_directory_writable_by_others_is_refused(tmp_path):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    directory.chmod(0o777)
+
+    with pytest.raises(Exception, match="writable only"):
+        RUTX11DaemonServer(str(directory / "rutx11_manager.sock"), RUTX11Daemon(None))
@@ -0,0 +1,569 @@
+import json
+import pytest
+import rutx11_manager
+import time
+
+from rutx11_manager import (
+    ChannelPlanStore,
+    ConfigChange,
+    ConfigSection,
+    FailoverProfile,
+    OperationJournal,
+    QoSProfile,
+    RequestTrace,
+    RUTX11HTTPCommands,
+    RUTX11Manager,
+    PathMTUCache,
+    SnapshotStore,
+    TokenCache,
+    TrafficClass,
+    _coalesce,
+)
+
+
+def test_cached_token_requires_the_same_password(server, tmp_path):
+    port = server.server_address[1]
+    token_cache = TokenCache(str(tmp_path / "tokens.json"))
+
+    def create(password: str) -> RUTX11Manager:
+        return RUTX11Manager(
+            "admin",
+            password,
+            device_ip=f"127.0.0.1:{port}",
+            token_cache=token_cache,
+            journal_dir=False,
+        )
+
+    create("admin").close()
+    server.stats.reset()
+    create("admin").close()
+    # The cached token is used without logging in
+    assert server.stats.to_dict()["requests"] == 0
+
+    # The mock accepts any password, a manager given another one still has to log in
+    create("other").close()
+    assert server.stats.to_dict()["requests"] == 1
+
+
+def _networks(manager) -> list[dict]:
+    return manager.get_config(RUTX11HTTPCommands.WIRELESS_MULTI_AP)
+
+
+def _add_networks(manager, ssids: list[str]) -> list[dict]:
+    for ssid in ssids:
+        manager.add_wifi_network(ssid, f"{ssid}-password")
+    return [dict(network) for network in _networks(manager)]
+
+
+def test_reorder_recreates_networks_with_passwords(manager):
+    networks = _add_networks(manager, ["A", "B", "C"])
+
+    manager._reorder_wifi_networks(networks, ["C", "A", "B"])
+
+    reordered = _networks(manager)
+    assert [network["ssid"] for network in reordered] == ["C", "A", "B"]
+    assert [network["key"] for network in reordered] == [
+        "C-password",
+        "A-password",
+        "B-password",
+    ]
+
+
+def test_reorder_keeps_networks_when_creating_copies_fails(manager, monkeypatch):
+    networks = _add_networks(manager, ["A", "B"])
+    monkeypatch.setattr(manager, "_request_post", lambda command, data: (False, None))
+
+    with pytest.raises(Exception, match="new order"):
+        manager._reorder_wifi_networks(networks, ["B", "A"])
+
+    assert _networks(manager) == networks
+
+
+def test_reorder_removes_copies_when_removing_networks_fails(manager, monkeypatch):
+    networks = _add_networks(manager, ["A", "B"])
+    request_delete = manager._request_delete
+    ids = [network["id"] for network in networks]
+
+    def fail_on_previous(command, data):
+        if data["data"] == ids:
+            return False, None
+        return request_delete(command, data)
+
+    monkeypatch.setattr(manager, "_request_delete", fail_on_previous)
+
+    with pytest.raises(Exception, match="previous order"):
+        manager._reorder_wifi_networks(networks, ["B", "A"])
+
+    assert _networks(manager) == networks
+
+
+def test_reorder_refuses_masked_passwords(server, manager):
+    networks = _add_networks(manager, ["A", "B"])
+    for network in networks:
+        network["key"] = "********"
+
+    with pytest.raises(Exception, match="not readable"):
+        manager._reorder_wifi_networks(networks, ["B", "A"])
+
+    assert [network["ssid"] for network in _networks(manager)] == ["A", "B"]
+
+
+def test_rank_orders_networks_by_throughput(manager, monkeypatch):
+    # The Multi AP interface is created by restoring the defaults
+    manager.factory_reset("PTH", "0001")
+    _add_networks(manager, ["A", "B", "C"])
+    speeds = {"A": 1e6, "B": 5e6, "C": 3e6}
+
+    def throughput(url):
+        enabled = [network for network in _networks(manager) if network["enabled"] == "1"]
+        return speeds[enabled[0]["ssid"]]
+
+    monkeypatch.setattr(manager, "_measure_throughput", throughput)
+
+    results = manager.rank_wifi_networks("https://example.invalid/payload", timeout=5)
+
+    assert [result["ssid"] for result in results] == ["B", "C", "A"]
+    assert [network["ssid"] for network in _networks(manager)] == ["B", "C", "A"]
+    assert all(network["enabled"] == "1" for network in _networks(manager))
+
+
+def test_rank_keeps_measurement_error_when_networks_are_not_restored(manager, monkeypatch):
+    _add_networks(manager, ["A", "B"])
+
+    def fail(*args):
+        monkeypatch.setattr(manager, "_request_put", lambda command, data: (False, None))
+        raise Exception("Measurement interrupted")
+
+    monkeypatch.setattr(manager, "_measure_uplink", fail)
+
+    with pytest.raises(Exception, match="Measurement interrupted"):
+        manager.rank_wifi_networks("https://example.invalid/payload", timeout=5)
+
+
+def test_restore_leaves_uplinks_unshaped_by_default(manager):
+    manager.factory_reset("PTH", "0001")
+
+    interfaces = manager.get_config(RUTX11HTTPCommands.QOS_INTERFACES)
+    assert all(interface["enabled"] == "0" for interface in interfaces)
+
+
+def test_qos_measurement_enables_only_shaped_uplinks(manager, monkeypatch):
+    profile = QoSProfile(bandwidth={"wwan": (1000, 1000)})
+    manager.factory_reset("PTH", "0001", qos_profile=profile)
+    enabled = []
+
+    def measure(*args) -> dict:
+        interfaces = manager.get_config(RUTX11HTTPCommands.QOS_INTERFACES)
+        enabled.append({interface["id"] for interface in interfaces if interface["enabled"] == "1"})
+        return {}
+
+    monkeypatch.setattr(manager, "_measure_control_rtt", measure)
+    monkeypatch.setattr(manager, "_measure_under_load", measure)
+    manager.measure_qos(("127.0.0.1", 9), profile)
+
+    assert enabled == [{"wwan"}, set(), {"wwan"}]
+    with pytest.raises(Exception, match="No uplink is shaped"):
+        manager.measure_qos(("127.0.0.1", 9), QoSProfile())
+
+
+def test_failover_profiles_do_not_share_default_lists():
+    profile = FailoverProfile()
+    profile.interfaces.remove("wwan")
+    profile.track_ips.append("9.9.9.9")
+
+    assert FailoverProfile().interfaces == ["wwan", "mob1s1a1", "mob1s2a1"]
+    assert FailoverProfile().track_ips == ["1.1.1.1", "8.8.8.8"]
+
+
+def test_qos_profiles_do_not_share_default_classes():
+    QoSProfile().classes[0].ports.append("8080")
+
+    assert QoSProfile().classes[0].ports == ["22", "7400-7600"]
+
+
+def test_restore_removes_qos_entries_of_previous_profile(manager):
+    manager.factory_reset("PTH", "0001")
+    manager.set_qos_profile(
+        QoSProfile(
+            classes=[TrafficClass("video", 1, 40, ports=["5004"]), TrafficClass("rest", 2, 20)],
+            bandwidth={"wwan": (1000, 1000)},
+        )
+    )
+
+    manager.factory_reset("PTH", "0001")
+
+    classes = manager.get_config(RUTX11HTTPCommands.QOS_CLASSES)
+    rules = manager.get_config(RUTX11HTTPCommands.QOS_RULES)
+    assert sorted(item["name"] for item in classes) == sorted(
+        config["name"] for config in QoSProfile().classes_config()
+    )
+    assert sorted(item["name"] for item in rules) == sorted(
+        config["name"] for config in QoSProfile().rules_config()
+    )
+    assert manager.factory_reset("PTH", "0001", dry_run=True) == []
+
+
+def test_restore_without_changes_verifies_the_router(server, manager):
+    manager.factory_reset("PTH", "0001")
+    server.stats.reset()
+
+    assert manager.factory_reset("PTH", "0001", dry_run=True) == []
+    # Every endpoint is read again instead of being served from the cache
+    assert server.stats.to_dict()["requests"] > 0
+    assert server.stats.to_dict()["writes"] == 0
+
+
+def test_config_is_read_again_after_invalidating_the_cache(server, manager):
+    manager.get_config(RUTX11HTTPCommands.GPS_GLOBAL)
+    server.stats.reset()
+
+    manager.get_config(RUTX11HTTPCommands.GPS_GLOBAL)
+    assert server.stats.to_dict()["requests"] == 0
+
+    manager.invalidate_cache()
+    manager.get_config(RUTX11HTTPCommands.GPS_GLOBAL)
+    assert server.stats.to_dict()["requests"] == 1
+
+
+def _interface(manager, id: str) -> dict:
+    interfaces = manager.get_config(RUTX11HTTPCommands.INTERFACES)
+    return next(interface for interface in interfaces if interface["id"] == id)
+
+
+def test_failed_mtu_probe_restores_mtu_and_uplinks(manager, monkeypatch):
+    manager.factory_reset("PTH", "0001")
+    manager._request_put(f"{RUTX11HTTPCommands.INTERFACES}/mob1s1a1", {"data": {"mtu": "1400"}})
+
+    def fail(target):
+        raise Exception("No reply from the DNS server")
+
+    monkeypatch.setattr(rutx11_manager, "probe_path_mtu", fail)
+    with pytest.raises(Exception, match="No reply"):
+        manager.tune_mtu(["mob1s1a1"], cache=False, timeout=5.0)
+
+    assert _interface(manager, "mob1s1a1")["mtu"] == "1400"
+    assert _interface(manager, "wwan").get("enabled", "1") == "1"
+
+
+def test_mtu_cache_is_readable_only_by_the_owner(tmp_path):
+    cache = PathMTUCache(str(tmp_path / "path_mtu.json"))
+    cache.set("admin@router", "network", 1400)
+
+    assert (tmp_path / "path_mtu.json").stat().st_mode & 0o777 == 0o600
+    assert cache.get("admin@router", "network") == 1400
+
+
+def _radios(manager) -> dict[str, dict]:
+    devices = manager.get_config(RUTX11HTTPCommands.WIRELESS_DEVICES)
+    return {device["id"]: device for device in devices}
+
+
+def test_restore_keeps_the_applied_channel_plan(manager, tmp_path):
+    manager._channel_plans = ChannelPlanStore(str(tmp_path / "channel_plans.json"))
+    manager.factory_reset("PTH", "0001")
+    # radio1 is connected to a WiFi uplink and left out of the plan
+    manager._request_put(
+        RUTX11HTTPCommands.WIRELESS_DEVICES, {"data": [{"id": "radio1", "channel": "44"}]}
+    )
+    manager.set_wireless_channels({"radio0": {"channel": "6", "htmode": "HT20"}})
+
+    manager.factory_reset("PTH", "0001")
+
+    radios = _radios(manager)
+    assert (radios["radio0"]["channel"], radios["radio0"]["htmode"]) == ("6", "HT20")
+    assert radios["radio1"]["channel"] == "44"
+
+
+def _journal_manager(server, journal_dir) -> RUTX11Manager:
+    port = server.server_address[1]
+    return RUTX11Manager(
+        "admin",
+        "admin",
+        device_ip=f"127.0.0.1:{port}",
+        token_cache=False,
+        journal_dir=str(journal_dir),
+    )
+
+
+def _journal(journal_dir) -> dict:
+    [path] = journal_dir.iterdir()
+    return json.loads(path.read_text())
+
+
+def test_failed_restore_is_resumed_from_the_journal(server, tmp_path, monkeypatch):
+    manager = _journal_manager(server, tmp_path)
+    request_put = manager._request_put
+
+    def fail_gps(command, data):
+        # The mock answers writes to unknown endpoints with an error
+        if command == RUTX11HTTPCommands.GPS_GLOBAL:
+            command += "/missing"
+        return request_put(command, data)
+
+    monkeypatch.setattr(manager, "_request_put", fail_gps)
+    with pytest.raises(Exception, match="GPS"):
+        manager.factory_reset("PTH", "0001")
+
+    journal = _journal(tmp_path)
+    assert journal["gps"]["status"] == OperationJournal.FAILED
+    assert journal["dhcp"]["status"] == OperationJournal.DONE
+    assert journal["dhcp"]["state_hash"]
+    assert manager._journal is None
+
+    monkeypatch.undo()
+    server.stats.reset()
+    manager.factory_reset("PTH", "0001")
+
+    # Only the GPS endpoint is written and verified
+    assert server.stats.to_dict()["writes"] == 1
+    assert server.stats.to_dict()["requests"] == 3
+    assert all(entry["status"] == OperationJournal.DONE for entry in _journal(tmp_path).values())
+
+
+def test_restore_without_changes_reads_each_endpoint_once(server, manager):
+    manager.factory_reset("PTH", "0001")
+    server.stats.reset()
+
+    assert manager.factory_reset("PTH", "0001") == []
+
+    endpoints = {section.endpoint for section in manager._target_config()}
+    assert server.stats.to_dict()["requests"] == len(endpoints)
+    assert server.stats.to_dict()["writes"] == 0
+
+
+def test_restore_reuses_wireless_interfaces_read_for_the_plan(manager, monkeypatch):
+    reads = []
+    request_get = manager._request_get
+
+    def record(command, headers=None):
+        reads.append(command)
+        return request_get(command, headers)
+
+    monkeypatch.setattr(manager, "_request_get", record)
+    manager.factory_reset("PTH", "0001")
+
+    # Read for the plan, again after the Multi AP interface is deleted and back after the writes
+    assert reads.count(RUTX11HTTPCommands.WIRELESS_INTERFACES) == 3
+
+
+def test_restore_after_a_completed_one_checks_every_section(server, tmp_path):
+    manager = _journal_manager(server, tmp_path)
+    manager.factory_reset("PTH", "0001")
+    manager._request_put(RUTX11HTTPCommands.GPS_GLOBAL, {"data": {"enabled": "0"}})
+
+    manager.factory_reset("PTH", "0001")
+
+    assert manager.get_config(RUTX11HTTPCommands.GPS_GLOBAL)["enabled"] == "1"
+
+
+def _golden_manager(manager, tmp_path) -> SnapshotStore:
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    manager.factory_reset("PTH", "0001", nmea_interval=5)
+    _add_networks(manager, ["A", "B"])
+    manager.save_snapshot("PTH", "0001", store, golden=True, nmea_interval=5)
+    return store
+
+
+def test_drift_check_detects_reordered_wifi_networks(manager, tmp_path):
+    store = _golden_manager(manager, tmp_path)
+    networks = _networks(manager)
+
+    manager._reorder_wifi_networks(networks, ["B", "A"])
+
+    drifted = manager.check_drift("PTH", "0001", store, dry_run=True)
+    assert [drift["endpoint"] for drift in drifted] == [RUTX11HTTPCommands.WIRELESS_MULTI_AP]
+
+
+def test_drift_is_restored_with_options_of_the_golden_snapshot(manager, tmp_path):
+    store = _golden_manager(manager, tmp_path)
+    rules = manager.get_config(RUTX11HTTPCommands.GPS_NMEA_RULES)
+    manager._request_put(
+        RUTX11HTTPCommands.GPS_NMEA_RULES,
+        {"data": [{"id": rules[0]["id"], "forwarding_interval": "1"}]},
+    )
+
+    [drift] = manager.check_drift("PTH", "0001", store)
+
+    assert drift["endpoint"] == RUTX11HTTPCommands.GPS_NMEA_RULES
+    assert drift["restored"]
+    assert manager.check_drift("PTH", "0001", store, dry_run=True) == []
+
+
+def test_tuned_mtu_is_not_reported_as_drift(manager, tmp_path, monkeypatch):
+    store = _golden_manager(manager, tmp_path)
+    monkeypatch.setattr(rutx11_manager, "probe_path_mtu", lambda target: 1400)
+
+    [result] = manager.tune_mtu(["wwan"], cache=False, timeout=5.0)
+
+    assert result["mtu"] == 1400
+    assert _interface(manager, "wwan")["mtu"] == "1400"
+    assert manager.check_drift("PTH", "0001", store) == []
+
+
+def test_snapshot_secrets_are_keyed_and_private(manager, tmp_path):
+    store = _golden_manager(manager, tmp_path)
+    other = SnapshotStore(str(tmp_path / "other"))
+
+    command = RUTX11HTTPCommands.WIRELESS_MULTI_AP
+    network = manager.snapshot("0001", [command], store)[command][0]
+    other_network = manager.snapshot("0001", [command], other)[command][0]
+
+    assert network["key"].startswith("hmac-sha256:")
+    assert network["key"] != other_network["key"]
+    files = [path for path in (tmp_path / "snapshots").rglob("*") if path.is_file()]
+    assert files and all(path.stat().st_mode & 0o777 == 0o600 for path in files)
+
+
+def test_rejected_reboot_is_not_waited_for(manager, monkeypatch, capsys):
+    waited = []
+    monkeypatch.setattr(manager, "_request_post", lambda command, data: (False, None))
+    monkeypatch.setattr(manager, "wait_until_ready", lambda timeout: waited.append(timeout))
+    manager.reboot_required = True
+
+    rutx11_manager._reboot(manager, 5.0)
+
+    assert waited == []
+    assert manager.reboot_required
+    assert "Failed to reboot" in capsys.readouterr().out
+
+
+def test_trace_separates_server_time_from_connecting(server):
+    port = server.server_address[1]
+    server.latency = 0.05
+    trace = RequestTrace()
+    manager = RUTX11Manager(
+        "admin",
+        "admin",
+        device_ip=f"127.0.0.1:{port}",
+        token_cache=False,
+        journal_dir=False,
+        trace=trace,
+    )
+    manager.factory_reset("PTH", "0001", concurrency=1)
+    manager._read_data(RUTX11HTTPCommands.GPS_GLOBAL)
+    manager._request_get(RUTX11HTTPCommands.GPS_GLOBAL)
+    manager.close()
+
+    [login, *records] = trace.records
+    assert login["new_connection"]
+    assert login["connect"] + login["tls"] + login["server"] <= login["total"]
+    # The mock may start its delay before the client takes the time of sending
+    assert all(record["server"] >= 0.045 for record in trace.records)
+    assert {record["step"] for record in records} >= {"plan", "dhcp"}
+    # Requests made after a plan are not attributed to its last step
+    assert [record["step"] for record in records[-2:]] == ["plan", ""]
+
+
+def test_failed_failover_measurement_keeps_its_error(manager, monkeypatch):
+    def fail(uplink, online, timeout, probe_interval):
+        raise Exception("Router did not fail over")
+
+    monkeypatch.setattr(manager, "check_internet_connection", lambda: True)
+    monkeypatch.setattr(manager, "_watch_failover", fail)
+    # Disabling succeeds, enabling again fails
+    puts = iter([(True, None), (False, None)])
+    monkeypatch.setattr(manager, "_request_put", lambda command, data: next(puts))
+
+    with pytest.raises(Exception, match="did not fail over"):
+        manager.measure_failover("wwan")
+
+
+def _change(name: str, endpoint: str, depends_on: tuple[str, ...] = ()) -> ConfigChange:
+    section = ConfigSection(name, name, endpoint, {"enabled": "1"}, depends_on=depends_on)
+    return ConfigChange(section, "PUT", endpoint, {"data": section.data})
+
+
+def test_dependency_cycle_is_refused(manager):
+    plan = [
+        _change("first", RUTX11HTTPCommands.GPS_GLOBAL, depends_on=("second",)),
+        _change("second", RUTX11HTTPCommands.INTERFACES_LAN, depends_on=("first",)),
+    ]
+
+    with pytest.raises(Exception, match="cycle"):
+        manager._apply_plan(plan, 2)
+
+
+def _lease_ip(manager, host: int) -> str:
+    lan = manager.get_config(RUTX11HTTPCommands.INTERFACES_LAN)
+    return lan["ipaddr"].rpartition(".")[0] + f".{host}"
+
+
+def test_import_skips_existing_leases_with_invalid_mac(server, manager, capsys):
+    server.state._config[RUTX11HTTPCommands.DHCP_STATIC_LEASES].append(
+        {"id": "cfg0a", "mac": "not-a-mac", "ip": _lease_ip(manager, 200), "name": "manual"}
+    )
+    entries = [{"ip": _lease_ip(manager, 100), "mac": "aa-bb-cc-dd-ee-ff", "name": "robot"}]
+
+    manager.import_static_leases(entries)
+
+    leases = manager.get_config(RUTX11HTTPCommands.DHCP_STATIC_LEASES)
+    assert sorted(lease["name"] for lease in leases) == ["manual", "robot"]
+    assert "Skipping existing lease manual" in capsys.readouterr().out
+
+    manager.import_static_leases(entries, sync=True)
+    leases = manager.get_config(RUTX11HTTPCommands.DHCP_STATIC_LEASES)
+    assert [lease["name"] for lease in leases] == ["robot"]
+
+
+def test_import_updates_existing_leases_without_a_name(server, manager):
+    server.state._config[RUTX11HTTPCommands.DHCP_STATIC_LEASES].append(
+        {"id": "cfg0a", "mac": "AA:BB:CC:DD:EE:FF", "ip": _lease_ip(manager, 100)}
+    )
+    entries = [{"ip": _lease_ip(manager, 100), "mac": "aa-bb-cc-dd-ee-ff", "name": "robot"}]
+
+    manager.import_static_leases(entries)
+
+    leases = manager.get_config(RUTX11HTTPCommands.DHCP_STATIC_LEASES)
+    assert [lease.get("name") for lease in leases] == ["robot"]
+
+
+def test_puts_to_objects_of_one_collection_are_coalesced():
+    plan = [
+        _change("lan", RUTX11HTTPCommands.INTERFACES_LAN),
+        _change("gps", RUTX11HTTPCommands.GPS_GLOBAL),
+        _change("wan", f"{RUTX11HTTPCommands.INTERFACES}/wan"),
+    ]
+
+    coalesced = _coalesce(plan)
+
+    assert len(coalesced) == 2
+    merged = coalesced[0]
+    assert merged.endpoint == RUTX11HTTPCommands.INTERFACES
+    assert merged.data["data"] == [{"id": "lan", "enabled": "1"}, {"id": "wan", "enabled": "1"}]
+    assert merged.item_sections == {"lan": "lan", "wan": "wan"}
+
+
+def test_puts_are_not_coalesced_into_a_dependency_cycle():
+    # wan waits for gps, which waits for lan, so lan and wan can not be sent together
+    plan = [
+        _change("lan", RUTX11HTTPCommands.INTERFACES_LAN),
+        _change("gps", RUTX11HTTPCommands.GPS_GLOBAL, depends_on=("lan",)),
+        _change("wan", f"{RUTX11HTTPCommands.INTERFACES}/wan", depends_on=("gps",)),
+    ]
+
+    assert _coalesce(plan) == plan
+
+
+def test_changes_start_after_their_dependencies(manager, monkeypatch):
+    events = []
+
+    def apply(change):
+        name = change.section.name
+        events.append(("start", name))
+        time.sleep(0.05)
+        events.append(("end", name))
+        return {name: True}
+
+    monkeypatch.setattr(manager, "_apply_change", apply)
+    plan = [
+        _change("first", RUTX11HTTPCommands.GPS_GLOBAL),
+        _change("second", RUTX11HTTPCommands.INTERFACES_LAN, depends_on=("first",)),
+        _change("independent", RUTX11HTTPCommands.DHCP_SERVER_LAN),
+    ]
+
+    results = manager._apply_plan(plan, 4)
+
+    assert results == {"first": True, "second": True, "independent": True}
+    assert events.index(("end", "first")) < events.index(("start", "second"))
+    # Independent changes run concurrently
+    assert events.index(("start", "independent")) < events.index(("end", "first"))
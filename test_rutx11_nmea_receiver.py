@@ -0,0 +1,71 @@
+import socket
+import threading
+import time
+
+from rutx11_nmea_receiver import GNSSFix, NMEAReceiver
+
+
+def _sentence(body: str) -> bytes:
+    checksum = 0
+    for byte in body.encode():
+        checksum ^= byte
+    return f"${body}*{checksum:02X}".encode()
+
+
+GGA = _sentence("GPGGA,123519.00,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,")
+VTG = _sentence("GPVTG,054.7,T,034.4,M,005.5,N,010.2,K")
+
+
+def _receiver(**kwargs) -> tuple[NMEAReceiver, tuple[str, int]]:
+    receiver = NMEAReceiver("127.0.0.1", 0, **kwargs)
+    return receiver, receiver._socket.getsockname()
+
+
+def test_close_without_datagrams_returns():
+    receiver, _ = _receiver(timeout=0.1)
+    receiver.start()
+
+    start_time = time.monotonic()
+    closed = threading.Thread(target=receiver.close)
+    closed.start()
+    closed.join(timeout=2.0)
+
+    assert not closed.is_alive()
+    assert time.monotonic() - start_time < 2.0
+
+
+def test_sentences_of_one_datagram_are_split_and_checked():
+    receiver, address = _receiver(timeout=0.1)
+    # Body changed after the checksum was computed
+    invalid = GGA.replace(b"545.4", b"545.5")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        sender.sendto(GGA + b"\r\n" + invalid + b"\r\n" + VTG + b"\r\n", address)
+        sender.sendto(VTG, address)
+
+    sentences = []
+    for sentence in receiver.sentences():
+        sentences.append(sentence)
+        if len(sentences) == 3:
+            break
+    receiver.close()
+
+    assert sentences == [GGA, VTG, VTG]
+    assert receiver.received == 3
+    assert receiver.invalid == 1
+
+
+def test_fix_is_updated_from_gga():
+    receiver, address = _receiver(timeout=0.1)
+    receiver.start()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        sender.sendto(GGA + b"\r\n", address)
+
+    deadline = time.monotonic() + 2.0
+    while not receiver.latest_fix().valid and time.monotonic() < deadline:
+        time.sleep(0.01)
+    receiver.close()
+
+    fix = receiver.latest_fix().values
+    assert abs(fix[GNSSFix.LATITUDE] - (48 + 7.038 / 60)) < 1e-9
+    assert abs(fix[GNSSFix.LONGITUDE] - (11 + 31.0 / 60)) < 1e-9
+    assert fix[GNSSFix.SATELLITES_USED] == 8
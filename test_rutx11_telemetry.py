@@ -0,0 +1,58 @@
+import math
+import pytest
+import time
+
+from rutx11_telemetry import FIELD_NAMES, TelemetryBuffer, TelemetryCollector
+
+
+class _StatusManager:
+    # Returns the same status of the wireless interface until it is changed
+    def __init__(self, delay: float = 0.0) -> None:
+        self.signal = -60
+        self.delay = delay
+
+    def read_status(self, commands: list[str]) -> list:
+        time.sleep(self.delay)
+        return [[{"mode": "sta", "up": True, "signal": self.signal}], None, None, None]
+
+
+def test_buffer_keeps_the_newest_samples_in_order():
+    buffer = TelemetryBuffer(3, ["value"])
+    for timestamp in range(5):
+        buffer.append(float(timestamp), [timestamp * 10.0])
+
+    assert len(buffer) == 3
+    assert buffer.rows() == [(2.0, 20.0), (3.0, 30.0), (4.0, 40.0)]
+    assert buffer.latest() == (4.0, [40.0])
+
+
+def test_buffer_requires_a_sample():
+    with pytest.raises(Exception, match="at least 1 sample"):
+        TelemetryBuffer(0)
+
+
+def test_interval_doubles_while_readings_do_not_change():
+    manager = _StatusManager()
+    collector = TelemetryCollector(manager, "127.0.0.1", capacity=10, max_interval=4.0)
+
+    intervals = []
+    for _ in range(5):
+        collector.poll()
+        intervals.append(collector.interval)
+    manager.signal = -75
+    collector.poll()
+
+    assert intervals == [1.0, 2.0, 4.0, 4.0, 4.0]
+    assert collector.interval == 1.0
+    wifi_signal = collector.buffer.latest()[1][FIELD_NAMES.index("wifi_signal_dbm")]
+    assert wifi_signal == -75
+
+
+def test_slow_polls_stay_within_the_duty_cycle():
+    collector = TelemetryCollector(_StatusManager(delay=0.02), "127.0.0.1", interval=0.1)
+
+    values = collector.poll()
+
+    latency = values[FIELD_NAMES.index("poll_latency_s")]
+    assert not math.isnan(latency)
+    assert collector.interval >= latency / 0.05 >= 0.4